@@ -1,14 +1,25 @@
-from flask import Flask, jsonify, request
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, request
 from flask_cors import CORS
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash
 from config import Config
-from models import db, Car, Admin, SearchLog
+from models import db, Car, Admin
 from database import init_database
 from search_engine import search_engine
-from utils import normalize_arabic, format_price
-from image_handler import ImageHandler
-import json
+from search_index import search_index
+from similar_cars import similar_cars
+from db_routing import db_routing
+from conditional_get import catalog_validators, car_validators, conditional_get
+from sqlite_tuning import sqlite_tuning
+from fulltext import fulltext
+from search_cache import search_cache
+from search_log_writer import search_log_writer
+from search_analytics import search_analytics
+from stats_counters import stats_counters
+from saved_searches import saved_searches
+from pagination import count_cache, keyset_page
+from projections import get_cars_by_ids, project
+from serializer import car_profile, json_response, serialize_cars, serialize_values
+from utils import parse_id_list
 from datetime import datetime
 import os
 
@@ -21,7 +32,18 @@ def create_api_app():
     CORS(app, origins=['*'])
     
     # تهيئة قاعدة البيانات
+    db_routing.init_app(app)
     db.init_app(app)
+    sqlite_tuning.init_app(app)
+    conditional_get.init_app(app)
+    search_index.init_app(app)
+    similar_cars.init_app(app)
+    fulltext.init_app(app)
+    search_cache.init_app(app)
+    search_log_writer.init_app(app)
+    search_analytics.init_app(app)
+    stats_counters.init_app(app)
+    saved_searches.init_app(app)
     
     # تهيئة قاعدة البيانات عند بدء التطبيق
     with app.app_context():
@@ -43,7 +65,7 @@ app = create_api_app()
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'message': 'Car Store API is running',
         'timestamp': datetime.utcnow().isoformat()
@@ -51,103 +73,78 @@ def health_check():
 
 @app.route('/api/cars')
 def get_cars():
-    """Get all available cars"""
+    """Get all available cars, or specific cars with ?ids=1,2,3 (in the requested order)"""
     try:
+        if 'ids' in request.args:
+            return get_cars_bulk()
+        
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 12))
+        cursor = request.args.get('cursor')
         
-        cars = Car.query.filter(Car.is_available == True)\
-                       .order_by(Car.created_at.desc())\
-                       .paginate(page=page, per_page=per_page, error_out=False)
+        query = project(Car.query, 'detail').filter(Car.is_available == True)
+        if cursor is not None:
+            # التصفح بالمؤشر: ثابت الزمن مهما كان عمق الصفحة
+            items, next_cursor = keyset_page(query, Car.created_at, Car.id, 'desc', 'newest',
+                                             cursor, max(per_page, 1))
+            pagination_data = {
+                'total': count_cache.get('cars:available', query),
+                'per_page': max(per_page, 1),
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
+            }
+        else:
+            cars = query.order_by(Car.created_at.desc())\
+                        .paginate(page=page, per_page=per_page, error_out=False)
+            items = cars.items
+            pagination_data = {
+                'total': cars.total,
+                'page': page,
+                'pages': cars.pages,
+                'has_prev': cars.has_prev,
+                'has_next': cars.has_next
+            }
         
-        return jsonify({
-            'cars': [{
-                'id': car.id,
-                'name': car.name,
-                'brand': car.brand,
-                'model': car.model,
-                'year': car.year,
-                'price': car.price,
-                'performance_level': car.performance_level,
-                'fuel_type': car.fuel_type,
-                'transmission': car.transmission,
-                'engine_size': car.engine_size,
-                'doors': car.doors,
-                'car_type': car.car_type,
-                'color': car.color,
-                'mileage': car.mileage,
-                'country_origin': car.country_origin,
-                'description': car.description,
-                'image_url': car.image_url,
-                'leather_seats': car.leather_seats,
-                'sunroof': car.sunroof,
-                'gps_system': car.gps_system,
-                'backup_camera': car.backup_camera,
-                'entertainment_system': car.entertainment_system,
-                'safety_features': car.safety_features,
-                'created_at': car.created_at.isoformat() if car.created_at else None
-            } for car in cars.items],
-            'total': cars.total,
-            'page': page,
-            'pages': cars.pages,
-            'has_prev': cars.has_prev,
-            'has_next': cars.has_next
+        return json_response({
+            'cars': serialize_cars(items, 'detail'),
+            **pagination_data
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
+
+def get_cars_bulk():
+    """Cars by id with one query (compare list); unknown ids are returned in 'missing'"""
+    car_ids, invalid = parse_id_list(request.args.getlist('ids'))
+    if invalid:
+        return json_response({'error': f"Invalid car ids: {', '.join(invalid)}"}, 400)
+    max_ids = app.config.get('MAX_BULK_CAR_IDS', 50)
+    if len(car_ids) > max_ids:
+        return json_response({'error': f'At most {max_ids} ids per request'}, 400)
+    
+    cars = get_cars_by_ids(car_ids, 'detail')
+    found = {car.id for car in cars}
+    return json_response({
+        'cars': serialize_cars(cars, 'detail'),
+        'total': len(cars),
+        'missing': [car_id for car_id in car_ids if car_id not in found]
+    })
 
 @app.route('/api/cars/<int:car_id>')
+@conditional_get.conditional(car_validators)
 def get_car(car_id):
     """Get specific car details"""
     try:
-        car = Car.query.get_or_404(car_id)
+        car = project(Car.query, 'detail').get_or_404(car_id)
         
-        # Get similar cars
-        similar_cars = Car.query.filter(
-            Car.id != car_id,
-            Car.is_available == True,
-            Car.brand == car.brand
-        ).limit(3).all()
+        # Get similar cars (nearest neighbours from the precomputed table)
+        similar = search_engine.get_similar_cars(car_id, limit=3)
         
-        return jsonify({
-            'car': {
-                'id': car.id,
-                'name': car.name,
-                'brand': car.brand,
-                'model': car.model,
-                'year': car.year,
-                'price': car.price,
-                'performance_level': car.performance_level,
-                'fuel_type': car.fuel_type,
-                'transmission': car.transmission,
-                'engine_size': car.engine_size,
-                'doors': car.doors,
-                'car_type': car.car_type,
-                'color': car.color,
-                'mileage': car.mileage,
-                'country_origin': car.country_origin,
-                'description': car.description,
-                'image_url': car.image_url,
-                'leather_seats': car.leather_seats,
-                'sunroof': car.sunroof,
-                'gps_system': car.gps_system,
-                'backup_camera': car.backup_camera,
-                'entertainment_system': car.entertainment_system,
-                'safety_features': car.safety_features,
-                'created_at': car.created_at.isoformat() if car.created_at else None
-            },
-            'similar_cars': [{
-                'id': similar.id,
-                'name': similar.name,
-                'brand': similar.brand,
-                'model': similar.model,
-                'year': similar.year,
-                'price': similar.price,
-                'image_url': similar.image_url
-            } for similar in similar_cars]
+        return json_response({
+            'car': car_profile('detail').row(car),
+            'similar_cars': serialize_values(similar, 'similar')
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route('/api/search')
 def search_cars():
@@ -182,34 +179,64 @@ def search_cars():
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 12))
         sort_by = request.args.get('sort_by', 'price_asc')
+        with_facets = request.args.get('facets') in ('1', 'true')
+        cursor = request.args.get('cursor')
         
         # Execute search
-        search_results = search_engine.search(criteria, page, per_page, sort_by)
+        search_results = search_engine.search(criteria, page, per_page, sort_by, with_facets=with_facets,
+                                              cursor=cursor)
         
-        # Log search
-        try:
-            search_log = SearchLog(
-                search_criteria=json.dumps(criteria, ensure_ascii=False),
-                results_count=search_results['total'],
-                user_ip=request.remote_addr
-            )
-            db.session.add(search_log)
-            db.session.commit()
-        except Exception as e:
-            print(f"Search logging error: {e}")
+        # Log search (queued, written in batches by a background thread)
+        search_log_writer.log(criteria, search_results['total'], request.remote_addr)
+        
+        return json_response(search_results)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+@app.route('/api/saved-searches', methods=['POST'])
+def create_saved_search():
+    """Save search criteria to be notified about matching new listings"""
+    try:
+        data = request.get_json() or {}
+        criteria = data.get('criteria')
+        if not isinstance(criteria, dict):
+            return json_response({'error': 'criteria must be an object'}, 400)
         
-        return jsonify(search_results)
+        saved_search, errors = saved_searches.save(criteria, data.get('contact'))
+        if errors:
+            return json_response({'errors': errors}, 400)
+        
+        return json_response({
+            'id': saved_search.id,
+            'criteria': saved_search.get_criteria(),
+            'contact': saved_search.contact,
+            'created_at': saved_search.created_at.isoformat()
+        }, 201)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+@app.route('/api/saved-searches/<int:saved_search_id>', methods=['DELETE'])
+def delete_saved_search(saved_search_id):
+    """Stop notifications for a saved search (requires the contact it was saved with)"""
+    try:
+        contact = request.args.get('contact')
+        if not contact:
+            return json_response({'error': 'contact is required'}, 400)
+        if not saved_searches.deactivate(saved_search_id, contact):
+            return json_response({'error': 'Saved search not found'}, 404)
+        return json_response({'success': True})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route('/api/filters')
+@conditional_get.conditional(catalog_validators)
 def get_filters():
     """Get available filter options"""
     try:
         filter_options = search_engine.get_filter_options()
-        return jsonify(filter_options)
+        return json_response(filter_options)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
@@ -224,7 +251,7 @@ def admin_login():
         if admin and password and check_password_hash(admin.password_hash, password):
             admin.last_login = datetime.utcnow()
             db.session.commit()
-            return jsonify({
+            return json_response({
                 'success': True,
                 'message': 'Login successful',
                 'admin': {
@@ -233,77 +260,78 @@ def admin_login():
                 }
             })
         else:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'Invalid credentials'
-            }), 401
+            }, 401)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route('/api/admin/cars', methods=['GET'])
 def admin_get_cars():
     """Get all cars for admin"""
     try:
         page = int(request.args.get('page', 1))
-        cars = Car.query.order_by(Car.created_at.desc()).paginate(
-            page=page, per_page=20, error_out=False
-        )
+        cursor = request.args.get('cursor')
+        
+        if cursor is not None:
+            items, next_cursor = keyset_page(project(Car.query, 'admin_row'), Car.created_at, Car.id, 'desc',
+                                             'newest', cursor, 20)
+            pagination_data = {
+                'total': count_cache.get('cars:all', Car.query),
+                'per_page': 20,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
+            }
+        else:
+            cars = project(Car.query, 'admin_row').order_by(Car.created_at.desc()).paginate(
+                page=page, per_page=20, error_out=False
+            )
+            items = cars.items
+            pagination_data = {
+                'total': cars.total,
+                'page': page,
+                'pages': cars.pages,
+                'has_prev': cars.has_prev,
+                'has_next': cars.has_next
+            }
         
-        return jsonify({
-            'cars': [{
-                'id': car.id,
-                'name': car.name,
-                'brand': car.brand,
-                'model': car.model,
-                'year': car.year,
-                'price': car.price,
-                'is_available': car.is_available,
-                'image_url': car.image_url,
-                'created_at': car.created_at.isoformat() if car.created_at else None
-            } for car in cars.items],
-            'total': cars.total,
-            'page': page,
-            'pages': cars.pages,
-            'has_prev': cars.has_prev,
-            'has_next': cars.has_next
+        return json_response({
+            'cars': serialize_cars(items, 'admin_row'),
+            **pagination_data
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 @app.route('/api/admin/stats')
 def admin_stats():
     """Get admin dashboard statistics"""
     try:
-        total_cars = Car.query.count()
-        available_cars = Car.query.filter_by(is_available=True).count()
-        total_searches = SearchLog.query.count()
+        counters = stats_counters.snapshot()
+        total_cars = counters['cars']
+        available_cars = counters['available_cars']
+        total_searches = counters['searches']
         
-        recent_cars = Car.query.order_by(Car.created_at.desc()).limit(5).all()
+        recent_cars = project(Car.query, 'admin_row').order_by(Car.created_at.desc()).limit(5).all()
         
-        return jsonify({
+        return json_response({
             'total_cars': total_cars,
             'available_cars': available_cars,
             'total_searches': total_searches,
-            'recent_cars': [{
-                'id': car.id,
-                'name': car.name,
-                'brand': car.brand,
-                'price': car.price,
-                'created_at': car.created_at.isoformat() if car.created_at else None
-            } for car in recent_cars]
+            'recent_cars': serialize_cars(recent_cars, 'admin_recent')
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': 'Not found'}), 404
+    return json_response({'error': 'Not found'}, 404)
 
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
-    return jsonify({'error': 'Internal server error'}), 500
+    return json_response({'error': 'Internal server error'}, 500)
 
 # Make sure app is available at module level for gunicorn
 app = app
@@ -1,11 +1,24 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Flask, render_template, request, redirect, url_for, flash, session
+from werkzeug.security import check_password_hash
 from config import Config
 from models import db, Car, Admin, SearchLog, CarSubmission
 from database import init_database
 from search_engine import search_engine
-from utils import normalize_arabic, format_price, validate_search_criteria
+from search_index import search_index
+from similar_cars import similar_cars
+from db_routing import db_routing
+from conditional_get import catalog_validators, car_validators, conditional_get
+from sqlite_tuning import sqlite_tuning
+from fulltext import fulltext
+from search_cache import search_cache
+from search_log_writer import search_log_writer
+from search_analytics import search_analytics
+from stats_counters import stats_counters, submission_counter
+from saved_searches import saved_searches
+from pagination import KeysetPage, count_cache, keyset_page
+from projections import get_cars_by_ids, project
+from serializer import json_response, serialize_cars
+from utils import normalize_arabic, format_price, parse_id_list
 from image_handler import ImageHandler
 import json
 from datetime import datetime
@@ -16,7 +29,18 @@ def create_app():
     app.config.from_object(Config)
     
     # تهيئة قاعدة البيانات
+    db_routing.init_app(app)
     db.init_app(app)
+    sqlite_tuning.init_app(app)
+    conditional_get.init_app(app)
+    search_index.init_app(app)
+    similar_cars.init_app(app)
+    fulltext.init_app(app)
+    search_cache.init_app(app)
+    search_log_writer.init_app(app)
+    search_analytics.init_app(app)
+    stats_counters.init_app(app)
+    saved_searches.init_app(app)
     
     # تهيئة قاعدة البيانات عند بدء التطبيق (non-blocking)
     with app.app_context():
@@ -45,90 +69,87 @@ def index():
     filter_options = search_engine.get_filter_options()
     
     # الحصول على السيارات المميزة
-    featured_cars = Car.query.filter(Car.is_available == True, Car.is_featured == True)\
-                            .order_by(Car.created_at.desc())\
-                            .limit(4).all()
+    featured_cars = project(Car.query, 'card').filter(Car.is_available == True, Car.is_featured == True)\
+                                             .order_by(Car.created_at.desc())\
+                                             .limit(4).all()
     
-    # الحصول على أحدث السيارات
-    latest_cars = Car.query.filter(Car.is_available == True)\
-                          .order_by(Car.created_at.desc())\
-                          .limit(8).all()
+    # الحصول على أحدث السيارات مع مؤشر "تحميل المزيد"
+    latest_cars, latest_cursor = keyset_page(project(Car.query, 'card').filter(Car.is_available == True),
+                                             Car.created_at, Car.id, 'desc', 'newest', None, 8)
     
     # الحصول على الإحصائيات الحقيقية
-    total_cars = Car.query.filter(Car.is_available == True).count()
+    total_cars = stats_counters.get('available_cars')
     total_brands = len(filter_options.get('brands', []))
     
     return render_template('index.html',
                          filter_options=filter_options,
                          featured_cars=featured_cars,
                          latest_cars=latest_cars,
+                         latest_cursor=latest_cursor,
                          total_cars=total_cars,
                          total_brands=total_brands)
 
-@app.route('/search')
-def search():
-    """صفحة البحث والنتائج"""
-    # الحصول على معايير البحث من الطلب
+def criteria_from_args(args):
+    """معايير البحث من معاملات الطلب (رابط صفحة البحث أو نموذج حفظ البحث)"""
     criteria = {}
     
     # النص البحثي
-    search_text = request.args.get('search_text') or request.args.get('q')
+    search_text = args.get('search_text') or args.get('q')
     if search_text:
         criteria['search_text'] = search_text.strip()
     
     # الميزانية
-    if request.args.get('budget'):
-        criteria['budget'] = request.args.get('budget')
+    if args.get('budget'):
+        criteria['budget'] = args.get('budget')
     
     # نطاق السعر
-    if request.args.get('price_min'):
-        criteria['price_min'] = request.args.get('price_min')
-    if request.args.get('price_max'):
-        criteria['price_max'] = request.args.get('price_max')
+    if args.get('price_min'):
+        criteria['price_min'] = args.get('price_min')
+    if args.get('price_max'):
+        criteria['price_max'] = args.get('price_max')
     
     # المعايير الأساسية
     basic_criteria = ['performance_level', 'fuel_type', 'transmission', 'car_type', 'brand']
     for criterion in basic_criteria:
-        if request.args.get(criterion):
-            criteria[criterion] = request.args.get(criterion)
+        if args.get(criterion):
+            criteria[criterion] = args.get(criterion)
     
     # معايير السنة
-    if request.args.get('year_from'):
-        criteria['year_from'] = request.args.get('year_from')
-    if request.args.get('year_to'):
-        criteria['year_to'] = request.args.get('year_to')
+    if args.get('year_from'):
+        criteria['year_from'] = args.get('year_from')
+    if args.get('year_to'):
+        criteria['year_to'] = args.get('year_to')
     
     # معايير أخرى
     other_criteria = ['doors', 'engine_size_min', 'engine_size_max', 'mileage_max', 'color', 'country_origin']
     for criterion in other_criteria:
-        if request.args.get(criterion):
-            criteria[criterion] = request.args.get(criterion)
+        if args.get(criterion):
+            criteria[criterion] = args.get(criterion)
     
     # الميزات الإضافية
     features = ['leather_seats', 'sunroof', 'gps_system', 'backup_camera', 'entertainment_system', 'safety_features']
     for feature in features:
-        if request.args.get(feature) == 'on':
+        if args.get(feature) == 'on':
             criteria[feature] = True
     
+    return criteria
+
+@app.route('/search')
+def search():
+    """صفحة البحث والنتائج"""
+    # الحصول على معايير البحث من الطلب
+    criteria = criteria_from_args(request.args)
+    
     # معايير التصفح والترتيب
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 12))
     sort_by = request.args.get('sort_by', 'price_asc')
     
     # تنفيذ البحث
-    search_results = search_engine.search(criteria, page, per_page, sort_by)
+    search_results = search_engine.search(criteria, page, per_page, sort_by, with_facets=True)
     
-    # تسجيل عملية البحث
-    try:
-        search_log = SearchLog(
-            search_criteria=json.dumps(criteria, ensure_ascii=False),
-            results_count=search_results['total'],
-            user_ip=request.remote_addr
-        )
-        db.session.add(search_log)
-        db.session.commit()
-    except Exception as e:
-        print(f"خطأ في تسجيل البحث: {e}")
+    # تسجيل عملية البحث (يكتب في الخلفية دون انتظار)
+    search_log_writer.log(criteria, search_results['total'], request.remote_addr)
     
     # الحصول على خيارات المرشحات
     filter_options = search_engine.get_filter_options()
@@ -139,10 +160,25 @@ def search():
                          current_criteria=criteria,
                          current_sort=sort_by)
 
+@app.route('/saved-searches', methods=['POST'])
+def save_search():
+    """حفظ معايير البحث الحالية لتلقي إشعار بالسيارات الجديدة المطابقة"""
+    criteria = criteria_from_args(request.form)
+    saved_search, errors = saved_searches.save(criteria, request.form.get('contact'))
+    if errors:
+        for error in errors:
+            flash(error, 'error')
+    else:
+        flash('تم حفظ البحث، وسنعلمك عند إضافة سيارات جديدة مطابقة', 'success')
+    
+    search_args = {key: value for key, value in request.form.items() if key != 'contact'}
+    return redirect(url_for('search', **search_args))
+
 @app.route('/car/<int:car_id>')
+@conditional_get.conditional(car_validators, private=True)
 def car_details(car_id):
     """صفحة تفاصيل السيارة"""
-    car = Car.query.get_or_404(car_id)
+    car = project(Car.query, 'detail').get_or_404(car_id)
     
     # الحصول على سيارات مشابهة
     similar_cars = search_engine.get_similar_cars(car_id)
@@ -156,55 +192,64 @@ def search_suggestions():
     """API للحصول على اقتراحات البحث"""
     query = request.args.get('q', '').strip()
     suggestions = search_engine.get_search_suggestions(query)
-    return jsonify(suggestions)
+    return json_response(suggestions)
 
 @app.route('/api/latest-cars')
+@conditional_get.conditional(catalog_validators)
 def api_latest_cars():
-    """API للحصول على أحدث السيارات مع التصفح"""
+    """API للحصول على أحدث السيارات مع التصفح (بالمؤشر cursor أو برقم الصفحة page)"""
     page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 8
     
-    cars = Car.query.filter(Car.is_available == True)\
-                   .order_by(Car.created_at.desc())\
-                   .offset((page - 1) * per_page)\
-                   .limit(per_page).all()
-    
-    cars_data = []
-    for car in cars:
-        cars_data.append({
-            'id': car.id,
-            'name': car.name,
-            'brand': car.brand,
-            'model': car.model,
-            'year': car.year,
-            'price': car.price,
-            'fuel_type': car.fuel_type,
-            'transmission': car.transmission,
-            'mileage': car.mileage,
-            'image_url': car.image_url,
-            'gps_system': car.gps_system,
-            'backup_camera': car.backup_camera
+    query = project(Car.query, 'card').filter(Car.is_available == True)
+    if cursor is not None:
+        cars, next_cursor = keyset_page(query, Car.created_at, Car.id, 'desc', 'newest', cursor, per_page)
+    else:
+        cars = query.order_by(Car.created_at.desc())\
+                    .offset((page - 1) * per_page)\
+                    .limit(per_page).all()
+        next_cursor = None
+    
+    cars_data = serialize_cars(cars, 'card')
+    
+    if cursor is not None:
+        return json_response({
+            'cars': cars_data,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
     
-    return jsonify({
+    return json_response({
         'cars': cars_data,
         'page': page,
         'has_more': len(cars) == per_page
     })
 
+@app.route('/api/cars')
+def api_cars_by_ids():
+    """API لجلب سيارات محددة بالأرقام ?ids=1,2,3 باستعلام واحد وبنفس الترتيب (قائمة المقارنة)"""
+    car_ids, invalid = parse_id_list(request.args.getlist('ids'))
+    if invalid or not car_ids:
+        return json_response({'error': 'ids يجب أن تكون أرقام سيارات مفصولة بفواصل'}, 400)
+    max_ids = app.config.get('MAX_BULK_CAR_IDS', 50)
+    if len(car_ids) > max_ids:
+        return json_response({'error': f'الحد الأقصى {max_ids} سيارة في الطلب'}, 400)
+    
+    cars = get_cars_by_ids(car_ids, 'detail')
+    found = {car.id for car in cars}
+    return json_response({
+        'cars': serialize_cars(cars, 'detail'),
+        'total': len(cars),
+        'missing': [car_id for car_id in car_ids if car_id not in found]
+    })
+
 @app.route('/compare')
 def compare_cars():
     """صفحة مقارنة السيارات"""
-    car_ids = request.args.getlist('cars')
-    cars = []
-    
-    for car_id in car_ids:
-        try:
-            car = Car.query.get(int(car_id))
-            if car:
-                cars.append(car)
-        except ValueError:
-            continue
+    # cars=1&cars=2 أو cars=1,2 (الأرقام غير الصالحة تتجاهل)
+    car_ids, _ = parse_id_list(request.args.getlist('cars'))
+    cars = get_cars_by_ids(car_ids, 'detail')
     
     if len(cars) < 2:
         flash('يجب اختيار سيارتين على الأقل للمقارنة', 'warning')
@@ -338,12 +383,21 @@ def admin_dashboard():
         return redirect(url_for('admin_login'))
     
     # إحصائيات عامة
-    total_cars = Car.query.count()
-    available_cars = Car.query.filter_by(is_available=True).count()
-    total_searches = SearchLog.query.count()
+    counters = stats_counters.snapshot()
+    total_cars = counters['cars']
+    available_cars = counters['available_cars']
+    total_searches = counters['searches']
+    
+    # تجميع سجلات البحث الجديدة (دفعات محدودة) ثم القراءة من الجداول المجمعة
+    search_analytics.rollup(max_batches=5)
+    demand = {
+        'brands': search_analytics.top_values('brand', days=30, limit=5),
+        'budgets': search_analytics.top_values('budget', days=30, limit=5),
+        'zero_results': search_analytics.top_values('zero_results', days=30, limit=5)
+    }
     
     # أحدث السيارات المضافة
-    recent_cars = Car.query.order_by(Car.created_at.desc()).limit(5).all()
+    recent_cars = project(Car.query, 'admin_row').order_by(Car.created_at.desc()).limit(5).all()
     
     # أحدث عمليات البحث
     recent_searches = SearchLog.query.order_by(SearchLog.created_at.desc()).limit(10).all()
@@ -352,6 +406,7 @@ def admin_dashboard():
                          total_cars=total_cars,
                          available_cars=available_cars,
                          total_searches=total_searches,
+                         demand=demand,
                          recent_cars=recent_cars,
                          recent_searches=recent_searches)
 
@@ -362,9 +417,17 @@ def admin_cars():
         return redirect(url_for('admin_login'))
     
     page = int(request.args.get('page', 1))
-    cars = Car.query.order_by(Car.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    cursor = request.args.get('cursor')
+    
+    if cursor is not None:
+        # التصفح بالمؤشر للصفحات العميقة، والعدد من الذاكرة المؤقتة
+        items, next_cursor = keyset_page(project(Car.query, 'admin_row'), Car.created_at, Car.id, 'desc',
+                                         'newest', cursor, 20)
+        cars = KeysetPage(items, count_cache.get('cars:all', Car.query), next_cursor)
+    else:
+        cars = project(Car.query, 'admin_row').order_by(Car.created_at.desc()).paginate(
+            page=page, per_page=20, error_out=False
+        )
     
     return render_template('admin/cars.html', cars=cars)
 
@@ -423,6 +486,10 @@ def admin_add_car():
             car = Car(**car_data)
             car.update_normalized_fields()
             db.session.add(car)
+            db.session.flush()
+            
+            # مطابقة السيارة الجديدة مع البحوث المحفوظة في نفس المعاملة
+            saved_searches.match_new_car(car)
             db.session.commit()
             
             flash('تم إضافة السيارة بنجاح', 'success')
@@ -533,22 +600,29 @@ def admin_submissions():
     
     status_filter = request.args.get('status', 'all')
     page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     
     query = CarSubmission.query
     
     if status_filter != 'all':
         query = query.filter_by(status=status_filter)
     
-    submissions = query.order_by(CarSubmission.submitted_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    if cursor is not None:
+        items, next_cursor = keyset_page(query, CarSubmission.submitted_at, CarSubmission.id, 'desc',
+                                         'submitted', cursor, 20)
+        submissions = KeysetPage(items, count_cache.get(f'submissions:{status_filter}', query), next_cursor)
+    else:
+        submissions = query.order_by(CarSubmission.submitted_at.desc()).paginate(
+            page=page, per_page=20, error_out=False
+        )
     
     # إحصائيات الطلبات
+    counters = stats_counters.snapshot()
     stats = {
-        'total': CarSubmission.query.count(),
-        'pending': CarSubmission.query.filter_by(status='pending').count(),
-        'approved': CarSubmission.query.filter_by(status='approved').count(),
-        'rejected': CarSubmission.query.filter_by(status='rejected').count()
+        'total': counters['submissions'],
+        'pending': counters[submission_counter('pending')],
+        'approved': counters[submission_counter('approved')],
+        'rejected': counters[submission_counter('rejected')]
     }
     
     return render_template('admin/submissions.html',
@@ -586,6 +660,10 @@ def admin_approve_submission(submission_id):
         submission.admin_notes = request.form.get('admin_notes', '')
         
         db.session.add(car)
+        db.session.flush()
+        
+        # مطابقة السيارة الجديدة مع البحوث المحفوظة في نفس المعاملة
+        saved_searches.match_new_car(car)
         db.session.commit()
         
         flash(f'تم قبول الطلب وإضافة السيارة "{car.name}" للموقع بنجاح', 'success')
@@ -689,17 +767,17 @@ def health_check():
     """Health check endpoint for Railway"""
     try:
         # Simple health check that doesn't depend on database
-        return jsonify({
+        return json_response({
             'status': 'healthy',
             'message': 'Car Store Application is running',
             'timestamp': datetime.utcnow().isoformat()
-        }), 200
+        }, 200)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'status': 'unhealthy',
             'message': f'Health check failed: {str(e)}',
             'timestamp': datetime.utcnow().isoformat()
-        }), 500
+        }, 500)
 
 @app.route('/health/db')
 def health_check_db():
@@ -708,17 +786,17 @@ def health_check_db():
         # Test database connection
         from sqlalchemy import text
         db.session.execute(text('SELECT 1'))
-        return jsonify({
+        return json_response({
             'status': 'healthy',
             'message': 'Database connection is working',
             'timestamp': datetime.utcnow().isoformat()
-        }), 200
+        }, 200)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'status': 'unhealthy',
             'message': f'Database health check failed: {str(e)}',
             'timestamp': datetime.utcnow().isoformat()
-        }), 500
+        }, 500)
 
 @app.route('/reset-db')
 def reset_database_endpoint():
@@ -726,17 +804,17 @@ def reset_database_endpoint():
     try:
         from database import reset_database
         reset_database(app)
-        return jsonify({
+        return json_response({
             'status': 'success',
             'message': 'Database reset successfully with correct image paths',
             'timestamp': datetime.utcnow().isoformat()
-        }), 200
+        }, 200)
     except Exception as e:
-        return jsonify({
+        return json_response({
             'status': 'error',
             'message': f'Database reset failed: {str(e)}',
             'timestamp': datetime.utcnow().isoformat()
-        }), 500
+        }, 500)
 
 # For Vercel deployment
 application = app
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياسات أداء صغيرة لمتجر السيارات الذكي
+الاستخدام: python benchmark.py [normalize serialize sqlite ...]
+"""
+
+import argparse
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime, timedelta
+
+# إضافة المجلد الحالي إلى مسار Python
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import normalize_arabic, normalize_arabic_many
+
+
+def legacy_normalize_arabic(text):
+    """التطبيع السابق بالتعابير النمطية (للمقارنة فقط)"""
+    if not text:
+        return ""
+    text = re.sub(r'[ًٌٍَُِّْٰ]', '', text)
+    text = text.replace('أ', 'ا').replace('إ', 'ا').replace('آ', 'ا')
+    text = text.replace('ى', 'ي')
+    text = text.replace('ة', 'ه')
+    text = re.sub(r'\s+', ' ', text.strip())
+    return text.lower()
+
+
+def _report(name, seconds, count):
+    print(f"{name:<40} {seconds / count * 1e6:10.3f} µs/نص")
+
+
+def benchmark_normalize(repeat=5):
+    """قياس تطبيع النص: السابق، الجديد (مع الذاكرة وبدونها)، والتطبيع الجماعي لعمود"""
+    rng = random.Random(42)
+    words = ['تويوتا', 'كامري', 'هيونداي', 'النترا', 'مرسيدس', 'بنز', 'أودي', 'إنفينيتي', 'سيارة', 'فضّية',
+             'مُستعملة', 'Toyota', 'Camry', 'SUV', 'هايبرد', 'اقتصادية']
+    short_texts = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(500)]
+    long_texts = [' '.join(rng.choice(words) for _ in range(40)) for _ in range(200)]
+    column = [rng.choice(short_texts[:50]) for _ in range(20000)]
+
+    print("=" * 60)
+    print("📏 تطبيع النص العربي")
+    print("=" * 60)
+    for label, texts in (('نصوص قصيرة متكررة', short_texts * 20), ('نصوص طويلة (وصف)', long_texts)):
+        print(f"\n{label} ({len(texts)} نص):")
+        legacy = min(timeit.repeat(lambda: [legacy_normalize_arabic(text) for text in texts], number=1, repeat=repeat))
+        current = min(timeit.repeat(lambda: [normalize_arabic(text) for text in texts], number=1, repeat=repeat))
+        _report('legacy (re.sub + replace)', legacy, len(texts))
+        _report('normalize_arabic', current, len(texts))
+        print(f"{'التسريع':<40} {legacy / current:10.1f}x")
+
+    print(f"\nعمود كامل أثناء إعادة الفهرسة ({len(column)} قيمة):")
+    legacy = min(timeit.repeat(lambda: [legacy_normalize_arabic(text) for text in column], number=1, repeat=repeat))
+    batch = min(timeit.repeat(lambda: normalize_arabic_many(column), number=1, repeat=repeat))
+    _report('legacy (re.sub + replace)', legacy, len(column))
+    _report('normalize_arabic_many', batch, len(column))
+    print(f"{'التسريع':<40} {legacy / batch:10.1f}x")
+
+
+def _sqlite_database(path, cars):
+    """إنشاء جداول التطبيق في ملف SQLite وتعبئة cars سيارة"""
+    from sqlalchemy import create_engine
+    from models import Car, db
+
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    rows = [{
+        'name': f'سيارة {index}', 'name_normalized': f'سياره {index}', 'brand': 'تويوتا',
+        'brand_normalized': 'تويوتا', 'model': 'كامري', 'year': rng.randint(2010, 2024),
+        'price': rng.randint(3000, 60000), 'performance_level': 'medium', 'fuel_type': 'gasoline',
+        'transmission': 'automatic', 'car_type': 'sedan', 'mileage': rng.randint(0, 200000),
+        'is_available': True, 'is_featured': index % 20 == 0, 'created_at': start + timedelta(minutes=index)
+    } for index in range(cars)]
+    with engine.begin() as connection:
+        connection.execute(Car.__table__.insert(), rows)
+    engine.dispose()
+
+
+def _sqlite_workload(path, pragmas, readers, writers, seconds):
+    """
+    قراء يجلبون صفحة أحدث السيارات وكتاب يسجلون عملية بحث ويعملون commit لكل سجل
+    (مثل تسجيل البحث المتزامن)؛ يعيد (قراءات/ث، كتابات/ث، أخطاء القفل)
+    """
+    from sqlite_tuning import apply_pragmas
+
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def connect():
+        connection = sqlite3.connect(path, check_same_thread=False)
+        if pragmas:
+            apply_pragmas(connection, pragmas)
+        return connection
+
+    def reader():
+        connection = connect()
+        done = locked = 0
+        while time.perf_counter() < stop:
+            try:
+                connection.execute('SELECT id, name, price, year FROM cars WHERE is_available = 1 '
+                                   'ORDER BY created_at DESC, id DESC LIMIT 12').fetchall()
+                done += 1
+            except sqlite3.OperationalError:
+                locked += 1
+        connection.close()
+        with lock:
+            counts['reads'] += done
+            counts['locked'] += locked
+
+    def writer():
+        connection = connect()
+        done = locked = 0
+        while time.perf_counter() < stop:
+            try:
+                connection.execute('INSERT INTO search_logs (search_criteria, results_count, user_ip, created_at) '
+                                   'VALUES (?, ?, ?, ?)', ('{"brand": "تويوتا"}', 12, '127.0.0.1',
+                                                          datetime.utcnow().isoformat(' ')))
+                connection.commit()
+                done += 1
+            except sqlite3.OperationalError:
+                connection.rollback()
+                locked += 1
+        connection.close()
+        with lock:
+            counts['writes'] += done
+            counts['locked'] += locked
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + \
+              [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts['reads'] / seconds, counts['writes'] / seconds, counts['locked']
+
+
+def benchmark_sqlite(seconds=3.0, readers=4, writers=2, cars=5000):
+    """قياس القراءة والكتابة المتزامنة على SQLite: الإعدادات الافتراضية مقابل إعدادات sqlite_tuning"""
+    from config import Config
+    from sqlite_tuning import sqlite_pragmas
+
+    config = {key: getattr(Config, key) for key in dir(Config) if key.startswith('SQLITE_')}
+    profiles = (
+        ('الافتراضي (journal=DELETE, synchronous=FULL)', []),
+        ('sqlite_tuning (WAL, NORMAL, cache, mmap)', sqlite_pragmas(config)),
+    )
+
+    print("=" * 60)
+    print(f"🗄️ SQLite: {readers} قارئ و {writers} كاتب لمدة {seconds:g} ثانية ({cars} سيارة)")
+    print("=" * 60)
+    print(f"{'الإعدادات':<45} {'قراءة/ث':>10} {'كتابة/ث':>10} {'أخطاء قفل':>10}")
+    for label, pragmas in profiles:
+        directory = tempfile.mkdtemp(prefix='car-store-bench-')
+        try:
+            path = os.path.join(directory, 'bench.db')
+            _sqlite_database(path, cars)
+            reads, writes, locked = _sqlite_workload(path, pragmas, readers, writers, seconds)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print(f"{label:<45} {reads:10.0f} {writes:10.0f} {locked:10d}")
+
+
+def benchmark_serialize(repeat=5, cars=500):
+    """قياس تحويل صفحة سيارات إلى JSON: القواميس اليدوية و jsonify مقابل ملامح serializer"""
+    from flask import Flask, jsonify
+    from models import Car
+    import serializer
+
+    rng = random.Random(42)
+    created_at = datetime(2024, 1, 1)
+    page = [Car(id=number, name=f'سيارة {number}', brand=rng.choice(['تويوتا', 'هيونداي', 'نيسان']),
+                model='موديل', year=rng.randint(2010, 2024), price=rng.uniform(5000, 90000),
+                performance_level='متوسط', fuel_type='gasoline', transmission='automatic', engine_size=2.0,
+                doors=4, car_type='sedan', color='ابيض', mileage=rng.randint(0, 200000), country_origin='اليابان',
+                leather_seats=True, sunroof=False, gps_system=True, backup_camera=False,
+                entertainment_system=True, safety_features=True, description='وصف ' * 40,
+                image_url=f'/static/images/{number}.jpg', is_available=True, is_featured=False,
+                created_at=created_at + timedelta(hours=number), updated_at=None)
+            for number in range(cars)]
+    fields = serializer.PROFILES['detail']
+
+    def legacy():
+        rows = [{field: getattr(car, field) for field in fields} for car in page]
+        for row in rows:
+            row['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+        return jsonify({'cars': rows}).get_data()
+
+    def compiled():
+        return serializer.json_response({'cars': serializer.serialize_cars(page, 'detail')}).get_data()
+
+    print("=" * 60)
+    print(f"🧾 تحويل {cars} سيارة (ملمح detail) إلى JSON - orjson {'مثبتة' if serializer.orjson else 'غير مثبتة'}")
+    print("=" * 60)
+    with Flask(__name__).app_context():
+        before = min(timeit.repeat(legacy, number=1, repeat=repeat))
+        after = min(timeit.repeat(compiled, number=1, repeat=repeat))
+    print(f"{'قواميس يدوية + jsonify':<40} {before / cars * 1e6:10.3f} µs/سيارة")
+    print(f"{'serializer + json_response':<40} {after / cars * 1e6:10.3f} µs/سيارة")
+    print(f"{'التسريع':<40} {before / after:10.1f}x")
+
+
+BENCHMARKS = {
+    'normalize': benchmark_normalize,
+    'serialize': benchmark_serialize,
+    'sqlite': benchmark_sqlite,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياسات أداء متجر السيارات')
+    parser.add_argument('names', nargs='*', choices=sorted(BENCHMARKS) + [[]], default=[],
+                        help='القياسات المطلوبة (الكل إذا لم تحدد)')
+    args = parser.parse_args()
+    for name in args.names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
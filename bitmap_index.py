@@ -0,0 +1,84 @@
+"""
+فهارس نقطية (Bitmap) للأعمدة التصنيفية والمنطقية في فهرس البحث
+كل قيمة مميزة تحمل مجموعة بتات، البت رقم n يعني أن الصف n يحمل هذه القيمة
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+def bitmap_rows(bits: int) -> List[int]:
+    """أرقام الصفوف المضبوطة في مجموعة البتات بترتيب تصاعدي"""
+    digits = bin(bits)[:1:-1]
+    return [row for row, digit in enumerate(digits) if digit == '1']
+
+
+def rows_bitmap(rows: Iterable[int]) -> int:
+    """بناء مجموعة بتات من أرقام صفوف في زمن خطي"""
+    rows = list(rows)
+    if not rows:
+        return 0
+    buffer = bytearray(max(rows) // 8 + 1)
+    for row in rows:
+        buffer[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bitmap_count(bits: int) -> int:
+    """عدد الصفوف في مجموعة البتات"""
+    return bin(bits).count('1')
+
+
+class BitmapIndex:
+    """
+    فهرس نقطي لعمود واحد: قيمة -> مجموعة بتات
+    الأعداد الصحيحة في Python تعمل كمجموعات بتات بحجم متغير،
+    فيكون AND/OR بين القيم عملية واحدة على مستوى الكلمات
+    """
+
+    def __init__(self):
+        self._bitmaps: Dict[Any, int] = {}
+
+    def load(self, items: Iterable[Tuple[int, Any]]):
+        """تحميل جماعي لأزواج (الصف، القيمة) ببناء كل مجموعة بتات مرة واحدة"""
+        grouped: Dict[Any, List[int]] = {}
+        for row, value in items:
+            grouped.setdefault(value, []).append(row)
+        self._bitmaps = {value: rows_bitmap(rows) for value, rows in grouped.items()}
+
+    def add(self, row: int, value: Any):
+        self._bitmaps[value] = self._bitmaps.get(value, 0) | (1 << row)
+
+    def remove(self, row: int, value: Any):
+        bits = self._bitmaps.get(value, 0) & ~(1 << row)
+        if bits:
+            self._bitmaps[value] = bits
+        else:
+            self._bitmaps.pop(value, None)
+
+    def get(self, value: Any) -> int:
+        """الصفوف التي تحمل القيمة"""
+        return self._bitmaps.get(value, 0)
+
+    def any_of(self, values: Iterable[Any]) -> int:
+        """الصفوف التي تحمل أياً من القيم (OR)"""
+        bits = 0
+        for value in values:
+            bits |= self._bitmaps.get(value, 0)
+        return bits
+
+    def all_of(self, values: Iterable[Any]) -> int:
+        """
+        الصفوف التي تحمل كل القيم (AND) - للميزات المتعددة في الصف الواحد
+        القائمة الفارغة تعيد -1 (كل الصفوف) حتى لا تؤثر على AND اللاحق
+        """
+        bits = -1
+        for value in values:
+            bits &= self._bitmaps.get(value, 0)
+            if not bits:
+                return 0
+        return bits
+
+    def values(self) -> List[Any]:
+        return list(self._bitmaps)
+
+    def counts(self) -> Dict[Any, int]:
+        return {value: bitmap_count(bits) for value, bits in self._bitmaps.items()}
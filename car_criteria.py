@@ -0,0 +1,183 @@
+"""
+ترجمة معايير البحث إلى فحوصات جاهزة على السيارات في الذاكرة
+الأرقام تحول والنصوص تطبع مرة واحدة عند الترجمة، فمطابقة كل سيارة بعدها
+مقارنات قليلة على أعمدتها (بنفس قواعد مرشحات محرك البحث)
+"""
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+from models import CAR_FEATURES
+from utils import normalize_arabic
+
+# فحص واحد: يستقبل دالة قراءة عمود من السيارة ويعيد True إذا طابقت
+Check = Callable[[Callable[[str], Any]], bool]
+
+# مرشحات النطاق: المفتاح في المعايير -> (العمود، التحويل، نوع الحد)
+RANGE_CRITERIA = (
+    ('budget', 'price', float, 'max'),
+    ('price_min', 'price', float, 'min'),
+    ('price_max', 'price', float, 'max'),
+    ('year_from', 'year', int, 'min'),
+    ('year_to', 'year', int, 'max'),
+    ('engine_size_min', 'engine_size', float, 'min'),
+    ('engine_size_max', 'engine_size', float, 'max'),
+    ('mileage_max', 'mileage', int, 'max'),
+)
+
+# المعايير التصنيفية: قيمة مفردة أو قائمة قيم (أي منها)
+CHOICE_CRITERIA = ('performance_level', 'fuel_type', 'transmission', 'car_type')
+
+# مرشحات البادئة على الأعمدة المطبعة: المفتاح في المعايير -> العمود
+PREFIX_CRITERIA = (('color', 'color_normalized'), ('country_origin', 'country_normalized'))
+
+# نص البحث (search_text) في كل المسارات (فهرس الذاكرة، المعايير المترجمة، LIKE، البحث النصي الكامل):
+# normalize_arabic للنص كجزء من أي عمود من هذه الأعمدة، مع وزن العمود في ترتيب الصلة
+TEXT_SEARCH_WEIGHTS = (('name_normalized', 10.0), ('brand_normalized', 10.0), ('model_normalized', 5.0))
+TEXT_SEARCH_COLUMNS = tuple(column for column, _ in TEXT_SEARCH_WEIGHTS)
+
+# ترتيب الأكثر صلة بنص البحث (text_relevance تنازلياً ثم رقم السيارة)
+RELEVANCE_SORT = 'relevance'
+
+
+def normalize_search_text(text: str) -> str:
+    """نص البحث كما يطابق الأعمدة المطبعة (بمسافاته، مثل name_normalized)"""
+    return normalize_arabic(text)
+
+
+def text_relevance(text: str, get: Callable[[str], Any]) -> float:
+    """
+    درجة صلة السيارة بنص البحث المطبع (الأعلى أولاً): وزن كل عمود يحتوي النص،
+    ومثله إضافة إذا ساواه العمود، ونصفه إذا بدأ به
+    """
+    score = 0.0
+    for column, weight in TEXT_SEARCH_WEIGHTS:
+        value = get(column) or ''
+        if text in value:
+            score += weight
+            if value == text:
+                score += weight
+            elif value.startswith(text):
+                score += weight / 2
+    return score
+
+
+def _parse(criteria: Dict[str, Any], key: str, cast: Callable) -> Optional[float]:
+    """قراءة قيمة رقمية بنفس تساهل المرشحات (القيم غير الصالحة تهمل)"""
+    if not criteria.get(key):
+        return None
+    try:
+        return cast(criteria[key])
+    except (ValueError, TypeError):
+        return None
+
+
+def _range_check(column: str, lo: Optional[float], hi: Optional[float]) -> Check:
+    # القيمة الفارغة لا تطابق أي حد (مثل NULL في SQL)
+    if lo is None:
+        return lambda get: get(column) is not None and get(column) <= hi
+    if hi is None:
+        return lambda get: get(column) is not None and get(column) >= lo
+    return lambda get: get(column) is not None and lo <= get(column) <= hi
+
+
+def _choice_check(column: str, value: Any) -> Check:
+    if isinstance(value, (list, tuple, set)):
+        choices = frozenset(value)
+        return lambda get: get(column) in choices
+    return lambda get: get(column) == value
+
+
+def _prefix_check(column: str, prefix: str) -> Check:
+    def check(get):
+        value = get(column)
+        return value is not None and value.startswith(prefix)
+    return check
+
+
+def _text_check(text: str) -> Check:
+    def check(get):
+        return any(text in (get(column) or '') for column in TEXT_SEARCH_COLUMNS)
+    return check
+
+
+def _compile(criteria: Dict[str, Any]) -> List[Check]:
+    checks: List[Check] = []
+
+    if criteria.get('search_text'):
+        checks.append(_text_check(normalize_search_text(criteria['search_text'])))
+
+    bounds: Dict[str, List[Optional[float]]] = {}
+    for key, column, cast, kind in RANGE_CRITERIA:
+        value = _parse(criteria, key, cast)
+        if value is None:
+            continue
+        lo, hi = bounds.setdefault(column, [None, None])
+        if kind == 'min':
+            bounds[column][0] = value if lo is None else max(lo, value)
+        else:
+            bounds[column][1] = value if hi is None else min(hi, value)
+    for column, (lo, hi) in bounds.items():
+        checks.append(_range_check(column, lo, hi))
+
+    for column in CHOICE_CRITERIA:
+        if criteria.get(column):
+            checks.append(_choice_check(column, criteria[column]))
+
+    doors = _parse(criteria, 'doors', int)
+    if doors is not None:
+        checks.append(lambda get: get('doors') == doors)
+
+    if criteria.get('brand'):
+        brand = normalize_arabic(criteria['brand'])
+        checks.append(lambda get: brand in (get('brand_normalized') or ''))
+
+    for key, column in PREFIX_CRITERIA:
+        if criteria.get(key):
+            checks.append(_prefix_check(column, normalize_arabic(criteria[key])))
+
+    features = tuple(feature for feature in CAR_FEATURES if criteria.get(feature))
+    if features:
+        checks.append(lambda get: all(get(feature) for feature in features))
+
+    return checks
+
+
+class CarCriteria:
+    """
+    معايير بحث مترجمة قابلة لإعادة الاستخدام على سيارات كثيرة
+    تطابق كائنات Car أو لقطات السيارات (قواميس مثل snapshot_car) بنفس القواعد
+    """
+
+    __slots__ = ('criteria', '_checks')
+
+    def __init__(self, criteria: Dict[str, Any]):
+        self.criteria = dict(criteria)
+        self._checks = _compile(self.criteria)
+
+    def matches(self, car) -> bool:
+        """هل تطابق سيارة (كائن Car) المعايير؟"""
+        return self._match(partial(getattr, car))
+
+    def matches_values(self, values: Mapping[str, Any]) -> bool:
+        """هل تطابق لقطة سيارة (قاموس أعمدة) المعايير؟"""
+        return self._match(values.get)
+
+    def filter_cars(self, cars: Iterable) -> List:
+        """السيارات المطابقة من مجموعة كائنات Car بترتيبها"""
+        match = self._match
+        return [car for car in cars if match(partial(getattr, car))]
+
+    def filter_values(self, snapshots: Iterable[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+        """اللقطات المطابقة من مجموعة قواميس بترتيبها"""
+        match = self._match
+        return [values for values in snapshots if match(values.get)]
+
+    def _match(self, get: Callable[[str], Any]) -> bool:
+        for check in self._checks:
+            if not check(get):
+                return False
+        return True
+
+
+def compile_criteria(criteria: Dict[str, Any]) -> CarCriteria:
+    """ترجمة معايير البحث إلى CarCriteria"""
+    return CarCriteria(criteria)
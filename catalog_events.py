@@ -0,0 +1,135 @@
+"""
+متابعة تغييرات كتالوج السيارات ونشرها للمشتركين بعد تأكيد المعاملة
+مع رقم إصدار في هذه العملية (catalog_generation) ورقم إصدار مشترك في قاعدة البيانات (CatalogState)
+يزيد داخل معاملة التغيير نفسها، فتراه كل العمليات بعد تأكيدها
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session, object_session
+from models import Car, CatalogState, db
+
+# مفتاح التغييرات المعلقة داخل session.info حتى يتم تأكيد المعاملة
+_PENDING_KEY = 'catalog_changes'
+
+_change_subscribers: List[Callable[[List[Dict[str, Any]], List[int]], None]] = []
+_reset_subscribers: List[Callable[[], None]] = []
+
+# رقم إصدار الكتالوج في هذه العملية: يزيد مع كل commit يغير السيارات أو إعادة تعيين
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def catalog_generation() -> int:
+    """رقم إصدار الكتالوج الحالي (للذاكرات المؤقتة التي تعتمد على بيانات السيارات)"""
+    return _generation
+
+
+def _bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def stored_catalog_version(session) -> str:
+    """إصدار الكتالوج المشترك من قاعدة البيانات (استعلام واحد بالمفتاح الأساسي)"""
+    row = session.query(CatalogState.generation, CatalogState.updated_at).filter(CatalogState.id == 1).first()
+    if row is None:
+        return '0'
+    # updated_at يميز الإصدار بعد إعادة إنشاء الجداول (reset_database يبدأ الرقم من جديد)
+    return f'{row[0]}.{row[1].isoformat() if row[1] else ""}'
+
+
+def _bump_stored_generation(connection):
+    """زيادة الإصدار المشترك على اتصال المعاملة الحالية (يتراجع معها إذا تراجعت)"""
+    table = CatalogState.__table__
+    result = connection.execute(update(table).where(table.c.id == 1).values(generation=table.c.generation + 1))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(id=1, generation=1))
+
+
+def snapshot_car(car: Car) -> Dict[str, Any]:
+    """نسخة مستقلة من بيانات السيارة لا تحتاج إلى جلسة قاعدة البيانات"""
+    snapshot = car.to_dict()
+    snapshot['name_normalized'] = car.name_normalized
+    snapshot['brand_normalized'] = car.brand_normalized
+    snapshot['model_normalized'] = car.model_normalized
+    snapshot['color_normalized'] = car.color_normalized
+    snapshot['country_normalized'] = car.country_normalized
+    return snapshot
+
+
+def subscribe(on_change: Callable[[List[Dict[str, Any]], List[int]], None],
+              on_reset: Optional[Callable[[], None]] = None):
+    """
+    تسجيل مستمع لتغييرات السيارات
+    on_change(upserted, deleted_ids) تستدعى بعد كل commit يغير جدول السيارات
+    on_reset() تستدعى عند إعادة بناء الكتالوج بالكامل
+    """
+    if on_change not in _change_subscribers:
+        _change_subscribers.append(on_change)
+    if on_reset is not None and on_reset not in _reset_subscribers:
+        _reset_subscribers.append(on_reset)
+
+
+def notify_catalog_reset():
+    """إبلاغ المشتركين بأن الكتالوج تغير خارج أحداث النموذج (حذف جماعي، إعادة تعيين)"""
+    _bump_generation()
+    try:
+        with db.engine.begin() as connection:
+            _bump_stored_generation(connection)
+    except Exception as e:
+        print(f"خطأ في تحديث إصدار الكتالوج: {e}")
+    for callback in list(_reset_subscribers):
+        try:
+            callback()
+        except Exception as e:
+            print(f"خطأ في معالجة إعادة تعيين الكتالوج: {e}")
+
+
+def _pending_changes(target: Car, connection) -> Optional[Dict[int, Optional[Dict[str, Any]]]]:
+    session = object_session(target)
+    if session is None:
+        return None
+    changes = session.info.setdefault(_PENDING_KEY, {})
+    if not changes:
+        # أول تغيير في المعاملة: الإصدار المشترك يزيد مرة واحدة لكل معاملة
+        _bump_stored_generation(connection)
+    return changes
+
+
+@event.listens_for(Car, 'after_insert')
+@event.listens_for(Car, 'after_update')
+def _record_upsert(mapper, connection, target):
+    changes = _pending_changes(target, connection)
+    if changes is not None:
+        changes[target.id] = snapshot_car(target)
+
+
+@event.listens_for(Car, 'after_delete')
+def _record_delete(mapper, connection, target):
+    changes = _pending_changes(target, connection)
+    if changes is not None:
+        changes[target.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if not changes:
+        return
+
+    _bump_generation()
+    upserted = [snapshot for snapshot in changes.values() if snapshot is not None]
+    deleted_ids = [car_id for car_id, snapshot in changes.items() if snapshot is None]
+
+    for callback in list(_change_subscribers):
+        try:
+            callback(upserted, deleted_ids)
+        except Exception as e:
+            print(f"خطأ في معالجة تغييرات الكتالوج: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,110 @@
+"""
+طلبات GET الشرطية (ETag / Last-Modified) لصفحات السيارات وواجهات API
+المتحقق (validator) لكل مسار يحسب الوسم من بيانات صغيرة (رقم السيارة و updated_at) مع رقم إصدار
+الكتالوج، فإذا طابق If-None-Match أو If-Modified-Since أعيد 304 قبل تنفيذ المسار (بلا قالب ولا استعلامات
+غير قراءة updated_at وإصدار الكتالوج بالمفتاح الأساسي)
+إصدار الكتالوج من قاعدة البيانات (CatalogState) لا من حالة العملية، فكل العمليات تعطي نفس الوسم
+لنفس الكتالوج ويتغير الوسم فور تأكيد أي تغيير في أي عملية
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple
+from flask import current_app, make_response, request, session
+from catalog_events import stored_catalog_version
+from models import Car, db
+
+# المتحقق يعيد (أجزاء الوسم، آخر تعديل أو None)، أو None لتنفيذ المسار كالمعتاد (مثل سيارة غير موجودة)
+# آخر تعديل يعاد فقط إذا تغير (بدقة الثانية) مع كل تغير في الوسم، وإلا أعطى If-Modified-Since وحده 304 قديماً
+Validators = Tuple[Tuple[Any, ...], Optional[datetime]]
+
+
+def _as_utc(value: datetime) -> datetime:
+    """التواريخ في قاعدة البيانات UTC بلا منطقة زمنية، و HTTP بدقة الثانية"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+class ConditionalGet:
+    """حساب ETag و Last-Modified للمسارات المسجلة بـ conditional والرد بـ 304 عند التطابق"""
+
+    def __init__(self):
+        self.enabled = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CONDITIONAL_GET_ENABLED', False)
+
+    def catalog_version(self) -> str:
+        """إصدار الكتالوج المشترك بين العمليات"""
+        return stored_catalog_version(db.session)
+
+    def make_etag(self, parts: Tuple[Any, ...]) -> str:
+        # full_path: نفس المسار بمعاملات مختلفة (صفحة، مؤشر) محتوى مختلف
+        key = repr((request.full_path, self.catalog_version()) + tuple(parts))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    def conditional(self, validators: Callable[..., Optional[Validators]], private: bool = False):
+        """
+        مزخرف مسار GET: validators(**view_args) تحسب أجزاء الوسم
+        private للصفحات التي تعتمد على الجلسة (تخزن في متصفح الزائر فقط، ولا 304 مع رسائل flash معلقة)
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method not in ('GET', 'HEAD') \
+                        or (private and session.get('_flashes')):
+                    return view(*args, **kwargs)
+
+                found = validators(*args, **kwargs)
+                if found is None:
+                    return view(*args, **kwargs)
+                parts, last_modified = found
+                if private:
+                    parts = tuple(parts) + (bool(session.get('admin_logged_in')),)
+                etag = self.make_etag(parts)
+                last_modified = _as_utc(last_modified) if last_modified else None
+
+                if self._not_modified(etag, last_modified):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                # إعادة التحقق عند كل استخدام: الوسم هو ما يوفر الإرسال وليس مدة التخزين
+                response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+        # If-None-Match يتقدم على If-Modified-Since عند إرسالهما معاً (RFC 9110)
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        since = request.if_modified_since
+        return bool(last_modified and since and last_modified <= since)
+
+
+def car_validators(car_id: int, **_) -> Optional[Validators]:
+    """
+    متحقق صفحات السيارة الواحدة: updated_at باستعلام بالمفتاح الأساسي
+    بلا Last-Modified: الصفحة تعرض سيارات مشابهة تتغير مع الكتالوج، وتعديلان في نفس الثانية
+    لا يغيران updated_at بدقة HTTP، فالوسم وحده يحدد 304
+    """
+    row = db.session.query(Car.updated_at).filter(Car.id == car_id).first()
+    if row is None:
+        return None
+    return (row[0],), None
+
+
+def catalog_validators(*_, **__) -> Optional[Validators]:
+    """متحقق المسارات التي تعتمد على الكتالوج كله (القوائم وخيارات المرشحات)"""
+    return (), None
+
+
+# إنشاء مثيل عام من الطلبات الشرطية
+conditional_get = ConditionalGet()
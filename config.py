@@ -5,8 +5,70 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///car_store.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # مجمع اتصالات PostgreSQL لكل عملية (worker) ونسخة القراءة لصفحات القراءة العامة (انظر db_routing)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+    
+    # إعدادات اتصالات SQLite (انظر sqlite_tuning): WAL حتى لا ينتظر القراء كتابة سجل البحث
+    SQLITE_TUNING_ENABLED = os.environ.get('SQLITE_TUNING_ENABLED', '1') == '1'
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    
     # إعدادات التطبيق
     CARS_PER_PAGE = 12
+    # أقصى عدد سيارات في طلب واحد /api/cars?ids=1,2,3
+    MAX_BULK_CAR_IDS = 50
+    
+    # طلبات GET الشرطية (ETag / Last-Modified) لصفحات السيارات و /api: الوسم يتغير مع كل تغيير في الكتالوج
+    # (إصدار مشترك في قاعدة البيانات، فيلتقط تغييرات كل العمليات)
+    CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', '1') == '1'
+    
+    # فهرس البحث داخل الذاكرة (يعاد بناؤه كل SEARCH_INDEX_MAX_AGE ثانية لالتقاط تغييرات العمليات الأخرى)
+    SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', '1') == '1'
+    SEARCH_INDEX_MAX_AGE = int(os.environ.get('SEARCH_INDEX_MAX_AGE', 300))
+    
+    # البحث النصي الكامل في قاعدة البيانات (FTS5 في SQLite وفهارس pg_trgm في PostgreSQL)
+    # يستخدم في مسار قاعدة البيانات عندما يكون فهرس الذاكرة معطلاً
+    SEARCH_FULLTEXT_ENABLED = os.environ.get('SEARCH_FULLTEXT_ENABLED', '1') == '1'
+    
+    # ذاكرة نتائج البحث المؤقتة (تفرغ مع كل تغيير في السيارات، وحدها الأقصى بالبايت)
+    SEARCH_CACHE_ENABLED = os.environ.get('SEARCH_CACHE_ENABLED', '1') == '1'
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 60))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 2000))
+    SEARCH_CACHE_MAX_BYTES = int(os.environ.get('SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    
+    # كتابة سجل البحث في الخلفية بإدراج جماعي كل BATCH_SIZE سجل أو كل FLUSH_MS ملي ثانية
+    SEARCH_LOG_ASYNC = os.environ.get('SEARCH_LOG_ASYNC', '1') == '1'
+    SEARCH_LOG_BATCH_SIZE = int(os.environ.get('SEARCH_LOG_BATCH_SIZE', 100))
+    SEARCH_LOG_FLUSH_MS = int(os.environ.get('SEARCH_LOG_FLUSH_MS', 500))
+    SEARCH_LOG_MAX_QUEUE = int(os.environ.get('SEARCH_LOG_MAX_QUEUE', 10000))
+    
+    # تجميع سجل البحث (flask rollup-searches) ومدة الاحتفاظ بالسجلات الخام بعد تجميعها
+    SEARCH_ROLLUP_BATCH_SIZE = int(os.environ.get('SEARCH_ROLLUP_BATCH_SIZE', 1000))
+    SEARCH_LOG_RETENTION_DAYS = int(os.environ.get('SEARCH_LOG_RETENTION_DAYS', 30))
+    SEARCH_ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get('SEARCH_ROLLUP_HOURLY_RETENTION_DAYS', 90))
+    
+    # جدول السيارات المشابهة (أقرب K سيارة لكل سيارة، تحسب عند الطلب وفي خيط خلفي حتى PRECOMPUTE_LIMIT سيارة)
+    SIMILAR_CARS_ENABLED = os.environ.get('SIMILAR_CARS_ENABLED', '1') == '1'
+    SIMILAR_CARS_K = int(os.environ.get('SIMILAR_CARS_K', 8))
+    SIMILAR_CARS_MAX_AGE = int(os.environ.get('SIMILAR_CARS_MAX_AGE', 3600))
+    SIMILAR_CARS_PRECOMPUTE_LIMIT = int(os.environ.get('SIMILAR_CARS_PRECOMPUTE_LIMIT', 2000))
+    
+    # البحث المحفوظ: مطابقة السيارات الجديدة وصندوق الإشعارات الصادر
+    SAVED_SEARCHES_ENABLED = os.environ.get('SAVED_SEARCHES_ENABLED', '1') == '1'
+    SAVED_SEARCH_DRAIN_BATCH_SIZE = int(os.environ.get('SAVED_SEARCH_DRAIN_BATCH_SIZE', 100))
+    
+    # عدادات لوحة التحكم في الذاكرة (يعاد حسابها كل STATS_COUNTERS_MAX_AGE ثانية)
+    STATS_COUNTERS_MAX_AGE = int(os.environ.get('STATS_COUNTERS_MAX_AGE', 300))
     ADMIN_USERNAME = 'admin'
     ADMIN_PASSWORD = 'admin123'  # يجب تغييرها في الإنتاج
     
@@ -1,5 +1,8 @@
 from flask import Flask
-from models import db, Car, Admin, SearchLog
+from models import db, Car, Admin
+from catalog_events import notify_catalog_reset
+from fulltext import fulltext
+from schema_migrations import upgrade_schema
 from werkzeug.security import generate_password_hash
 import json
 
@@ -9,6 +12,12 @@ def init_database(app: Flask):
         # إنشاء الجداول
         db.create_all()
         
+        # الأعمدة والفهارس الجديدة في الجداول الموجودة وتعبئة الحقول المطبعة للسيارات القديمة
+        upgrade_schema()
+        
+        # فهرس البحث النصي الكامل (ينشأ ويعبأ عند أول تشغيل، قبل إضافة أي سيارة)
+        fulltext.install()
+        
         # إضافة بيانات تجريبية إذا لم تكن موجودة
         if Car.query.count() == 0:
             add_sample_cars()
@@ -308,6 +317,8 @@ def reset_database(app: Flask):
         db.create_all()
         add_sample_cars()
         add_default_admin()
+        fulltext.rebuild()
+        notify_catalog_reset()
         print("تم إعادة تعيين قاعدة البيانات بنجاح")
 
 def backup_database(app: Flask, backup_file: str):
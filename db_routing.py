@@ -0,0 +1,147 @@
+"""
+توجيه الاتصالات بين قاعدة البيانات الرئيسية ونسخة القراءة (PostgreSQL)
+صفحات القراءة العامة (البحث، تفاصيل السيارة، طلبات GET في /api) تقرأ من نسخة القراءة
+DATABASE_REPLICA_URL إن وجدت، وكل كتابة (flush) تذهب للرئيسية وتبقي بقية الطلب عليها
+جلسات المدير تبقى على الرئيسية دائماً، والزائر الذي كتب شيئاً (طلب إضافة، بحث محفوظ) يبقى
+عليها DB_REPLICA_STICKY_SECONDS ثانية حتى يرى ما كتبه رغم تأخر النسخة
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+# مفتاح نسخة القراءة في SQLALCHEMY_BINDS (لا تربط به أي جداول، فلا ينشئها create_all)
+REPLICA_BIND = 'replica'
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# صفحات القراءة في app.py (إضافة إلى كل طلبات GET في /api عدا /api/admin)
+READ_ONLY_ENDPOINTS = frozenset({'index', 'search', 'car_details', 'compare_cars'})
+
+# توجيه مفروض داخل كتلة use_primary / use_replica (يتقدم على توجيه الطلب)
+_forced_route: ContextVar[Optional[str]] = ContextVar('db_forced_route', default=None)
+
+
+def pool_options(config) -> Dict[str, Any]:
+    """إعدادات QueuePool لمحرك PostgreSQL في كل عملية (worker) من DB_POOL_*"""
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_POOL_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        # إغلاق الاتصالات الأقدم من pool_recycle قبل أن يقطعها الخادم أو الموازن
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        # فحص الاتصال قبل استخدامه بدلاً من فشل أول استعلام بعد انقطاعه
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+
+
+def _is_postgresql(uri: Optional[str]) -> bool:
+    return str(uri or '').startswith(('postgresql', 'postgres'))
+
+
+@contextmanager
+def use_primary():
+    """
+    قراءة من الرئيسية داخل الكتلة مهما كان توجيه الطلب
+    (للبيانات المشتقة طويلة العمر مثل فهرس البحث: بناؤها من نسخة متأخرة يثبت بيانات قديمة حتى إعادة البناء)
+    """
+    token = _forced_route.set(PRIMARY)
+    try:
+        yield
+    finally:
+        _forced_route.reset(token)
+
+
+@contextmanager
+def use_replica():
+    """قراءة من نسخة القراءة داخل الكتلة (إن كانت مفعلة) خارج صفحات القراءة"""
+    token = _forced_route.set(REPLICA)
+    try:
+        yield
+    finally:
+        _forced_route.reset(token)
+
+
+def current_route() -> str:
+    """التوجيه الحالي: المفروض بكتلة، ثم توجيه الطلب، والرئيسية خارج الطلبات (الأوامر والخيوط الخلفية)"""
+    forced = _forced_route.get()
+    if forced is not None:
+        return forced
+    if has_request_context():
+        return g.get('db_route', PRIMARY)
+    return PRIMARY
+
+
+class RoutingSession(Session):
+    """جلسة Flask-SQLAlchemy ترسل القراءات إلى نسخة القراءة حسب current_route والكتابة إلى الرئيسية"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writing = self._flushing or isinstance(clause, UpdateBase)
+            if writing:
+                if has_request_context():
+                    # ما بعد الكتابة في نفس الطلب يقرأ من الرئيسية حتى يرى ما كتب
+                    g.db_route = PRIMARY
+                    g.db_wrote = True
+            elif current_route() == REPLICA and REPLICA_BIND in self._db.engines:
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+class DatabaseRouting:
+    """إعداد مجمع الاتصالات ونسخة القراءة، واختيار التوجيه لكل طلب"""
+
+    def __init__(self):
+        self.replica_enabled = False
+        self.sticky_seconds = 10
+
+    def init_app(self, app):
+        """
+        إضافة إعدادات المجمع ونسخة القراءة إلى إعدادات التطبيق
+        يستدعى قبل db.init_app لأن Flask-SQLAlchemy ينشئ المحركات عنده
+        """
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+        replica_url = app.config.get('DATABASE_REPLICA_URL')
+        self.sticky_seconds = app.config.get('DB_REPLICA_STICKY_SECONDS', 10)
+        self.replica_enabled = bool(replica_url)
+
+        if _is_postgresql(uri):
+            # الإعدادات الصريحة في SQLALCHEMY_ENGINE_OPTIONS تتقدم على DB_POOL_*
+            options = pool_options(app.config)
+            options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        if self.replica_enabled:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds[REPLICA_BIND] = dict(pool_options(app.config), url=replica_url) \
+                if _is_postgresql(replica_url) else replica_url
+            app.config['SQLALCHEMY_BINDS'] = binds
+            app.before_request(self._choose_route)
+            app.after_request(self._remember_write)
+
+    def _choose_route(self):
+        g.db_route = REPLICA if self._is_read_only_request() else PRIMARY
+
+    def _is_read_only_request(self) -> bool:
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if not (request.endpoint in READ_ONLY_ENDPOINTS
+                or (request.path.startswith('/api/') and not request.path.startswith('/api/admin'))):
+            return False
+        if session.get('admin_logged_in'):
+            return False
+        return session.get('db_primary_until', 0) <= time.time()
+
+    def _remember_write(self, response):
+        # كتابات GET (سجل البحث) لا تثبت الزائر على الرئيسية، فقط ما يرسله هو
+        if g.get('db_wrote') and request.method not in ('GET', 'HEAD') and not session.get('admin_logged_in'):
+            session['db_primary_until'] = time.time() + self.sticky_seconds
+        return response
+
+
+# إنشاء مثيل عام من توجيه قاعدة البيانات
+db_routing = DatabaseRouting()
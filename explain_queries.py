@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+فحص خطط تنفيذ استعلامات متجر السيارات
+يشغل صفحات app.py ومسارات قاعدة البيانات في search_engine.py (مع تعطيل فهرس الذاكرة والذاكرة المؤقتة)
+ويلتقط كل استعلام SELECT منفذ، ثم يطلب خطة تنفيذه ويفشل إذا قرأ أي استعلام جدولاً كاملاً
+الاستخدام: python explain_queries.py [--database-url URL] [--verbose]
+(بدون --database-url تستخدم قاعدة SQLite مؤقتة بالبيانات التجريبية)
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+# إضافة المجلد الحالي إلى مسار Python
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# القراءة الكاملة المقبولة: (نمط نص الاستعلام، الجدول، السبب)
+ALLOWED_SCANS = (
+    (r'SELECT DISTINCT cars\.\w+ AS \w+ FROM cars$', 'cars',
+     'خيارات المرشحات: القيم الفريدة لكل السيارات، تحسب مرة كل filter_options_max_age ثانية'),
+    (r'SELECT min\(cars\.(year|price)\) AS min_1, max\(cars\.\1\) AS max_1 FROM cars', 'cars',
+     'خيارات المرشحات: نطاق السنوات والأسعار لكل السيارات (محفوظ مع الخيارات)'),
+    (r'SELECT DISTINCT cars\.(brand|name) AS \w+ FROM cars WHERE \(?cars\.\w+_normalized LIKE', 'cars',
+     "اقتراحات البحث بدون فهرس الذاكرة: LIKE '%نص%' لا يخدمه فهرس (المسار الأساسي فهرس الذاكرة)"),
+)
+
+# ترتيبات البحث الممررة إلى search_engine (مع صفحة أولى وصفحة بالمؤشر)
+SEARCH_CRITERIA = (
+    {},
+    {'brand': 'تويوتا'},
+    {'search_text': 'كورولا'},
+    {'budget': '20000', 'year_from': '2018'},
+    {'car_type': ['sedan', 'suv'], 'fuel_type': 'gasoline'},
+    {'color': 'ابيض', 'country_origin': 'اليابان'},
+    {'mileage_max': '80000', 'gps_system': True, 'backup_camera': True},
+)
+
+
+def _is_select(statement):
+    return statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def capture_queries(app, run):
+    """تنفيذ run() وإرجاع استعلامات SELECT المنفذة (نص الاستعلام -> المعاملات) بلا تكرار"""
+    from sqlalchemy import event
+    from models import db
+
+    captured = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and _is_select(statement):
+            captured.setdefault(statement, parameters)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return captured
+
+
+def sample_ids(app):
+    """أرقام سجلات موجودة تستخدم في الروابط (تقرأ قبل التقاط الاستعلامات)"""
+    from models import Admin, Car, CarSubmission
+
+    with app.app_context():
+        car = Car.query.first()
+        admin = Admin.query.first()
+        submission = CarSubmission.query.first()
+        return {
+            'car': car.id if car else 1,
+            'cars': [car.id for car in Car.query.limit(3)],
+            'admin': admin.id if admin else None,
+            'submission': submission.id if submission else None,
+        }
+
+
+def exercise_search_engine(app, ids):
+    """مسارات قاعدة البيانات في محرك البحث: كل الترتيبات، الصفحة التالية بالمؤشر، الاقتراحات والمشابهة"""
+    from search_engine import search_engine
+
+    with app.app_context():
+        search_engine.invalidate_filter_options()
+        search_engine.get_filter_options()
+        for criteria in SEARCH_CRITERIA:
+            for sort_by in search_engine.valid_sorts:
+                result = search_engine.search(dict(criteria), per_page=2, sort_by=sort_by)
+                search_engine.search(dict(criteria), per_page=2, sort_by=sort_by, cursor='')
+                if result.get('next_cursor'):
+                    search_engine.search(dict(criteria), per_page=2, sort_by=sort_by,
+                                         cursor=result['next_cursor'])
+        search_engine.get_search_suggestions('تويو')
+        search_engine.get_similar_cars(ids['car'])
+
+
+def exercise_pages(app, ids):
+    """صفحات app.py التي تقرأ فقط (العامة ولوحة التحكم بجلسة مدير)"""
+    car_id = ids['car']
+    client = app.test_client()
+    urls = ['/', '/search', '/search?sort_by=price_asc&brand=تويوتا', f'/car/{car_id}',
+            '/api/search_suggestions?q=تويو', '/api/latest-cars', '/api/latest-cars?cursor=',
+            '/api/cars?ids=' + ','.join(str(car_id) for car_id in ids['cars']),
+            '/compare?cars=' + ','.join(str(car_id) for car_id in ids['cars']),
+            '/submit-car', '/track/CAR-00000000', '/health/db']
+    if ids['admin'] is not None:
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+            session['admin_id'] = ids['admin']
+        urls += ['/admin/dashboard', '/admin/cars', '/admin/cars?cursor=', f'/admin/cars/edit/{car_id}',
+                 '/admin/submissions', '/admin/submissions?status=pending',
+                 '/admin/submissions?status=pending&cursor=']
+        if ids['submission'] is not None:
+            urls.append(f"/admin/submissions/{ids['submission']}")
+    for url in urls:
+        client.get(url)
+
+
+def _explain_sqlite(connection, statement, parameters):
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    plan = [row[-1] for row in rows]
+    tables = '|'.join(re.escape(name) for name in _table_names())
+    # SCAN بلا فهرس = قراءة الجدول كاملاً ("SCAN cars USING INDEX" مرور مرتب على فهرس ينتهي بـ LIMIT)
+    full_scans = [match.group(1) for line in plan
+                  for match in [re.match(rf'SCAN ({tables})\b(?! USING)', line)] if match]
+    return plan, full_scans
+
+
+def _explain_postgresql(connection, statement, parameters):
+    # الجداول الصغيرة تقرأ بالكامل دائماً، فيمنع Seq Scan حتى يظهر فقط ما لا يخدمه أي فهرس
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).all()
+    plan = [row[0] for row in rows]
+    full_scans = [match.group(1) for line in plan
+                  for match in [re.search(r'Seq Scan on (\w+)', line)] if match
+                  and match.group(1) in _table_names()]
+    return plan, full_scans
+
+
+def _table_names():
+    from models import db
+    return set(db.metadata.tables)
+
+
+def _summary(statement):
+    """الاستعلام في سطر واحد بدون قائمة الأعمدة الطويلة"""
+    statement = ' '.join(statement.split())
+    statement = re.sub(r'^SELECT (.+?) FROM ', lambda match: 'SELECT ' + (
+        match.group(1) if len(match.group(1)) <= 60 else '...') + ' FROM ', statement)
+    return statement[:240]
+
+
+def _allowed(statement, table):
+    statement = ' '.join(statement.split())
+    return any(table == allowed_table and re.search(pattern, statement)
+               for pattern, allowed_table, _ in ALLOWED_SCANS)
+
+
+def explain_all(app, queries, verbose=False):
+    """خطة كل استعلام وإرجاع قائمة (الاستعلام، الجداول المقروءة كاملة) غير المسموح بها"""
+    from models import db
+
+    failures = []
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            raise RuntimeError(f"قاعدة بيانات غير مدعومة في الفحص: {dialect}")
+        explain = _explain_sqlite if dialect == 'sqlite' else _explain_postgresql
+        for statement, parameters in queries.items():
+            with db.engine.begin() as connection:
+                plan, full_scans = explain(connection, statement, parameters)
+            rejected = [table for table in full_scans if not _allowed(statement, table)]
+            if rejected:
+                failures.append((statement, rejected))
+            if verbose or rejected:
+                marker = '❌' if rejected else '✅'
+                print(f"\n{marker} {_summary(statement)}")
+                for line in plan:
+                    print(f"    {line}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='فحص خطط تنفيذ استعلامات متجر السيارات')
+    parser.add_argument('--database-url', help='قاعدة البيانات المفحوصة (الافتراضي SQLite مؤقتة)')
+    parser.add_argument('--verbose', action='store_true', help='طباعة خطة كل استعلام')
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        temp_dir = tempfile.mkdtemp(prefix='car-store-explain-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(temp_dir, 'explain.db')
+    # مسار قاعدة البيانات فقط: لا فهرس في الذاكرة ولا نتائج محفوظة ولا كتابة سجل في الخلفية
+    os.environ['SEARCH_INDEX_ENABLED'] = '0'
+    os.environ['SEARCH_CACHE_ENABLED'] = '0'
+    os.environ['SIMILAR_CARS_ENABLED'] = '0'
+    os.environ['SEARCH_LOG_ASYNC'] = '0'
+
+    try:
+        from app import app
+
+        ids = sample_ids(app)
+        queries = capture_queries(app, lambda: (exercise_search_engine(app, ids), exercise_pages(app, ids)))
+        print(f"📋 تم التقاط {len(queries)} استعلام مختلف")
+        failures = explain_all(app, queries, verbose=args.verbose)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print("\n" + "=" * 60)
+    if failures:
+        print(f"❌ {len(failures)} استعلام يقرأ جداول كاملة دون فهرس:")
+        for statement, tables in failures:
+            print(f"   - {', '.join(sorted(set(tables)))}: {_summary(statement)}")
+        return False
+    print("✅ لا يوجد استعلام يقرأ جدولاً كاملاً (عدا المسموح به):")
+    for _, table, reason in ALLOWED_SCANS:
+        print(f"   - {table}: {reason}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,62 @@
+"""
+حساب أعداد المرشحات (Facets) لنتائج البحث في تمريرة واحدة
+"""
+from typing import Any, Dict, Iterable, List, Optional
+from models import CAR_FEATURES
+
+FACET_COLUMNS = ('brand', 'fuel_type', 'transmission', 'car_type', 'performance_level')
+
+# حدود فئات السعر بالدينار الكويتي (الفئة الأخيرة مفتوحة)
+PRICE_BUCKETS = (0, 2000, 5000, 10000, 15000, 20000, 30000, 50000)
+
+# عدد السنوات في كل فئة من فئات سنة الصنع
+YEAR_BUCKET_SIZE = 5
+
+
+class FacetCounter:
+    """يجمع الأعداد لكل قيمة ولكل ميزة ولفئات السعر والسنة أثناء المرور على النتائج"""
+
+    def __init__(self):
+        self.values: Dict[str, Dict[Any, int]] = {column: {} for column in FACET_COLUMNS}
+        self.features: Dict[str, int] = {feature: 0 for feature in CAR_FEATURES}
+        self.price_counts = [0] * len(PRICE_BUCKETS)
+        self.year_counts: Dict[int, int] = {}
+
+    def add(self, values: Dict[str, Any], price: Optional[float], year: Optional[int],
+            features: Iterable[str]):
+        """إضافة سيارة واحدة: values قيم أعمدة FACET_COLUMNS و features الميزات المتوفرة"""
+        for column in FACET_COLUMNS:
+            value = values.get(column)
+            if value:
+                counts = self.values[column]
+                counts[value] = counts.get(value, 0) + 1
+
+        for feature in features:
+            self.features[feature] += 1
+
+        if price is not None and price == price:
+            bucket = len(PRICE_BUCKETS) - 1
+            while bucket > 0 and price < PRICE_BUCKETS[bucket]:
+                bucket -= 1
+            self.price_counts[bucket] += 1
+
+        if year is not None and year == year:
+            start = int(year) - int(year) % YEAR_BUCKET_SIZE
+            self.year_counts[start] = self.year_counts.get(start, 0) + 1
+
+    def result(self) -> Dict[str, Any]:
+        facets: Dict[str, Any] = {column: dict(counts) for column, counts in self.values.items()}
+        facets['features'] = dict(self.features)
+
+        price: List[Dict[str, Any]] = []
+        for bucket, count in enumerate(self.price_counts):
+            if count:
+                upper = PRICE_BUCKETS[bucket + 1] if bucket + 1 < len(PRICE_BUCKETS) else None
+                price.append({'min': PRICE_BUCKETS[bucket], 'max': upper, 'count': count})
+        facets['price'] = price
+
+        facets['year'] = [
+            {'min': start, 'max': start + YEAR_BUCKET_SIZE - 1, 'count': self.year_counts[start]}
+            for start in sorted(self.year_counts)
+        ]
+        return facets
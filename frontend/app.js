@@ -1,7 +1,10 @@
 // Configuration
 const API_BASE_URL = 'https://your-railway-app.up.railway.app'; // Replace with your Railway API URL
-let currentPage = 1;
+let currentCursor = '';
 let currentFilters = {};
+let currentEndpoint = '/api/cars';
+let previousCursors = []; // مؤشرات الصفحات السابقة للرجوع
+let nextCursor = null;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -48,24 +51,25 @@ async function apiCall(endpoint, options = {}) {
     }
 }
 
-// Load cars from API
-async function loadCars(page = 1, filters = {}) {
+// Load cars from API (cursor pagination: each page starts right after the previous one)
+async function loadCars(cursor = '', filters = {}, endpoint = '/api/cars') {
     showLoading();
     hideError();
     
     try {
         // Build query parameters
         const params = new URLSearchParams({
-            page: page,
+            cursor: cursor,
             per_page: 12,
             ...filters
         });
         
-        const data = await apiCall(`/api/cars?${params}`);
+        const data = await apiCall(`${endpoint}?${params}`);
+        currentCursor = cursor;
+        currentFilters = filters;
+        currentEndpoint = endpoint;
         displayCars(data.cars);
         displayPagination(data);
-        currentPage = page;
-        currentFilters = filters;
     } catch (error) {
         showError('فشل في تحميل السيارات');
     } finally {
@@ -88,26 +92,20 @@ async function searchCars() {
         if (!filters[key]) delete filters[key];
     });
     
-    try {
-        showLoading();
-        hideError();
-        
-        const params = new URLSearchParams({
-            page: 1,
-            per_page: 12,
-            ...filters
-        });
-        
-        const data = await apiCall(`/api/search?${params}`);
-        displayCars(data.cars);
-        displayPagination(data);
-        currentPage = 1;
-        currentFilters = filters;
-    } catch (error) {
-        showError('فشل في البحث عن السيارات');
-    } finally {
-        hideLoading();
-    }
+    previousCursors = [];
+    await loadCars('', filters, '/api/search');
+}
+
+// Next / previous page using the cursors returned by the API
+function loadNextPage() {
+    if (!nextCursor) return;
+    previousCursors.push(currentCursor);
+    loadCars(nextCursor, currentFilters, currentEndpoint);
+}
+
+function loadPreviousPage() {
+    if (previousCursors.length === 0) return;
+    loadCars(previousCursors.pop(), currentFilters, currentEndpoint);
 }
 
 // Load filter options
@@ -175,8 +173,9 @@ function displayCars(cars) {
 // Display pagination
 function displayPagination(data) {
     const pagination = document.getElementById('pagination');
+    nextCursor = data.next_cursor || null;
     
-    if (data.pages <= 1) {
+    if (!nextCursor && previousCursors.length === 0) {
         pagination.innerHTML = '';
         return;
     }
@@ -184,31 +183,26 @@ function displayPagination(data) {
     let paginationHTML = '<nav><ul class="pagination">';
     
     // Previous button
-    if (data.has_prev) {
+    if (previousCursors.length > 0) {
         paginationHTML += `
             <li class="page-item">
-                <a class="page-link" href="#" onclick="loadCars(${data.page - 1}, currentFilters)">السابق</a>
+                <a class="page-link" href="#" onclick="loadPreviousPage(); return false;">السابق</a>
             </li>
         `;
     }
     
-    // Page numbers
-    const startPage = Math.max(1, data.page - 2);
-    const endPage = Math.min(data.pages, data.page + 2);
-    
-    for (let i = startPage; i <= endPage; i++) {
-        paginationHTML += `
-            <li class="page-item ${i === data.page ? 'active' : ''}">
-                <a class="page-link" href="#" onclick="loadCars(${i}, currentFilters)">${i}</a>
-            </li>
-        `;
-    }
+    // Current page number
+    paginationHTML += `
+        <li class="page-item active">
+            <span class="page-link">${previousCursors.length + 1}</span>
+        </li>
+    `;
     
     // Next button
-    if (data.has_next) {
+    if (nextCursor) {
         paginationHTML += `
             <li class="page-item">
-                <a class="page-link" href="#" onclick="loadCars(${data.page + 1}, currentFilters)">التالي</a>
+                <a class="page-link" href="#" onclick="loadNextPage(); return false;">التالي</a>
             </li>
         `;
     }
@@ -0,0 +1,170 @@
+"""
+البحث النصي الكامل داخل قاعدة البيانات
+SQLite: جدول FTS5 بمقسم trigram، PostgreSQL: فهارس GIN بـ pg_trgm على الأعمدة المطبعة
+كلاهما يطابق نفس قاعدة نص البحث في car_criteria (normalize_search_text جزءاً من TEXT_SEARCH_COLUMNS)
+فتتطابق النتائج مع فهرس الذاكرة و LIKE، والترتيب بالصلة من text_relevance في كل المسارات
+جدول FTS5 يحدث داخل نفس معاملة إضافة/تعديل/حذف السيارة، وفهارس pg_trgm يحدثها PostgreSQL نفسه
+"""
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import Integer, event, select, text
+from car_criteria import TEXT_SEARCH_COLUMNS, normalize_search_text
+from models import Car, db
+
+# أعمدة المستند المفهرس (بنفس ترتيب TEXT_SEARCH_COLUMNS): الاسم، الماركة، الموديل
+DOCUMENT_FIELDS = tuple(column.replace('_normalized', '') for column in TEXT_SEARCH_COLUMNS)
+
+
+def car_document(car) -> Dict[str, Any]:
+    """النصوص المطبعة التي تفهرس لكل سيارة (من كائن Car أو صف بنفس الأعمدة)"""
+    document = {field: getattr(car, column) or '' for field, column in zip(DOCUMENT_FIELDS, TEXT_SEARCH_COLUMNS)}
+    document['car_id'] = car.id
+    return document
+
+
+def car_documents(cars: Iterable) -> List[Dict[str, Any]]:
+    """نفس car_document لمجموعة سيارات"""
+    return [car_document(car) for car in cars]
+
+
+class SQLiteFTS5Backend:
+    """
+    جدول FTS5 بمقسم trigram: العبارة بين علامتي تنصيص تطابق أي جزء من النص مثل LIKE '%x%'
+    (يتطلب SQLite 3.34؛ المقسمات الأخرى تطابق بدايات الكلمات فقط فلا تستخدم)
+    """
+
+    table = 'cars_fts'
+
+    def install(self, connection):
+        # جدول قديم بأعمدة مختلفة (كان يفهرس الوصف) يعاد إنشاؤه ويعبأ من جديد
+        columns = tuple(row[1] for row in connection.execute(text(f"PRAGMA table_info({self.table})")))
+        if columns and columns != DOCUMENT_FIELDS:
+            connection.execute(text(f"DROP TABLE {self.table}"))
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5({', '.join(DOCUMENT_FIELDS)}, tokenize='trigram')"
+        ))
+
+    def is_empty(self, connection) -> bool:
+        return connection.execute(text(f"SELECT count(*) FROM {self.table}")).scalar() == 0
+
+    def upsert(self, connection, document: Dict[str, Any]):
+        self.delete(connection, document['car_id'])
+        connection.execute(text(
+            f"INSERT INTO {self.table} (rowid, {', '.join(DOCUMENT_FIELDS)}) "
+            f"VALUES (:car_id, {', '.join(':' + field for field in DOCUMENT_FIELDS)})"
+        ), document)
+
+    def delete(self, connection, car_id: int):
+        connection.execute(text(f"DELETE FROM {self.table} WHERE rowid = :car_id"), {'car_id': car_id})
+
+    def clear(self, connection):
+        connection.execute(text(f"DELETE FROM {self.table}"))
+
+    def match(self, search_text: str):
+        """
+        استعلام فرعي (car_id) للسيارات المطابقة
+        يعيد None إذا تعذر خدمة النص من الفهرس (فيستخدم LIKE بنفس القاعدة)
+        """
+        normalized = normalize_search_text(search_text)
+        # المقسم الثلاثي لا يطابق نصاً أقصر من ثلاثة أحرف
+        if len(normalized) < 3:
+            return None
+        expression = '"' + normalized.replace('"', '""') + '"'
+        return text(
+            f"SELECT rowid AS car_id FROM {self.table} WHERE {self.table} MATCH :fts_query"
+        ).bindparams(fts_query=expression).columns(car_id=Integer).subquery('fts')
+
+
+def install_trigram_indexes(connection):
+    """
+    فهارس GIN بـ pg_trgm على الأعمدة المطبعة في جدول السيارات نفسه: تخدم شرط LIKE '%x%'
+    مباشرة، فلا جدول مستندات يحدث ولا استعلام مطابقة منفصل في PostgreSQL
+    """
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for column in TEXT_SEARCH_COLUMNS:
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_cars_{column}_trgm ON cars USING GIN ({column} gin_trgm_ops)"
+        ))
+    # جدول tsvector السابق (مطابقة بدايات الكلمات مع الوصف) لم يعد مستخدماً
+    connection.execute(text("DROP TABLE IF EXISTS car_search_documents"))
+
+
+class FullTextSearch:
+    """
+    اختيار البحث النصي حسب قاعدة البيانات المستخدمة:
+    SQLite جدول FTS5 يحدث مع السيارات (backend)، و PostgreSQL فهارس pg_trgm فقط (trigram_indexes)
+    """
+
+    def __init__(self):
+        self.backend: Optional[SQLiteFTS5Backend] = None
+        self.trigram_indexes = False
+
+    def init_app(self, app):
+        """تفعيل المحرك المناسب لـ SQLALCHEMY_DATABASE_URI عند SEARCH_FULLTEXT_ENABLED"""
+        self.backend = None
+        self.trigram_indexes = False
+        if not app.config.get('SEARCH_FULLTEXT_ENABLED', False):
+            return
+
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        if uri.startswith('sqlite'):
+            if sqlite3.sqlite_version_info >= (3, 34, 0):
+                self.backend = SQLiteFTS5Backend()
+            else:
+                print(f"البحث النصي الكامل يتطلب SQLite 3.34 (مقسم trigram)، الإصدار الحالي {sqlite3.sqlite_version}")
+        elif uri.startswith(('postgresql', 'postgres')):
+            self.trigram_indexes = True
+
+    def install(self):
+        """إنشاء الفهرس وتعبئته من السيارات الموجودة إذا كان فارغاً"""
+        try:
+            if self.trigram_indexes:
+                with db.engine.begin() as connection:
+                    install_trigram_indexes(connection)
+            if self.backend is not None:
+                with db.engine.begin() as connection:
+                    self.backend.install(connection)
+                    if self.backend.is_empty(connection):
+                        self._fill(connection)
+        except Exception as e:
+            print(f"تعذر تفعيل البحث النصي الكامل: {e}")
+            self.backend = None
+            self.trigram_indexes = False
+
+    def rebuild(self):
+        """إعادة تعبئة الفهرس بالكامل (بعد إعادة تعيين قاعدة البيانات أو الحذف الجماعي)"""
+        if self.backend is None:
+            return
+        with db.engine.begin() as connection:
+            self.backend.install(connection)
+            self.backend.clear(connection)
+            self._fill(connection)
+
+    def match(self, search_text: str):
+        if self.backend is None or not search_text:
+            return None
+        return self.backend.match(search_text)
+
+    def _fill(self, connection):
+        # القراءة من نفس الاتصال حتى لا تتعارض أقفال SQLite مع جلسة أخرى
+        rows = connection.execute(select(Car.id, *[getattr(Car, column) for column in TEXT_SEARCH_COLUMNS]))
+        for document in car_documents(rows.all()):
+            self.backend.upsert(connection, document)
+
+
+# إنشاء مثيل عام من البحث النصي الكامل
+fulltext = FullTextSearch()
+
+
+@event.listens_for(Car, 'after_insert')
+@event.listens_for(Car, 'after_update')
+def _index_car(mapper, connection, target):
+    if fulltext.backend is not None:
+        fulltext.backend.upsert(connection, car_document(target))
+
+
+@event.listens_for(Car, 'after_delete')
+def _unindex_car(mapper, connection, target):
+    if fulltext.backend is not None:
+        fulltext.backend.delete(connection, target.id)
@@ -0,0 +1,161 @@
+"""
+ترتيب "الأفضل مطابقة" للسيارات حسب معايير البحث
+كل سيارة مرشحة تأخذ درجة من: قرب السعر من الميزانية، قرب سنة الصنع من السنة المفضلة،
+قلة المسافة المقطوعة، وعدد الميزات المطلوبة الموجودة فيها
+الحساب يتم على أعمدة كاملة دفعة واحدة (بـ NumPy إن كانت مثبتة، وإلا بحلقة Python بنفس الصيغ)
+"""
+import heapq
+import math
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+from models import CAR_FEATURES
+
+try:
+    import numpy as np
+except ImportError:  # NumPy اختيارية: الترتيب يعمل بدونها بنفس النتيجة
+    np = None
+
+# اسم الترتيب في CarSearchEngine.valid_sorts
+BEST_MATCH_SORT = 'best_match'
+
+# أوزان مكونات الدرجة
+BUDGET_WEIGHT = 3.0
+YEAR_WEIGHT = 2.0
+MILEAGE_WEIGHT = 1.5
+FEATURES_WEIGHT = 1.0
+
+# فرق السنوات الذي تصبح عنده درجة السنة صفراً
+YEAR_SPAN = 15.0
+# المسافة التي تصبح عندها درجة المسافة صفراً (ما لم يحدد mileage_max)
+MILEAGE_SCALE = 200000.0
+
+# أقل عدد من الصفوف يستحق تحويل الأعمدة إلى مصفوفات NumPy
+VECTORIZE_MIN_ROWS = 256
+
+# عدد البتات المضاءة لكل قيمة بايت (ميزات السيارة مخزنة كبتات في بايت واحد)
+_POPCOUNT = [bin(value).count('1') for value in range(256)]
+
+
+class MatchTargets(NamedTuple):
+    budget: Optional[float]
+    year: float
+    mileage_scale: float
+    features_mask: int
+    features_count: int
+
+
+def _positive(criteria: Dict[str, Any], key: str, cast) -> Optional[float]:
+    try:
+        value = cast(criteria[key]) if criteria.get(key) else None
+    except (ValueError, TypeError):
+        return None
+    return value if value is not None and value > 0 else None
+
+
+def match_targets(criteria: Dict[str, Any]) -> MatchTargets:
+    """القيم المستهدفة من المعايير (الميزانية، السنة المفضلة، مقياس المسافة، قناع الميزات)"""
+    budget = _positive(criteria, 'budget', float) or _positive(criteria, 'price_max', float)
+    year = _positive(criteria, 'year_to', int) or datetime.utcnow().year
+    mileage_scale = _positive(criteria, 'mileage_max', int) or MILEAGE_SCALE
+
+    features_mask = 0
+    for bit, feature in enumerate(CAR_FEATURES):
+        if criteria.get(feature):
+            features_mask |= 1 << bit
+
+    return MatchTargets(budget, float(year), float(mileage_scale), features_mask, _POPCOUNT[features_mask])
+
+
+def features_bits(values: Mapping[str, Any]) -> int:
+    """ميزات السيارة كبتات بترتيب CAR_FEATURES (نفس تخزين فهرس البحث)"""
+    bits = 0
+    for bit, feature in enumerate(CAR_FEATURES):
+        if values.get(feature):
+            bits |= 1 << bit
+    return bits
+
+
+def rank_rows(columns: Mapping[str, Sequence], rows: Sequence[int], criteria: Dict[str, Any],
+              limit: Optional[int] = None, vectorized: Optional[bool] = None) -> List[int]:
+    """
+    الصفوف rows مرتبة بالدرجة تنازلياً ثم برقم السيارة تصاعدياً
+    columns: أعمدة كاملة بالمفاتيح id, price, year, mileage, features (القيم الفارغة NaN أو None)
+    limit: أول limit صف فقط (يكفي لصفحة النتائج ويتجنب فرز كل المطابقات)
+    vectorized: فرض طريقة الحساب (None = NumPy للمجموعات الكبيرة إن وجدت)
+    """
+    if not rows or limit == 0:
+        return []
+    targets = match_targets(criteria)
+    if vectorized is None:
+        vectorized = np is not None and len(rows) >= VECTORIZE_MIN_ROWS
+    if vectorized:
+        return _rank_numpy(columns, rows, targets, limit)
+    return _rank_python(columns, rows, targets, limit)
+
+
+def _as_numpy(values: Sequence, dtype: str):
+    if isinstance(values, array):
+        return np.frombuffer(values, dtype=values.typecode)
+    return np.asarray([math.nan if value is None else value for value in values], dtype=dtype)
+
+
+def _rank_numpy(columns: Mapping[str, Sequence], rows: Sequence[int], targets: MatchTargets,
+                limit: Optional[int]) -> List[int]:
+    selected = np.asarray(rows, dtype=np.int64)
+    ids = _as_numpy(columns['id'], 'i8')[selected]
+    price = _as_numpy(columns['price'], 'f8')[selected].astype(np.float64)
+    year = _as_numpy(columns['year'], 'f8')[selected].astype(np.float64)
+    mileage = _as_numpy(columns['mileage'], 'f8')[selected].astype(np.float64)
+
+    # الفروق الكبيرة تقص عند 1 والقيم الفارغة تأخذ درجة صفر
+    score = np.zeros(len(selected), dtype=np.float64)
+    if targets.budget is not None:
+        budget_score = 1.0 - np.minimum(np.abs(price - targets.budget) / targets.budget, 1.0)
+        score += BUDGET_WEIGHT * np.nan_to_num(budget_score, nan=0.0)
+    year_score = 1.0 - np.minimum(np.abs(year - targets.year) / YEAR_SPAN, 1.0)
+    score += YEAR_WEIGHT * np.nan_to_num(year_score, nan=0.0)
+    mileage_score = 1.0 - np.minimum(np.maximum(mileage, 0.0) / targets.mileage_scale, 1.0)
+    score += MILEAGE_WEIGHT * np.nan_to_num(mileage_score, nan=0.0)
+    if targets.features_mask:
+        features = _as_numpy(columns['features'], 'u1')[selected].astype(np.int64)
+        present = np.asarray(_POPCOUNT, dtype=np.float64)[features & targets.features_mask]
+        score += FEATURES_WEIGHT * (present / targets.features_count)
+
+    keys = -score
+    if limit is not None and limit < len(keys):
+        # أول limit درجة بالتقسيم الجزئي، مع كل الصفوف المساوية لآخرها حتى يحسم رقم السيارة التعادل
+        threshold = np.partition(keys, limit - 1)[limit - 1]
+        candidates = np.flatnonzero(keys <= threshold)
+        order = candidates[np.lexsort((ids[candidates], keys[candidates]))][:limit]
+    else:
+        order = np.lexsort((ids, keys))
+    return selected[order].tolist()
+
+
+def _rank_python(columns: Mapping[str, Sequence], rows: Sequence[int], targets: MatchTargets,
+                 limit: Optional[int]) -> List[int]:
+    ids, price, year, mileage, features = (columns['id'], columns['price'], columns['year'],
+                                           columns['mileage'], columns['features'])
+
+    def closeness(value, target, span):
+        if value is None or math.isnan(value):
+            return 0.0
+        return 1.0 - min(abs(value - target) / span, 1.0)
+
+    keys = {}
+    for row in rows:
+        score = 0.0
+        if targets.budget is not None:
+            score += BUDGET_WEIGHT * closeness(price[row], targets.budget, targets.budget)
+        score += YEAR_WEIGHT * closeness(year[row], targets.year, YEAR_SPAN)
+        value = mileage[row]
+        if value is not None and not math.isnan(value):
+            score += MILEAGE_WEIGHT * (1.0 - min(max(value, 0.0) / targets.mileage_scale, 1.0))
+        if targets.features_mask:
+            score += FEATURES_WEIGHT * (_POPCOUNT[features[row] & targets.features_mask] / targets.features_count)
+        keys[row] = (-score, ids[row])
+
+    if limit is not None and limit < len(rows):
+        return heapq.nsmallest(limit, rows, key=keys.__getitem__)
+    return sorted(rows, key=keys.__getitem__)
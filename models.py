@@ -1,8 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from utils import normalize_arabic, create_search_terms
+from db_routing import RoutingSession
+from serializer import car_to_dict
 
-db = SQLAlchemy()
+# الجلسة توجه القراءات إلى نسخة القراءة عند تفعيلها (انظر db_routing)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# الميزات الإضافية (أعمدة منطقية في جدول السيارات)
+CAR_FEATURES = ('leather_seats', 'sunroof', 'gps_system', 'backup_camera',
+                'entertainment_system', 'safety_features')
 
 class Car(db.Model):
     """نموذج بيانات السيارة"""
@@ -30,6 +37,11 @@ class Car(db.Model):
     mileage = db.Column(db.Integer, default=0)  # المسافة المقطوعة بالكيلومتر
     country_origin = db.Column(db.String(50))  # بلد المنشأ
     
+    # نسخ مطبعة للمرشحات النصية (تحدث مع name_normalized وتعبأ للصفوف القديمة في schema_migrations)
+    model_normalized = db.Column(db.String(100))
+    color_normalized = db.Column(db.String(50))
+    country_normalized = db.Column(db.String(50))
+    
     # ميزات إضافية (Boolean fields)
     leather_seats = db.Column(db.Boolean, default=False)
     sunroof = db.Column(db.Boolean, default=False)
@@ -48,13 +60,30 @@ class Car(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # فهارس مسارات القراءة: كل استعلام عام يرشح is_available ويرتب بعمود ثم بالرقم (ترتيب keyset)،
+    # فيبدأ الفهرس بـ is_available ثم عمود الترتيب ثم id حتى تقرأ الصفحة من الفهرس بلا فرز
+    # فهارس المرشحات النصية: مساواة وبادئة على القيم المطبعة
+    # (text_pattern_ops في PostgreSQL حتى يخدم الفهرس LIKE 'بادئة%')
+    __table_args__ = (
+        db.Index('ix_cars_available_created_at', 'is_available', 'created_at', 'id'),
+        db.Index('ix_cars_available_price', 'is_available', 'price', 'id'),
+        db.Index('ix_cars_available_year', 'is_available', 'year', 'id'),
+        db.Index('ix_cars_available_mileage', 'is_available', 'mileage', 'id'),
+        db.Index('ix_cars_available_name', 'is_available', 'name', 'id'),
+        db.Index('ix_cars_available_featured', 'is_available', 'is_featured', 'created_at'),
+        db.Index('ix_cars_created_at', 'created_at', 'id'),  # قائمة لوحة التحكم (كل السيارات)
+        db.Index('ix_cars_model_normalized', 'model_normalized',
+                 postgresql_ops={'model_normalized': 'text_pattern_ops'}),
+        db.Index('ix_cars_color_normalized', 'color_normalized',
+                 postgresql_ops={'color_normalized': 'text_pattern_ops'}),
+        db.Index('ix_cars_country_normalized', 'country_normalized',
+                 postgresql_ops={'country_normalized': 'text_pattern_ops'}),
+    )
+    
     def __init__(self, **kwargs):
         super(Car, self).__init__(**kwargs)
         # تطبيع النصوص عند الإنشاء
-        if self.name:
-            self.name_normalized = normalize_arabic(self.name)
-        if self.brand:
-            self.brand_normalized = normalize_arabic(self.brand)
+        self.update_normalized_fields()
     
     def update_normalized_fields(self):
         """تحديث الحقول المطبعة"""
@@ -62,6 +91,9 @@ class Car(db.Model):
             self.name_normalized = normalize_arabic(self.name)
         if self.brand:
             self.brand_normalized = normalize_arabic(self.brand)
+        self.model_normalized = normalize_arabic(self.model) if self.model else None
+        self.color_normalized = normalize_arabic(self.color) if self.color else None
+        self.country_normalized = normalize_arabic(self.country_origin) if self.country_origin else None
     
     def get_search_terms(self):
         """الحصول على مصطلحات البحث للسيارة"""
@@ -77,112 +109,31 @@ class Car(db.Model):
         return list(set(terms))  # إزالة التكرار
     
     def matches_criteria(self, criteria):
-        """فحص ما إذا كانت السيارة تطابق المعايير المحددة"""
-        
-        # فحص الميزانية
-        if 'budget' in criteria and criteria['budget']:
-            if self.price > float(criteria['budget']):
-                return False
-        
-        # فحص مستوى الأداء
-        if 'performance_level' in criteria and criteria['performance_level']:
-            if self.performance_level != criteria['performance_level']:
-                return False
-        
-        # فحص نوع الوقود
-        if 'fuel_type' in criteria and criteria['fuel_type']:
-            if self.fuel_type != criteria['fuel_type']:
-                return False
-        
-        # فحص نوع الجير
-        if 'transmission' in criteria and criteria['transmission']:
-            if self.transmission != criteria['transmission']:
-                return False
-        
-        # فحص نوع السيارة
-        if 'car_type' in criteria and criteria['car_type']:
-            if self.car_type != criteria['car_type']:
-                return False
-        
-        # فحص سنة الصنع
-        if 'year_from' in criteria and criteria['year_from']:
-            if self.year < int(criteria['year_from']):
-                return False
-        
-        if 'year_to' in criteria and criteria['year_to']:
-            if self.year > int(criteria['year_to']):
-                return False
-        
-        # فحص الماركة
-        if 'brand' in criteria and criteria['brand']:
-            brand_normalized = normalize_arabic(criteria['brand'])
-            if brand_normalized not in self.brand_normalized:
-                return False
-        
-        # فحص اللون
-        if 'color' in criteria and criteria['color']:
-            color_normalized = normalize_arabic(criteria['color'])
-            car_color_normalized = normalize_arabic(self.color or '')
-            if color_normalized not in car_color_normalized:
-                return False
-        
-        # فحص عدد الأبواب
-        if 'doors' in criteria and criteria['doors']:
-            if self.doors != int(criteria['doors']):
-                return False
-        
-        # فحص الميزات الإضافية
-        feature_mapping = {
-            'leather_seats': self.leather_seats,
-            'sunroof': self.sunroof,
-            'gps_system': self.gps_system,
-            'backup_camera': self.backup_camera,
-            'entertainment_system': self.entertainment_system,
-            'safety_features': self.safety_features
-        }
-        
-        for feature, required in criteria.items():
-            if feature in feature_mapping and required:
-                if not feature_mapping[feature]:
-                    return False
-        
-        return True
+        """
+        فحص ما إذا كانت السيارة تطابق المعايير المحددة (بنفس قواعد مرشحات البحث)
+        لمطابقة سيارات كثيرة بنفس المعايير تترجم مرة واحدة: compile_criteria(criteria).filter_cars(cars)
+        """
+        from car_criteria import compile_criteria
+        return compile_criteria(criteria).matches(self)
     
     def to_dict(self):
-        """تحويل السيارة إلى قاموس"""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'brand': self.brand,
-            'model': self.model,
-            'year': self.year,
-            'price': self.price,
-            'performance_level': self.performance_level,
-            'fuel_type': self.fuel_type,
-            'transmission': self.transmission,
-            'engine_size': self.engine_size,
-            'doors': self.doors,
-            'car_type': self.car_type,
-            'color': self.color,
-            'mileage': self.mileage,
-            'country_origin': self.country_origin,
-            'leather_seats': self.leather_seats,
-            'sunroof': self.sunroof,
-            'gps_system': self.gps_system,
-            'backup_camera': self.backup_camera,
-            'entertainment_system': self.entertainment_system,
-            'safety_features': self.safety_features,
-            'description': self.description,
-            'image_url': self.image_url,
-            'is_available': self.is_available,
-            'is_featured': self.is_featured,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+        """تحويل السيارة إلى قاموس (ملمح full في serializer.py)"""
+        return car_to_dict(self)
     
     def __repr__(self):
         return f'<Car {self.name} - {self.year}>'
 
+class CatalogState(db.Model):
+    """
+    إصدار الكتالوج المشترك بين العمليات (صف واحد): يزيد في نفس معاملة كل تغيير في السيارات
+    (catalog_events)، فتعرف كل عملية أن الكتالوج تغير دون الاعتماد على حالتها الخاصة
+    """
+    __tablename__ = 'catalog_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Admin(db.Model):
     """نموذج بيانات المدير"""
     __tablename__ = 'admins'
@@ -206,10 +157,93 @@ class SearchLog(db.Model):
     results_count = db.Column(db.Integer)
     user_ip = db.Column(db.String(45))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rolled_up = db.Column(db.Boolean, default=False)  # أضيف إلى التجميعات
+    
+    # آخر عمليات البحث في لوحة التحكم، والسجلات التي لم تجمع بعد بترتيب إضافتها
+    __table_args__ = (
+        db.Index('ix_search_logs_created_at', 'created_at'),
+        db.Index('ix_search_logs_rolled_up_id', 'rolled_up', 'id'),
+    )
     
     def __repr__(self):
         return f'<SearchLog {self.id} - {self.results_count} results>'
 
+class SearchRollup(db.Model):
+    """تجميعات سجل البحث بالساعة واليوم لكل بُعد (الماركة، فئة الميزانية، الوقود، البحث بلا نتائج)"""
+    __tablename__ = 'search_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # hour, day
+    period_start = db.Column(db.DateTime, nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # total, brand, budget, fuel_type, zero_results
+    value = db.Column(db.String(200), nullable=False, default='')
+    searches = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'dimension', 'value', name='uq_search_rollups_key'),
+        db.Index('ix_search_rollups_dimension_period', 'dimension', 'period', 'period_start'),
+    )
+    
+    def __repr__(self):
+        return f'<SearchRollup {self.period} {self.period_start} {self.dimension}={self.value}: {self.searches}>'
+
+class SearchRollupState(db.Model):
+    """آخر سجل بحث تمت إضافته إلى التجميعات (صف واحد)
+    لم يعد التجميع يعتمد عليه (يعتمد على SearchLog.rolled_up)، ويبقى لترقية السجلات المجمعة قبل إضافة العمود"""
+    __tablename__ = 'search_rollup_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    last_log_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SavedSearch(db.Model):
+    """بحث محفوظ يتلقى صاحبه السيارات الجديدة المطابقة لمعاييره"""
+    __tablename__ = 'saved_searches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    search_criteria = db.Column(db.Text, nullable=False)  # JSON string (معايير مطبعة)
+    contact = db.Column(db.String(100), nullable=False)  # بريد أو هاتف للإشعار
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # أرقام البحوث النشطة لمزامنة فهرس البحث المحفوظ قبل كل مطابقة
+    __table_args__ = (
+        db.Index('ix_saved_searches_active_id', 'is_active', 'id'),
+    )
+    
+    def get_criteria(self):
+        """معايير البحث كقاموس"""
+        import json
+        try:
+            criteria = json.loads(self.search_criteria or '{}')
+        except ValueError:
+            return {}
+        return criteria if isinstance(criteria, dict) else {}
+    
+    def __repr__(self):
+        return f'<SavedSearch {self.id} - {self.contact}>'
+
+class SavedSearchOutbox(db.Model):
+    """صندوق صادر: سيارة جديدة طابقت بحثاً محفوظاً وتنتظر إرسال الإشعار"""
+    __tablename__ = 'saved_search_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_searches.id'), nullable=False)
+    car_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    
+    saved_search = db.relationship('SavedSearch', backref=db.backref('outbox', lazy='dynamic'))
+    
+    __table_args__ = (
+        db.UniqueConstraint('saved_search_id', 'car_id', name='uq_saved_search_outbox_match'),
+        db.Index('ix_saved_search_outbox_pending', 'sent_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<SavedSearchOutbox {self.saved_search_id} -> car {self.car_id}>'
+
 class CarSubmission(db.Model):
     """نموذج طلبات إضافة السيارات من الزوار"""
     __tablename__ = 'car_submissions'
@@ -265,6 +299,12 @@ class CarSubmission(db.Model):
     # العلاقات
     reviewer = db.relationship('Admin', backref='reviewed_submissions')
     
+    # قائمة الطلبات في لوحة التحكم: حسب الحالة أو الكل، الأحدث أولاً (reference_number فريد ومفهرس)
+    __table_args__ = (
+        db.Index('ix_car_submissions_status_submitted_at', 'status', 'submitted_at', 'id'),
+        db.Index('ix_car_submissions_submitted_at', 'submitted_at', 'id'),
+    )
+    
     def __init__(self, **kwargs):
         super(CarSubmission, self).__init__(**kwargs)
         # إنشاء رقم مرجعي فريد
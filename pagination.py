@@ -0,0 +1,164 @@
+"""
+التصفح بالمؤشر (Keyset) بدلاً من OFFSET/LIMIT
+المؤشر نص معتم يحمل قيمة عمود الترتيب ورقم آخر سيارة في الصفحة،
+فتبدأ الصفحة التالية من موضعها في الفهرس مباشرة مهما كان عمقها ودون COUNT(*)
+"""
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import DateTime, and_, or_
+from catalog_events import subscribe
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"قيمة غير مدعومة في المؤشر: {value!r}")
+
+
+def encode_cursor(sort_key: str, *position: Any) -> str:
+    """ترميز موضع الصفحة التالية (مرتبطاً بالترتيب المستخدم) كنص آمن للروابط"""
+    payload = json.dumps([sort_key, *position], default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], sort_key: str) -> Optional[List[Any]]:
+    """
+    فك المؤشر وإرجاع الموضع المحفوظ فيه
+    المؤشر الفارغ أو التالف أو الصادر لترتيب آخر يعيد None (أي الصفحة الأولى)
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(payload, list) or not payload or payload[0] != sort_key:
+        return None
+    return payload[1:]
+
+
+def cursor_position(cursor: Optional[str], sort_key: str, column) -> Optional[Tuple[Any, int]]:
+    """
+    الموضع (قيمة العمود، رقم السيارة) المحفوظ في مؤشر keyset بعد التحقق من نوعه
+    القيمة تعاد لنوع العمود (التواريخ تحفظ كنص ISO)، وأي مؤشر غير صالح يعيد None
+    """
+    position = decode_cursor(cursor, sort_key)
+    if position is None or len(position) != 2:
+        return None
+    value, row_id = position
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        return None
+    if value is None:
+        return None, row_id
+
+    try:
+        if isinstance(column.type, DateTime):
+            return datetime.fromisoformat(value), row_id
+        expected = column.type.python_type
+    except (TypeError, ValueError, NotImplementedError):
+        return None
+    if expected in (int, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+    elif not isinstance(value, expected):
+        return None
+    return value, row_id
+
+
+def keyset_order(column, id_column, direction: str) -> Tuple[Any, Any]:
+    """
+    ترتيب (العمود، الرقم) الثابت الذي يعتمد عليه المؤشر
+    القيم الفارغة أولاً تصاعدياً وأخيراً تنازلياً (سلوك SQLite وفهرس البحث) في كل قواعد البيانات
+    """
+    if direction == 'desc':
+        ordering = column.desc()
+        if column.nullable:
+            ordering = ordering.nullslast()
+        return ordering, id_column.desc()
+    ordering = column.asc()
+    if column.nullable:
+        ordering = ordering.nullsfirst()
+    return ordering, id_column.asc()
+
+
+def keyset_filter(column, id_column, direction: str, value: Any, row_id: int):
+    """شرط الصفوف الواقعة بعد (value, row_id) في ترتيب keyset_order"""
+    if direction == 'desc':
+        if value is None:
+            return and_(column.is_(None), id_column < row_id)
+        after = or_(column < value, and_(column == value, id_column < row_id))
+        return or_(after, column.is_(None)) if column.nullable else after
+
+    if value is None:
+        return or_(column.isnot(None), and_(column.is_(None), id_column > row_id))
+    return or_(column > value, and_(column == value, id_column > row_id))
+
+
+def keyset_page(query, column, id_column, direction: str, sort_key: str,
+                cursor: Optional[str], per_page: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    صفحة واحدة بعد المؤشر وإرجاع (العناصر، مؤشر الصفحة التالية أو None)
+    يقرأ صفاً إضافياً واحداً لمعرفة وجود صفحة تالية بدلاً من عد كل النتائج
+    """
+    position = cursor_position(cursor, sort_key, column)
+    if position is not None:
+        query = query.filter(keyset_filter(column, id_column, direction, *position))
+
+    items = query.order_by(*keyset_order(column, id_column, direction)).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+
+    items = items[:per_page]
+    last = items[-1]
+    return items, encode_cursor(sort_key, getattr(last, column.key), getattr(last, id_column.key))
+
+
+class KeysetPage:
+    """صفحة بالمؤشر للقوالب: items و total و next_cursor بدلاً من أرقام الصفحات"""
+
+    def __init__(self, items: List[Any], total: int, next_cursor: Optional[str]):
+        self.items = items
+        self.total = total
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+
+
+class CountCache:
+    """
+    ذاكرة مؤقتة قصيرة العمر لأعداد النتائج في وضع المؤشر
+    العدد هنا تقدير قد يتأخر حتى max_age ثانية، ويفرغ بالكامل عند تغيير السيارات
+    """
+
+    def __init__(self, max_age: int = 60, max_entries: int = 512):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, query) -> int:
+        """العدد المحفوظ للمفتاح أو حسابه من الاستعلام وحفظه"""
+        now = time.time()
+        entry = self._counts.get(key)
+        if entry is not None and now - entry[1] <= self.max_age:
+            return entry[0]
+
+        count = query.order_by(None).count()
+        with self._lock:
+            if len(self._counts) >= self.max_entries:
+                self._counts.clear()
+            self._counts[key] = (count, now)
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# إنشاء مثيل عام من ذاكرة الأعداد
+count_cache = CountCache()
+subscribe(lambda upserted, deleted_ids: count_cache.invalidate(), count_cache.invalidate)
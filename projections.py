@@ -0,0 +1,85 @@
+"""
+ملامح تحميل أعمدة السيارة لكل عرض
+صفحات القوائم تعرض نحو عشرة حقول فقط، فتحمل أعمدتها وحدها بدلاً من الوصف (Text)
+والأعمدة المطبعة وبقية المواصفات؛ أي عمود آخر يطلب من كائن محمل بملمح يحمل عند أول استخدام
+(استعلام إضافي لكل سيارة)، فيضاف العمود إلى الملمح عند استخدامه في العرض
+"""
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from sqlalchemy import inspect
+from sqlalchemy.orm import defer, load_only
+from sqlalchemy.orm.util import identity_key
+from models import Car, db
+
+# بطاقة السيارة في القوائم العامة (الصفحة الرئيسية، نتائج البحث، /api/latest-cars)
+# created_at و id مطلوبان لمؤشر الصفحة التالية
+CARD_COLUMNS = (
+    'id', 'name', 'brand', 'model', 'year', 'price', 'fuel_type', 'transmission', 'mileage',
+    'image_url', 'leather_seats', 'gps_system', 'backup_camera', 'is_available', 'is_featured', 'created_at'
+)
+
+# صف السيارة في قوائم لوحة التحكم
+ADMIN_ROW_COLUMNS = (
+    'id', 'name', 'brand', 'model', 'year', 'price', 'image_url', 'is_available', 'is_featured', 'created_at'
+)
+
+# صفحة التفاصيل تعرض كل الحقول عدا النسخ المطبعة المستخدمة في البحث فقط
+DETAIL_DEFERRED = ('name_normalized', 'brand_normalized', 'model_normalized',
+                   'color_normalized', 'country_normalized')
+
+PROJECTIONS: Dict[str, Tuple[str, ...]] = {
+    'card': CARD_COLUMNS,
+    'admin_row': ADMIN_ROW_COLUMNS,
+}
+
+# أقصى عدد أرقام في استعلام IN واحد (حد معاملات SQLite في الإصدارات القديمة 999)
+IDS_CHUNK_SIZE = 500
+
+
+def car_load_options(profile: str) -> List:
+    """خيارات تحميل الاستعلام لملمح العرض: card أو admin_row أو detail"""
+    if profile == 'detail':
+        return [defer(getattr(Car, column)) for column in DETAIL_DEFERRED]
+    return [load_only(*[getattr(Car, column) for column in PROJECTIONS[profile]])]
+
+
+def project(query, profile: str):
+    """استعلام السيارات محملاً بأعمدة ملمح العرض فقط"""
+    return query.options(*car_load_options(profile))
+
+
+def _loaded_columns(profile: Optional[str]) -> FrozenSet[str]:
+    """الأعمدة التي يحتاجها الملمح محملة (None = كل الأعمدة)"""
+    columns = frozenset(column.key for column in inspect(Car).column_attrs)
+    if profile is None:
+        return columns
+    if profile == 'detail':
+        return columns - frozenset(DETAIL_DEFERRED)
+    return frozenset(PROJECTIONS[profile])
+
+
+def get_cars_by_ids(ids: Iterable[int], profile: Optional[str] = None,
+                    available_only: bool = False) -> List[Car]:
+    """
+    السيارات بالأرقام بنفس ترتيب ids باستعلام IN واحد بدلاً من استعلام لكل رقم
+    السيارات الموجودة في الجلسة بكل أعمدة الملمح تؤخذ منها دون استعلام، والأرقام غير الموجودة تتجاهل
+    """
+    ids = list(dict.fromkeys(ids))
+    needed = _loaded_columns(profile)
+    found: Dict[int, Car] = {}
+    missing = []
+    for car_id in ids:
+        car = db.session.identity_map.get(identity_key(Car, car_id))
+        # سيارة منتهية الصلاحية (بعد commit) أو محملة بملمح أصغر تعني استعلاماً لكل سيارة عند القراءة
+        if car is not None and needed.isdisjoint(inspect(car).unloaded):
+            found[car_id] = car
+        else:
+            missing.append(car_id)
+
+    for start in range(0, len(missing), IDS_CHUNK_SIZE):
+        query = Car.query.filter(Car.id.in_(missing[start:start + IDS_CHUNK_SIZE]))
+        if profile is not None:
+            query = project(query, profile)
+        found.update((car.id, car) for car in query)
+
+    return [found[car_id] for car_id in ids
+            if car_id in found and (not available_only or found[car_id].is_available)]
@@ -0,0 +1,100 @@
+"""
+فهارس نطاقات مرتبة للأعمدة الرقمية في فهرس البحث
+مصفوفة مرتبة من (القيمة، رقم السيارة، الصف) يبحث فيها بالتنصيف الثنائي
+"""
+import math
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+_HIGHEST = float('inf')
+
+
+def _is_null(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class SortedRangeIndex:
+    """
+    فهرس نطاق لعمود واحد
+    يجيب على value BETWEEN lo AND hi ويعيد الصفوف بترتيب العمود دون فرز جديد
+    القيم الفارغة تحفظ منفصلة: أولاً في الترتيب التصاعدي وأخيراً في التنازلي (مثل SQLite)
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[Any, int, int]] = []
+        self._nulls: List[Tuple[int, int]] = []
+
+    def __len__(self):
+        return len(self._entries) + len(self._nulls)
+
+    def load(self, items: Iterable[Tuple[Any, int, int]]):
+        """تحميل جماعي لقيم (القيمة، رقم السيارة، الصف) مع فرز واحد"""
+        entries, nulls = [], []
+        for value, car_id, row in items:
+            if _is_null(value):
+                nulls.append((car_id, row))
+            else:
+                entries.append((value, car_id, row))
+        entries.sort()
+        nulls.sort()
+        self._entries, self._nulls = entries, nulls
+
+    def add(self, value: Any, car_id: int, row: int):
+        if _is_null(value):
+            insort(self._nulls, (car_id, row))
+        else:
+            insort(self._entries, (value, car_id, row))
+
+    def remove(self, value: Any, car_id: int, row: int):
+        if _is_null(value):
+            items, key = self._nulls, (car_id, row)
+        else:
+            items, key = self._entries, (value, car_id, row)
+        position = bisect_left(items, key)
+        if position < len(items) and items[position] == key:
+            del items[position]
+
+    def _bounds(self, lo: Optional[Any], hi: Optional[Any]) -> Tuple[int, int]:
+        start = 0 if lo is None else bisect_left(self._entries, (lo,))
+        stop = len(self._entries) if hi is None else bisect_right(self._entries, (hi, _HIGHEST))
+        return start, max(start, stop)
+
+    def count_between(self, lo: Optional[Any] = None, hi: Optional[Any] = None) -> int:
+        """عدد الصفوف في النطاق (تنصيفان فقط) لاختيار أكثر المرشحات انتقائية"""
+        start, stop = self._bounds(lo, hi)
+        return stop - start
+
+    def rows_between(self, lo: Optional[Any] = None, hi: Optional[Any] = None) -> List[int]:
+        """الصفوف التي تقع قيمها بين lo و hi (شاملة، والحد None يعني بلا حد)"""
+        start, stop = self._bounds(lo, hi)
+        return [entry[2] for entry in self._entries[start:stop]]
+
+    def ordered_rows(self, descending: bool = False,
+                     after: Optional[Tuple[Any, int]] = None) -> Iterator[int]:
+        """
+        كل الصفوف بترتيب العمود (رقم السيارة يفصل بين القيم المتساوية)
+        after = (القيمة، رقم السيارة) يبدأ مباشرة بعد هذا الموضع بالتنصيف دون المرور على ما قبله
+        """
+        entries, nulls = self._entries, self._nulls
+        if after is None:
+            entry_start, null_start = 0, 0
+            entry_stop, null_stop = len(entries), len(nulls)
+        elif _is_null(after[0]):
+            entry_start, entry_stop = 0, 0
+            null_start = bisect_right(nulls, (after[1], _HIGHEST))
+            null_stop = bisect_left(nulls, (after[1],))
+        else:
+            entry_start = bisect_right(entries, (after[0], after[1], _HIGHEST))
+            entry_stop = bisect_left(entries, (after[0], after[1]))
+            null_start, null_stop = len(nulls), len(nulls)
+
+        if descending:
+            for position in range(entry_stop - 1, -1, -1):
+                yield entries[position][2]
+            for position in range(null_stop - 1, -1, -1):
+                yield nulls[position][1]
+        else:
+            for position in range(null_start, len(nulls)):
+                yield nulls[position][1]
+            for position in range(entry_start, len(entries)):
+                yield entries[position][2]
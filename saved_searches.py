@@ -0,0 +1,229 @@
+"""
+البحث المحفوظ وإشعارات السيارات الجديدة
+عند إضافة سيارة تفحص فقط مقابل البحوث المحفوظة المرشحة من فهرس مقلوب
+(الماركة، نوع السيارة، فئة السعر الأقصى)، والمطابقات تكتب في صندوق صادر
+في نفس معاملة إضافة السيارة ثم يفرغه مرسل الإشعارات
+"""
+import json
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from models import Car, SavedSearch, SavedSearchOutbox, db
+from car_criteria import CarCriteria, compile_criteria
+from facets import PRICE_BUCKETS
+from search_cache import canonical_criteria
+from utils import normalize_arabic
+
+_CONTACT_LENGTH = 100
+
+# عدد البحوث المحفوظة التي تقرأ معاييرها في استعلام واحد عند المزامنة
+_LOAD_BATCH_SIZE = 500
+
+
+def price_band(price: float) -> int:
+    """رقم فئة السعر بحدود PRICE_BUCKETS"""
+    band = len(PRICE_BUCKETS) - 1
+    while band > 0 and price < PRICE_BUCKETS[band]:
+        band -= 1
+    return band
+
+
+def _max_price(criteria: Dict[str, Any]) -> Optional[float]:
+    prices = []
+    for key in ('budget', 'price_max'):
+        try:
+            if criteria.get(key):
+                prices.append(float(criteria[key]))
+        except (ValueError, TypeError):
+            pass
+    return min(prices) if prices else None
+
+
+def print_notification(saved_search: SavedSearch, car: Car):
+    """مرسل بديل: يطبع الإشعار بدلاً من إرسال بريد أو رسالة"""
+    print(f"إشعار بحث محفوظ #{saved_search.id} إلى {saved_search.contact}: "
+          f"{car.name} ({car.year}) بسعر {car.price}")
+
+
+class SavedSearchIndex:
+    """
+    فهرس مقلوب للبحوث المحفوظة النشطة: كل بحث يسجل تحت أكثر مفتاح انتقائية فيه
+    (الماركة، ثم نوع السيارة، ثم فئة السعر الأقصى، وإلا قائمة البحوث العامة)
+    قبل كل مطابقة يزامن الفهرس مع أرقام البحوث النشطة في قاعدة البيانات: تضاف البحوث غير المحملة
+    أياً كان رقمها، وتحذف البحوث التي أوقفتها عمليات أخرى
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.drain_batch_size = 100
+        self._lock = threading.RLock()
+        self._compiled: Optional[Dict[int, CarCriteria]] = None
+        self._by_brand: Dict[str, Set[int]] = {}
+        self._by_type: Dict[str, Set[int]] = {}
+        self._by_band: List[Set[int]] = []
+        self._unkeyed: Set[int] = set()
+
+    def init_app(self, app):
+        """ربط البحث المحفوظ بالتطبيق وتسجيل الأمر flask drain-saved-searches"""
+        self.enabled = app.config.get('SAVED_SEARCHES_ENABLED', False)
+        self.drain_batch_size = max(1, app.config.get('SAVED_SEARCH_DRAIN_BATCH_SIZE', 100))
+        self.invalidate()
+
+        @app.cli.command('drain-saved-searches')
+        def drain_saved_searches_command():
+            """إرسال إشعارات البحوث المحفوظة المعلقة في الصندوق الصادر"""
+            sent = self.drain_outbox()
+            print(f"تم إرسال {sent} إشعار بحث محفوظ")
+
+    def save(self, criteria: Dict[str, Any], contact: str) -> Tuple[Optional[SavedSearch], List[str]]:
+        """حفظ بحث جديد وإرجاع (البحث المحفوظ، قائمة الأخطاء)"""
+        errors = []
+        contact = (contact or '').strip()
+        if not contact:
+            errors.append('يجب إدخال البريد الإلكتروني أو رقم الهاتف')
+        elif len(contact) > _CONTACT_LENGTH:
+            errors.append('وسيلة التواصل طويلة جداً')
+        canonical = canonical_criteria(criteria)
+        if not canonical:
+            errors.append('يجب تحديد معيار بحث واحد على الأقل')
+        if errors:
+            return None, errors
+
+        saved_search = SavedSearch(search_criteria=json.dumps(canonical, sort_keys=True, ensure_ascii=False),
+                                   contact=contact)
+        db.session.add(saved_search)
+        db.session.commit()
+        with self._lock:
+            if self._compiled is not None:
+                self._add(saved_search.id, canonical)
+        return saved_search, []
+
+    def deactivate(self, saved_search_id: int, contact: Optional[str] = None) -> bool:
+        """
+        إيقاف بحث محفوظ (لا تضاف له مطابقات جديدة ولا ترسل إشعاراته المعلقة)
+        contact: إذا حدد يجب أن يطابق وسيلة التواصل المحفوظة
+        """
+        saved_search = SavedSearch.query.get(saved_search_id)
+        if saved_search is None or (contact is not None and saved_search.contact != contact.strip()):
+            return False
+        saved_search.is_active = False
+        db.session.commit()
+        with self._lock:
+            if self._compiled is not None:
+                self._remove(saved_search_id)
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._compiled = None
+
+    def match_new_car(self, car: Car) -> int:
+        """
+        فحص سيارة جديدة (بعد flush) مقابل البحوث المرشحة فقط وإضافة المطابقات إلى الصندوق الصادر
+        في الجلسة الحالية، فتحفظ مع السيارة في نفس commit؛ يعيد عدد المطابقات
+        """
+        if not self.enabled or not car.is_available:
+            return 0
+        with self._lock:
+            self._refresh()
+            matched = [saved_search_id for saved_search_id in self._candidates(car)
+                       if self._compiled[saved_search_id].matches(car)]
+        for saved_search_id in matched:
+            db.session.add(SavedSearchOutbox(saved_search_id=saved_search_id, car_id=car.id))
+        return len(matched)
+
+    def drain_outbox(self, send: Callable[[SavedSearch, Car], None] = print_notification,
+                     limit: Optional[int] = None) -> int:
+        """إرسال الإشعارات المعلقة بالترتيب وتعليمها كمرسلة؛ يعيد عدد المرسل"""
+        limit = limit or self.drain_batch_size
+        entries = SavedSearchOutbox.query.filter(SavedSearchOutbox.sent_at.is_(None))\
+                                         .order_by(SavedSearchOutbox.id)\
+                                         .limit(limit).all()
+        cars = {car.id: car for car in Car.query.filter(Car.id.in_({entry.car_id for entry in entries}))} \
+            if entries else {}
+
+        sent = 0
+        now = datetime.utcnow()
+        for entry in entries:
+            car = cars.get(entry.car_id)
+            entry.attempts += 1
+            if car is None or not car.is_available or not entry.saved_search.is_active:
+                # السيارة حذفت أو بيعت أو أوقف البحث: لا إشعار
+                entry.sent_at = now
+                continue
+            try:
+                send(entry.saved_search, car)
+            except Exception as e:
+                print(f"خطأ في إرسال إشعار البحث المحفوظ #{entry.saved_search_id}: {e}")
+                continue
+            entry.sent_at = now
+            sent += 1
+        db.session.commit()
+        return sent
+
+    def _refresh(self):
+        """
+        مزامنة الفهرس مع أرقام البحوث النشطة (من فهرس is_active، بلا قراءة المعايير)
+        لا علامة تقدم بالرقم: بحث أودعت معاملته بعد بحوث أحدث منه يضاف في المزامنة التالية
+        """
+        if self._compiled is None:
+            self._compiled = {}
+            self._by_brand, self._by_type, self._unkeyed = {}, {}, set()
+            self._by_band = [set() for _ in PRICE_BUCKETS]
+        active_ids = {row[0] for row in db.session.query(SavedSearch.id).filter(SavedSearch.is_active == True)}
+        for saved_search_id in set(self._compiled) - active_ids:
+            self._remove(saved_search_id)
+        missing = sorted(active_ids - set(self._compiled))
+        for start in range(0, len(missing), _LOAD_BATCH_SIZE):
+            for saved_search in SavedSearch.query.filter(SavedSearch.id.in_(missing[start:start + _LOAD_BATCH_SIZE])):
+                self._add(saved_search.id, saved_search.get_criteria())
+
+    def _add(self, saved_search_id: int, criteria: Dict[str, Any]):
+        self._compiled[saved_search_id] = compile_criteria(criteria)
+
+        if criteria.get('brand'):
+            self._by_brand.setdefault(normalize_arabic(str(criteria['brand'])), set()).add(saved_search_id)
+            return
+        if criteria.get('car_type'):
+            car_types = criteria['car_type']
+            for car_type in car_types if isinstance(car_types, (list, tuple, set)) else [car_types]:
+                self._by_type.setdefault(car_type, set()).add(saved_search_id)
+            return
+        max_price = _max_price(criteria)
+        if max_price is not None and max_price >= 0:
+            self._by_band[price_band(max_price)].add(saved_search_id)
+            return
+        self._unkeyed.add(saved_search_id)
+
+    def _remove(self, saved_search_id: int):
+        self._compiled.pop(saved_search_id, None)
+        for buckets in (self._by_brand, self._by_type):
+            for key in [key for key, ids in buckets.items() if saved_search_id in ids]:
+                buckets[key].discard(saved_search_id)
+                if not buckets[key]:
+                    del buckets[key]
+        for ids in self._by_band:
+            ids.discard(saved_search_id)
+        self._unkeyed.discard(saved_search_id)
+
+    def _candidates(self, car: Car) -> Set[int]:
+        """البحوث التي قد تطابق السيارة حسب مفاتيح الفهرس (المطابقة الكاملة بعدها)"""
+        candidates = set(self._unkeyed)
+
+        # الماركة مطابقة جزئية: تفحص الماركات المحفوظة المختلفة (أقل بكثير من عدد البحوث)
+        brand = car.brand_normalized or ''
+        for term, ids in self._by_brand.items():
+            if term in brand:
+                candidates |= ids
+
+        candidates |= self._by_type.get(car.car_type, set())
+
+        # البحث بسعر أقصى P يطابق السيارات في فئة P أو الفئات الأقل
+        if car.price is not None:
+            for ids in self._by_band[price_band(car.price):]:
+                candidates |= ids
+        return candidates
+
+
+# إنشاء مثيل عام من البحث المحفوظ
+saved_searches = SavedSearchIndex()
@@ -0,0 +1,115 @@
+"""
+ترقية مخطط قاعدة البيانات الموجودة
+db.create_all ينشئ الجداول الجديدة فقط، فالأعمدة والفهارس التي تضاف لاحقاً إلى جداول موجودة
+تنشأ هنا بخطوات قابلة للتكرار، ثم تعبأ الأعمدة المطبعة للصفوف القديمة على دفعات
+"""
+from typing import List
+from sqlalchemy import bindparam, inspect, or_, select, text, update
+from models import Car, SearchLog, SearchRollupState, db
+from catalog_events import notify_catalog_reset
+from utils import normalize_arabic_many
+
+# الأعمدة المطبعة ومصدر كل منها
+NORMALIZED_COLUMNS = (
+    ('model_normalized', 'model'),
+    ('color_normalized', 'color'),
+    ('country_normalized', 'country_origin'),
+)
+
+
+def add_missing_columns(connection) -> List[str]:
+    """إضافة أعمدة النماذج غير الموجودة في الجداول الموجودة (ALTER TABLE ADD COLUMN)"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def create_missing_indexes(connection) -> List[str]:
+    """إنشاء فهارس النماذج غير الموجودة في الجداول الموجودة"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+
+def _missing(target: str, source: str):
+    """العمود المطبع فارغ رغم وجود قيمة في المصدر"""
+    return getattr(Car, target).is_(None) & getattr(Car, source).isnot(None) & (getattr(Car, source) != '')
+
+
+def backfill_search_log_rollup(connection) -> int:
+    """
+    تعليم سجلات البحث القديمة بعد إضافة العمود rolled_up: ما رقمه ضمن علامة التقدم القديمة
+    (SearchRollupState.last_log_id) أضيف إلى التجميعات من قبل، فلا يعاد حسابه
+    """
+    last_log_id = connection.execute(select(SearchRollupState.last_log_id)).scalar() or 0
+    result = connection.execute(
+        update(SearchLog.__table__)
+        .where(SearchLog.rolled_up.is_(None))
+        .values(rolled_up=SearchLog.id <= last_log_id)
+    )
+    return result.rowcount
+
+
+def backfill_normalized_fields(batch_size: int = 500) -> int:
+    """تعبئة الأعمدة المطبعة الفارغة للسيارات القديمة على دفعات، ويعيد عدد السيارات المحدثة"""
+    missing = or_(*[_missing(target, source) for target, source in NORMALIZED_COLUMNS])
+    columns = [Car.id] + [getattr(Car, source) for _, source in NORMALIZED_COLUMNS]
+    updated = 0
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(*columns).where(missing, Car.id > last_id).order_by(Car.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return updated
+            values = {target: normalize_arabic_many(row[position + 1] for row in rows)
+                      for position, (target, _) in enumerate(NORMALIZED_COLUMNS)}
+            connection.execute(
+                update(Car.__table__).where(Car.__table__.c.id == bindparam('car_id')),
+                [dict({target: values[target][position] or None for target, _ in NORMALIZED_COLUMNS},
+                      car_id=row[0])
+                 for position, row in enumerate(rows)]
+            )
+        updated += len(rows)
+        last_id = rows[-1][0]
+
+
+def upgrade_schema():
+    """ترقية المخطط ثم تعبئة القيم المطبعة (يستدعى بعد db.create_all عند بدء التطبيق)"""
+    with db.engine.begin() as connection:
+        added = add_missing_columns(connection)
+        created = create_missing_indexes(connection)
+        marked = backfill_search_log_rollup(connection)
+    for name in added:
+        print(f"تمت إضافة العمود {name}")
+    for name in created:
+        print(f"تم إنشاء الفهرس {name}")
+    if marked:
+        print(f"تم تعليم {marked} سجل بحث بحالة التجميع")
+
+    updated = backfill_normalized_fields()
+    if updated:
+        print(f"تم تطبيع حقول {updated} سيارة")
+        # التحديث الجماعي لا يمر بأحداث النموذج، فتسقط الفهارس والذاكرات المؤقتة
+        notify_catalog_reset()
@@ -0,0 +1,229 @@
+"""
+تحليلات الطلب من سجل البحث
+مهمة تجميع تدريجية تقرأ سجلات البحث غير المجمعة (rolled_up) على دفعات وتضيفها إلى جداول تجميع
+بالساعة واليوم (الماركة، فئة الميزانية، نوع الوقود، البحث بلا نتائج)،
+ثم تحذف السجلات الخام القديمة المعلمة كمجمعة فقط حسب سياسة الاحتفاظ
+"""
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func
+from models import SearchLog, SearchRollup, db
+from facets import PRICE_BUCKETS
+from search_cache import canonical_criteria
+from utils import normalize_arabic
+
+PERIODS = ('hour', 'day')
+DIMENSIONS = ('total', 'brand', 'budget', 'fuel_type', 'zero_results')
+
+_VALUE_LENGTH = 200
+
+
+def budget_bucket(value: Any) -> Optional[str]:
+    """فئة الميزانية بحدود PRICE_BUCKETS (مثل '5000-10000' أو '50000+')"""
+    try:
+        budget = float(value)
+    except (ValueError, TypeError):
+        return None
+    if budget < 0:
+        return None
+    bucket = len(PRICE_BUCKETS) - 1
+    while bucket > 0 and budget < PRICE_BUCKETS[bucket]:
+        bucket -= 1
+    if bucket + 1 < len(PRICE_BUCKETS):
+        return f'{PRICE_BUCKETS[bucket]}-{PRICE_BUCKETS[bucket + 1]}'
+    return f'{PRICE_BUCKETS[bucket]}+'
+
+
+def log_dimensions(criteria: Dict[str, Any], results_count: Optional[int]) -> Iterator[Tuple[str, str]]:
+    """أزواج (البعد، القيمة) التي يضيفها سجل بحث واحد إلى التجميعات"""
+    yield 'total', ''
+
+    if criteria.get('brand'):
+        yield 'brand', normalize_arabic(str(criteria['brand']))[:_VALUE_LENGTH]
+
+    bucket = budget_bucket(criteria.get('budget') or criteria.get('price_max'))
+    if bucket is not None:
+        yield 'budget', bucket
+
+    fuel_types = criteria.get('fuel_type')
+    if fuel_types:
+        if not isinstance(fuel_types, list):
+            fuel_types = [fuel_types]
+        for fuel_type in sorted({str(value) for value in fuel_types}):
+            yield 'fuel_type', fuel_type[:_VALUE_LENGTH]
+
+    if results_count == 0:
+        if criteria.get('search_text'):
+            query = normalize_arabic(str(criteria['search_text']))
+        else:
+            query = json.dumps(canonical_criteria(criteria), sort_keys=True, ensure_ascii=False, default=str)
+        yield 'zero_results', query[:_VALUE_LENGTH]
+
+
+def period_start(period: str, moment: datetime) -> datetime:
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class SearchAnalytics:
+    """التجميع التدريجي لسجل البحث واستعلامات الطلب من الجداول المجمعة"""
+
+    def __init__(self):
+        self.batch_size = 1000
+        self.retention_days = 30
+        self.hourly_retention_days = 90
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """ربط التحليلات بالتطبيق وتسجيل الأمر flask rollup-searches"""
+        self.batch_size = max(1, app.config.get('SEARCH_ROLLUP_BATCH_SIZE', 1000))
+        self.retention_days = app.config.get('SEARCH_LOG_RETENTION_DAYS', 30)
+        self.hourly_retention_days = app.config.get('SEARCH_ROLLUP_HOURLY_RETENTION_DAYS', 90)
+
+        @app.cli.command('rollup-searches')
+        def rollup_searches_command():
+            """تجميع سجلات البحث الجديدة وحذف السجلات الخام القديمة"""
+            rolled = self.rollup()
+            pruned = self.prune()
+            print(f"تم تجميع {rolled} سجل بحث وحذف {pruned} سجل قديم")
+
+    def rollup(self, max_batches: Optional[int] = None) -> int:
+        """
+        إضافة سجلات البحث التي لم تجمع بعد إلى التجميعات على دفعات وإرجاع عددها
+        كل دفعة تحدث التجميعات وتعلم سجلاتها rolled_up في نفس المعاملة، فلا يحسب سجل مرتين،
+        والسجل الذي تأخر إيداع معاملته عن سجلات أحدث منه يجمع في التشغيل التالي (لا علامة تقدم بالرقم)
+        """
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            processed = 0
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                logs = SearchLog.query.filter(SearchLog.rolled_up == False)\
+                                      .order_by(SearchLog.id)\
+                                      .limit(self.batch_size).all()
+                if not logs:
+                    break
+
+                self._merge(self._aggregate(logs))
+
+                # تعليم مشروط: إذا سبقتنا عملية أخرى إلى أي سجل من الدفعة نتراجع عنها
+                log_ids = [log.id for log in logs]
+                updated = SearchLog.query.filter(SearchLog.id.in_(log_ids), SearchLog.rolled_up == False)\
+                    .update({'rolled_up': True}, synchronize_session=False)
+                if updated != len(log_ids):
+                    db.session.rollback()
+                    break
+                db.session.commit()
+
+                processed += len(logs)
+                batches += 1
+            return processed
+        except Exception as e:
+            db.session.rollback()
+            print(f"خطأ في تجميع سجل البحث: {e}")
+            return 0
+        finally:
+            self._lock.release()
+
+    def prune(self, retention_days: Optional[int] = None,
+              hourly_retention_days: Optional[int] = None) -> int:
+        """حذف سجلات البحث الخام المجمعة الأقدم من مدة الاحتفاظ (والتجميعات بالساعة القديمة)"""
+        retention_days = self.retention_days if retention_days is None else retention_days
+        hourly_retention_days = self.hourly_retention_days if hourly_retention_days is None else hourly_retention_days
+        now = datetime.utcnow()
+
+        # السجلات غير المعلمة لا تحذف مهما كان عمرها: لم تصل إلى التجميعات بعد
+        deleted = SearchLog.query.filter(
+            SearchLog.rolled_up == True,
+            SearchLog.created_at < now - timedelta(days=retention_days)
+        ).delete(synchronize_session=False)
+
+        if hourly_retention_days:
+            SearchRollup.query.filter(
+                SearchRollup.period == 'hour',
+                SearchRollup.period_start < now - timedelta(days=hourly_retention_days)
+            ).delete(synchronize_session=False)
+
+        db.session.commit()
+        return deleted
+
+    def pending(self) -> int:
+        """عدد سجلات البحث التي لم تضف إلى التجميعات بعد"""
+        return SearchLog.query.filter(SearchLog.rolled_up == False).count()
+
+    def total_searches(self) -> int:
+        """عدد عمليات البحث الكلي: المجمعة يومياً + السجلات التي لم تجمع بعد"""
+        rolled = db.session.query(func.coalesce(func.sum(SearchRollup.searches), 0))\
+                           .filter(SearchRollup.period == 'day', SearchRollup.dimension == 'total')\
+                           .scalar()
+        return int(rolled) + self.pending()
+
+    def top_values(self, dimension: str, days: int = 30, limit: int = 10) -> List[Tuple[str, int]]:
+        """أكثر القيم طلباً في بعد معين خلال آخر days يوم"""
+        since = period_start('day', datetime.utcnow() - timedelta(days=days))
+        total = func.sum(SearchRollup.searches)
+        rows = db.session.query(SearchRollup.value, total)\
+                         .filter(SearchRollup.period == 'day',
+                                 SearchRollup.dimension == dimension,
+                                 SearchRollup.period_start >= since)\
+                         .group_by(SearchRollup.value)\
+                         .order_by(total.desc(), SearchRollup.value)\
+                         .limit(limit).all()
+        return [(value, int(searches)) for value, searches in rows]
+
+    def series(self, period: str = 'day', dimension: str = 'total', value: str = '',
+               since: Optional[datetime] = None) -> List[Tuple[datetime, int]]:
+        """عدد عمليات البحث لكل ساعة/يوم لقيمة واحدة من بعد معين"""
+        query = SearchRollup.query.filter_by(period=period, dimension=dimension, value=value)
+        if since is not None:
+            query = query.filter(SearchRollup.period_start >= since)
+        return [(row.period_start, row.searches) for row in query.order_by(SearchRollup.period_start)]
+
+    @staticmethod
+    def _aggregate(logs: List[SearchLog]) -> Counter:
+        counts: Counter = Counter()
+        for log in logs:
+            if log.created_at is None:
+                continue
+            try:
+                criteria = json.loads(log.search_criteria or '{}')
+            except ValueError:
+                criteria = {}
+            if not isinstance(criteria, dict):
+                criteria = {}
+
+            for dimension, value in log_dimensions(criteria, log.results_count):
+                for period in PERIODS:
+                    counts[(period, period_start(period, log.created_at), dimension, value)] += 1
+        return counts
+
+    @staticmethod
+    def _merge(counts: Counter):
+        """إضافة الأعداد إلى صفوف التجميع الموجودة أو إنشاء صفوف جديدة"""
+        if not counts:
+            return
+        periods = {key[0] for key in counts}
+        starts = {key[1] for key in counts}
+        # الفترة مع بدايتها حتى يخدم الاستعلام من فهرس المفتاح الفريد (period, period_start, ...)
+        existing = {
+            (row.period, row.period_start, row.dimension, row.value): row
+            for row in SearchRollup.query.filter(SearchRollup.period.in_(periods),
+                                                 SearchRollup.period_start.in_(starts)).all()
+        }
+        for key, searches in counts.items():
+            row = existing.get(key)
+            if row is not None:
+                row.searches += searches
+            else:
+                period, start, dimension, value = key
+                db.session.add(SearchRollup(period=period, period_start=start, dimension=dimension,
+                                            value=value, searches=searches))
+
+
+# إنشاء مثيل عام من تحليلات البحث
+search_analytics = SearchAnalytics()
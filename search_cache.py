@@ -0,0 +1,158 @@
+"""
+ذاكرة مؤقتة لنتائج البحث أمام CarSearchEngine.search
+المفتاح معايير مطبعة (نصوص مطبعة، أرقام محولة، مفاتيح مرتبة) مع الصفحة والترتيب،
+وكل نتيجة مرتبطة برقم إصدار الكتالوج فتسقط تلقائياً بعد أي تعديل على السيارات
+"""
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from models import CAR_FEATURES
+from catalog_events import catalog_generation
+from utils import normalize_arabic
+
+# المعايير النصية التي تطبع قبل المقارنة في المرشحات
+TEXT_CRITERIA = ('search_text', 'brand', 'color', 'country_origin')
+
+# المعايير الرقمية بنفس التحويل المستخدم في المرشحات (القيم غير الصالحة تهمل هناك أيضاً)
+NUMERIC_CRITERIA = {
+    'budget': float,
+    'price_min': float,
+    'price_max': float,
+    'year_from': int,
+    'year_to': int,
+    'doors': int,
+    'engine_size_min': float,
+    'engine_size_max': float,
+    'mileage_max': int
+}
+
+# المعايير التصنيفية: قيمة مفردة أو قائمة قيم (أي منها)
+CHOICE_CRITERIA = ('performance_level', 'fuel_type', 'transmission', 'car_type')
+
+
+def canonical_criteria(criteria: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    صيغة موحدة للمعايير: المعايير المتكافئة في النتيجة تعطي نفس القاموس
+    (تويوتا/توْيوتا، '10000'/'10000.0'، 'suv'/['suv']، مفاتيح فارغة أو غير صالحة)
+    """
+    canonical: Dict[str, Any] = {}
+    for key, value in criteria.items():
+        if not value:
+            continue
+
+        if key in TEXT_CRITERIA:
+            canonical[key] = normalize_arabic(str(value))
+        elif key in NUMERIC_CRITERIA:
+            try:
+                canonical[key] = NUMERIC_CRITERIA[key](value)
+            except (ValueError, TypeError):
+                pass
+        elif key in CHOICE_CRITERIA:
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            canonical[key] = sorted({str(item) for item in values})
+        elif key in CAR_FEATURES:
+            canonical[key] = True
+        else:
+            canonical[key] = value
+    return canonical
+
+
+class SearchResultCache:
+    """
+    ذاكرة LRU محدودة بعدد النتائج وبحجمها التقريبي بالبايت مع عمر أقصى لكل نتيجة
+    العمر الأقصى يلتقط تغييرات العمليات الأخرى التي لا يصلها رقم الإصدار
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 60
+        self.max_entries = 2000
+        self.max_bytes = 32 * 1024 * 1024
+        self._entries: 'OrderedDict[str, Tuple[Dict[str, Any], int, float, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """ربط الذاكرة بالتطبيق حسب إعدادات SEARCH_CACHE_*"""
+        self.enabled = app.config.get('SEARCH_CACHE_ENABLED', False)
+        self.ttl = app.config.get('SEARCH_CACHE_TTL', 60)
+        self.max_entries = app.config.get('SEARCH_CACHE_MAX_ENTRIES', 2000)
+        self.max_bytes = app.config.get('SEARCH_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+        self.clear()
+
+    @staticmethod
+    def make_key(criteria: Dict[str, Any], page: int, per_page: int, sort_by: str,
+                 with_facets: bool = False, cursor: Optional[str] = None) -> str:
+        return json.dumps([canonical_criteria(criteria), page, per_page, sort_by, with_facets, cursor],
+                          sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """النتيجة المحفوظة (نسخة) أو None إذا لم توجد أو تقادمت أو تغير الكتالوج"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            result, generation, stored_at, size = entry
+            if generation != catalog_generation() or time.time() - stored_at > self.ttl:
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(result)
+
+    def put(self, key: str, result: Dict[str, Any], generation: int):
+        """
+        حفظ نتيجة محسوبة عند الإصدار generation (المقروء قبل تنفيذ البحث،
+        فالنتيجة التي تزامنت مع تعديل تعتبر متقادمة مباشرة)
+        """
+        if not self.enabled or result.get('errors'):
+            return
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (self._copy(result), generation, time.time(), size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    @staticmethod
+    def _copy(result: Dict[str, Any]) -> Dict[str, Any]:
+        # النتيجة قواميس متداخلة يمكن للمستدعي تعديلها (السيارات، facets)، فتنسخ في الدخول والخروج:
+        # السيارات قيمها بسيطة فتكفيها نسخة سطحية، والباقي نسخة عميقة
+        copied = {key: copy.deepcopy(value) for key, value in result.items() if key != 'cars'}
+        copied['cars'] = [dict(car) for car in result['cars']]
+        return copied
+
+
+# إنشاء مثيل عام من ذاكرة نتائج البحث
+search_cache = SearchResultCache()
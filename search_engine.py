@@ -1,8 +1,22 @@
 from typing import List, Dict, Any, Optional
-from sqlalchemy import and_, or_, func
-from models import Car, db
-from utils import normalize_arabic, normalize_for_search, validate_search_criteria
+from sqlalchemy import and_, case, or_, func
+from models import Car, CAR_FEATURES, db
+from search_index import search_index
+from similar_cars import similar_cars
+from fulltext import fulltext
+from catalog_events import catalog_generation, subscribe
+from db_routing import use_primary
+from facets import FACET_COLUMNS, FacetCounter
+from search_cache import search_cache
+from match_scoring import BEST_MATCH_SORT, features_bits, rank_rows
+from car_criteria import RELEVANCE_SORT, TEXT_SEARCH_COLUMNS, TEXT_SEARCH_WEIGHTS, normalize_search_text
+from projections import get_cars_by_ids
+from pagination import count_cache, cursor_position, decode_cursor, encode_cursor, keyset_page
+from utils import normalize_arabic, normalize_for_search, normalize_page_args, pagination_info, validate_search_criteria
+import copy
 import json
+import threading
+import time
 
 class CarSearchEngine:
     """محرك البحث المتقدم للسيارات"""
@@ -17,13 +31,30 @@ class CarSearchEngine:
             'name_asc': (Car.name, 'asc'),
             'name_desc': (Car.name, 'desc'),
             'mileage_asc': (Car.mileage, 'asc'),
-            'mileage_desc': (Car.mileage, 'desc')
+            'mileage_desc': (Car.mileage, 'desc'),
+            # الأكثر صلة بنص البحث (text_relevance في car_criteria، وبدون نص بحث يطبق الترتيب الافتراضي)
+            RELEVANCE_SORT: (None, 'desc'),
+            # الأفضل مطابقة للمعايير (درجة من الميزانية والسنة والمسافة والميزات، انظر match_scoring)
+            BEST_MATCH_SORT: (None, 'desc')
         }
+        
+        # ذاكرة مؤقتة لخيارات المرشحات تفرغ عند أي تغيير في السيارات
+        # (مع عمر أقصى لالتقاط تغييرات العمليات الأخرى)
+        self.filter_options_max_age = 300
+        self._filter_options = None
+        self._filter_options_at = 0.0
+        self._filter_options_lock = threading.Lock()
+        subscribe(lambda upserted, deleted_ids: self.invalidate_filter_options(),
+                  self.invalidate_filter_options)
     
     def search(self, criteria: Dict[str, Any], page: int = 1, per_page: int = 12,
-               sort_by: Optional[str] = None) -> Dict[str, Any]:
+               sort_by: Optional[str] = None, with_facets: bool = False,
+               cursor: Optional[str] = None) -> Dict[str, Any]:
         """
         البحث الرئيسي للسيارات
+        with_facets: إضافة أعداد المرشحات لكل النتائج المطابقة في المفتاح 'facets'
+        cursor: التصفح بالمؤشر بدلاً من رقم الصفحة ('' للصفحة الأولى)، وتعاد
+                الصفحة التالية في 'next_cursor' والعدد الكلي تقديراً من الذاكرة المؤقتة
         """
         # التحقق من صحة المعايير
         validation_errors = validate_search_criteria(criteria)
@@ -37,14 +68,77 @@ class CarSearchEngine:
                 'errors': validation_errors
             }
         
+        if sort_by not in self.valid_sorts:
+            sort_by = self.default_sort
+        
+        if not search_cache.enabled:
+            return self._execute_search(criteria, page, per_page, sort_by, with_facets, cursor)
+        
+        # الإجابة من ذاكرة النتائج لنفس المعايير المطبعة ما لم يتغير الكتالوج
+        cache_key = search_cache.make_key(criteria, page, per_page, sort_by, with_facets, cursor)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        generation = catalog_generation()
+        result = self._execute_search(criteria, page, per_page, sort_by, with_facets, cursor)
+        search_cache.put(cache_key, result, generation)
+        return result
+    
+    def _execute_search(self, criteria: Dict[str, Any], page: int, per_page: int, sort_by: str,
+                        with_facets: bool, cursor: Optional[str]) -> Dict[str, Any]:
+        """تنفيذ البحث من فهرس الذاكرة أو من قاعدة البيانات"""
+        # الإجابة من فهرس الذاكرة عند تفعيله
+        if search_index.is_ready():
+            if sort_by == RELEVANCE_SORT and not criteria.get('search_text'):
+                sort_by = self.default_sort
+            if sort_by in (BEST_MATCH_SORT, RELEVANCE_SORT):
+                sort = (sort_by, 'desc')
+                if cursor is None:
+                    return search_index.search(criteria, page, per_page, sort, with_facets=with_facets)
+                offset = self._cursor_offset(cursor, sort_by)
+                result = search_index.search(criteria, page, per_page, sort, with_facets=with_facets,
+                                             keyset=True, after=offset)
+                result['next_cursor'] = encode_cursor(sort_by, offset + result['per_page']) \
+                    if result['has_next'] else None
+                return result
+            sort_column, sort_direction = self.valid_sorts[sort_by]
+            sort = (sort_column.key, sort_direction)
+            if cursor is None:
+                return search_index.search(criteria, page, per_page, sort, with_facets=with_facets)
+            
+            result = search_index.search(criteria, page, per_page, sort, with_facets=with_facets,
+                                         keyset=True, after=cursor_position(cursor, sort_by, sort_column))
+            last = result['cars'][-1] if result['has_next'] else None
+            result['next_cursor'] = encode_cursor(sort_by, last[sort_column.key], last['id']) if last else None
+            return result
+        
         # بناء الاستعلام الأساسي
         query = Car.query.filter(Car.is_available == True)
         
+        # مطابقة النص من فهرس البحث النصي الكامل إن وجد
+        text_match = fulltext.match(criteria['search_text']) if criteria.get('search_text') else None
+        
         # تطبيق المرشحات
-        query = self._apply_filters(query, criteria)
+        query = self._apply_filters(query, criteria, text_match)
+        
+        # أعداد المرشحات من نفس الاستعلام المرشح قبل الترتيب والتصفح
+        facets = self._compute_facets(query) if with_facets else None
+        
+        if sort_by == BEST_MATCH_SORT:
+            result = self._search_best_match(query, criteria, page, per_page, cursor)
+            if facets is not None:
+                result['facets'] = facets
+            return result
+        
+        if cursor is not None:
+            result = self._search_after(query, criteria, per_page, sort_by, cursor)
+            if facets is not None:
+                result['facets'] = facets
+            return result
         
         # تطبيق الترتيب
-        query = self._apply_sorting(query, sort_by or self.default_sort)
+        query = self._apply_sorting(query, sort_by, criteria.get('search_text'))
         
         # تطبيق التصفح
         pagination = query.paginate(
@@ -53,7 +147,7 @@ class CarSearchEngine:
             error_out=False
         )
         
-        return {
+        result = {
             'cars': [car.to_dict() for car in pagination.items],
             'total': pagination.total,
             'page': page,
@@ -65,18 +159,108 @@ class CarSearchEngine:
             'next_num': pagination.next_num,
             'errors': {}
         }
+        if facets is not None:
+            result['facets'] = facets
+        return result
     
-    def _apply_filters(self, query, criteria: Dict[str, Any]):
+    def _search_after(self, query, criteria: Dict[str, Any], per_page: int, sort_by: str,
+                      cursor: str) -> Dict[str, Any]:
+        """صفحة البحث بعد المؤشر من قاعدة البيانات: شرط (الترتيب، الرقم) بدلاً من OFFSET"""
+        per_page = normalize_page_args(1, per_page)[1]
+        sort_column, sort_direction = self.valid_sorts[sort_by]
+        
+        if sort_by == RELEVANCE_SORT and criteria.get('search_text'):
+            # درجة الصلة ليست عموداً في السيارة، فيحمل المؤشر الإزاحة لهذا الترتيب فقط
+            offset = self._cursor_offset(cursor, sort_by)
+            cars = self._apply_sorting(query, sort_by, criteria['search_text'])\
+                .offset(offset).limit(per_page + 1).all()
+            next_cursor = encode_cursor(sort_by, offset + per_page) if len(cars) > per_page else None
+            cars = cars[:per_page]
+        else:
+            if sort_column is None:
+                sort_by = self.default_sort
+                sort_column, sort_direction = self.valid_sorts[sort_by]
+            cars, next_cursor = keyset_page(query, sort_column, Car.id, sort_direction, sort_by,
+                                            cursor, per_page)
+        
+        count_key = 'search:' + json.dumps(criteria, sort_keys=True, ensure_ascii=False, default=str)
+        return {
+            'cars': [car.to_dict() for car in cars],
+            'total': count_cache.get(count_key, query),
+            'per_page': per_page,
+            'has_next': next_cursor is not None,
+            'next_cursor': next_cursor,
+            'errors': {}
+        }
+    
+    def _search_best_match(self, query, criteria: Dict[str, Any], page: int, per_page: int,
+                           cursor: Optional[str]) -> Dict[str, Any]:
+        """ترتيب الأفضل مطابقة من قاعدة البيانات: قراءة أعمدة الدرجة للمطابقات ثم جلب الصفحة بالأرقام"""
+        page_num, page_size = normalize_page_args(page, per_page)
+        
+        columns = {'id': [], 'price': [], 'year': [], 'mileage': [], 'features': []}
+        entities = [Car.id, Car.price, Car.year, Car.mileage] + [getattr(Car, feature) for feature in CAR_FEATURES]
+        for row in query.with_entities(*entities):
+            values = row._mapping
+            for column in ('id', 'price', 'year', 'mileage'):
+                columns[column].append(values[column])
+            columns['features'].append(features_bits(values))
+        
+        total = len(columns['id'])
+        start = self._cursor_offset(cursor, BEST_MATCH_SORT) if cursor is not None else (page_num - 1) * page_size
+        ranked = rank_rows(columns, range(total), criteria, limit=start + page_size)
+        page_ids = [columns['id'][row] for row in ranked[start:start + page_size]]
+        cars = [car.to_dict() for car in get_cars_by_ids(page_ids)]
+        
+        if cursor is not None:
+            has_next = start + page_size < total
+            return {
+                'cars': cars,
+                'total': total,
+                'per_page': page_size,
+                'has_next': has_next,
+                'next_cursor': encode_cursor(BEST_MATCH_SORT, start + page_size) if has_next else None,
+                'errors': {}
+            }
+        
+        result = {
+            'cars': cars,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }
+        result.update(pagination_info(total, page_num, page_size))
+        result['errors'] = {}
+        return result
+    
+    @staticmethod
+    def _cursor_offset(cursor: str, sort_by: str) -> int:
+        """الإزاحة المحمولة في مؤشر الترتيبات التي ليست عموداً في السيارة (الصلة والأفضل مطابقة)"""
+        position = decode_cursor(cursor, sort_by)
+        return position[0] if position and isinstance(position[0], int) and position[0] > 0 else 0
+    
+    @staticmethod
+    def _compute_facets(query) -> Dict[str, Any]:
+        """أعداد المرشحات بقراءة أعمدة المرشحات للنتائج المطابقة مرة واحدة بدلاً من GROUP BY لكل مرشح"""
+        columns = [getattr(Car, column) for column in FACET_COLUMNS + ('price', 'year') + CAR_FEATURES]
+        counter = FacetCounter()
+        for row in query.with_entities(*columns):
+            values = row._mapping
+            counter.add(values, values['price'], values['year'],
+                        [feature for feature in CAR_FEATURES if values[feature]])
+        return counter.result()
+    
+    def _apply_filters(self, query, criteria: Dict[str, Any], text_match=None):
         """تطبيق المرشحات على الاستعلام"""
         
-        # البحث النصي
-        if criteria.get('search_text'):
-            search_text = normalize_for_search(criteria['search_text'])
-            text_filter = or_(
-                Car.name_normalized.like(f'%{search_text}%'),  # type: ignore
-                Car.brand_normalized.like(f'%{search_text}%'),  # type: ignore
-                Car.model.contains(search_text)
-            )
+        # البحث النصي: من فهرس FTS إن توفر، وإلا LIKE (تخدمه فهارس pg_trgm في PostgreSQL)
+        if text_match is not None:
+            query = query.join(text_match, text_match.c.car_id == Car.id)
+        elif criteria.get('search_text'):
+            search_text = normalize_search_text(criteria['search_text'])
+            # autoescape: % و _ في نص المستخدم حروف عادية كما في مطابقة فهرس الذاكرة
+            text_filter = or_(*[getattr(Car, column).contains(search_text, autoescape=True)
+                                for column in TEXT_SEARCH_COLUMNS])
             query = query.filter(text_filter)
         
         # الميزانية
@@ -104,24 +288,24 @@ class CarSearchEngine:
         
         # مستوى الأداء
         if criteria.get('performance_level'):
-            query = query.filter(Car.performance_level == criteria['performance_level'])
+            query = query.filter(self._equals_any(Car.performance_level, criteria['performance_level']))
         
         # نوع الوقود
         if criteria.get('fuel_type'):
-            query = query.filter(Car.fuel_type == criteria['fuel_type'])
+            query = query.filter(self._equals_any(Car.fuel_type, criteria['fuel_type']))
         
         # نوع القير
         if criteria.get('transmission'):
-            query = query.filter(Car.transmission == criteria['transmission'])
+            query = query.filter(self._equals_any(Car.transmission, criteria['transmission']))
         
         # نوع السيارة
         if criteria.get('car_type'):
-            query = query.filter(Car.car_type == criteria['car_type'])
+            query = query.filter(self._equals_any(Car.car_type, criteria['car_type']))
         
         # الماركة
         if criteria.get('brand'):
             brand_normalized = normalize_arabic(criteria['brand'])
-            query = query.filter(Car.brand_normalized.like(f'%{brand_normalized}%'))  # type: ignore
+            query = query.filter(Car.brand_normalized.contains(brand_normalized, autoescape=True))
         
         # سنة الصنع
         if criteria.get('year_from'):
@@ -169,15 +353,15 @@ class CarSearchEngine:
             except (ValueError, TypeError):
                 pass
         
-        # اللون
+        # اللون (بادئة على العمود المطبع المفهرس)
         if criteria.get('color'):
             color_normalized = normalize_arabic(criteria['color'])
-            query = query.filter(Car.color.contains(color_normalized))
+            query = query.filter(self._starts_with(Car.color_normalized, color_normalized))
         
-        # بلد المنشأ
+        # بلد المنشأ (بادئة على العمود المطبع المفهرس)
         if criteria.get('country_origin'):
             country_normalized = normalize_arabic(criteria['country_origin'])
-            query = query.filter(Car.country_origin.contains(country_normalized))
+            query = query.filter(self._starts_with(Car.country_normalized, country_normalized))
         
         # الميزات الإضافية
         feature_filters = []
@@ -205,13 +389,53 @@ class CarSearchEngine:
         
         return query
     
-    def _apply_sorting(self, query, sort_by: str):
+    @staticmethod
+    def _starts_with(column, prefix: str):
+        """
+        شرط بادئة يخدم من فهرس العمود:
+        LIKE في SQLite غير حساس لحالة الأحرف فلا يستخدم الفهرس العادي، فيكتب كنطاق
+        [prefix, prefix + أعلى محرف) وهو مكافئ له على القيم المطبعة (أحرف صغيرة)؛
+        وفي PostgreSQL يخدم LIKE 'بادئة%' من فهرس text_pattern_ops
+        """
+        if db.engine.dialect.name == 'sqlite':
+            return and_(column >= prefix, column < prefix + '\U0010ffff')
+        return column.startswith(prefix, autoescape=True)
+    
+    @staticmethod
+    def _relevance(search_text: str):
+        """درجة text_relevance (car_criteria) كتعبير SQL حتى يتطابق الترتيب مع فهرس الذاكرة"""
+        text = normalize_search_text(search_text)
+        score = 0.0
+        for column_name, weight in TEXT_SEARCH_WEIGHTS:
+            column = getattr(Car, column_name)
+            score = score + case(
+                (column == text, weight * 2),
+                (column.startswith(text, autoescape=True), weight * 1.5),
+                (column.contains(text, autoescape=True), weight),
+                else_=0.0
+            )
+        return score
+    
+    @staticmethod
+    def _equals_any(column, value):
+        """مساواة لقيمة واحدة أو IN لقائمة قيم (اختيار متعدد في المرشحات)"""
+        if isinstance(value, (list, tuple, set)):
+            return column.in_(list(value))
+        return column == value
+    
+    def _apply_sorting(self, query, sort_by: str, search_text: Optional[str] = None):
         """تطبيق الترتيب على الاستعلام"""
         if sort_by not in self.valid_sorts:
             sort_by = self.default_sort
         
         sort_column, sort_direction = self.valid_sorts[sort_by]
         
+        # الترتيب حسب الصلة يحتاج نص بحث، وإلا يطبق الترتيب الافتراضي
+        if sort_column is None:
+            if sort_by == RELEVANCE_SORT and search_text:
+                return query.order_by(self._relevance(search_text).desc(), Car.id.asc())
+            sort_column, sort_direction = self.valid_sorts[self.default_sort]
+        
         if sort_direction == 'desc':
             query = query.order_by(sort_column.desc())
         else:
@@ -220,7 +444,27 @@ class CarSearchEngine:
         return query
     
     def get_filter_options(self) -> Dict[str, Any]:
-        """الحصول على خيارات المرشحات المتاحة"""
+        """الحصول على خيارات المرشحات المتاحة (من الذاكرة المؤقتة إن أمكن)"""
+        options = self._filter_options
+        if options is None or time.time() - self._filter_options_at > self.filter_options_max_age:
+            with self._filter_options_lock:
+                options = self._filter_options
+                if options is None or time.time() - self._filter_options_at > self.filter_options_max_age:
+                    # من الرئيسية: الخيارات تحفظ حتى filter_options_max_age بعد كل تغيير في السيارات
+                    with use_primary():
+                        options = self._load_filter_options()
+                    self._filter_options = options
+                    self._filter_options_at = time.time()
+        
+        # نسخة حتى لا يعدل المستدعي الذاكرة المؤقتة
+        return copy.deepcopy(options)
+    
+    def invalidate_filter_options(self):
+        """إفراغ ذاكرة خيارات المرشحات ليعاد حسابها عند الطلب التالي"""
+        self._filter_options = None
+    
+    def _load_filter_options(self) -> Dict[str, Any]:
+        """حساب خيارات المرشحات من قاعدة البيانات"""
         
         # الحصول على القيم الفريدة من قاعدة البيانات
         brands = db.session.query(Car.brand).distinct().all()
@@ -267,12 +511,22 @@ class CarSearchEngine:
                 {'value': 'name_asc', 'label': 'الاسم: أ-ي'},
                 {'value': 'name_desc', 'label': 'الاسم: ي-أ'},
                 {'value': 'mileage_asc', 'label': 'المسافة: الأقل أولاً'},
-                {'value': 'mileage_desc', 'label': 'المسافة: الأكثر أولاً'}
+                {'value': 'mileage_desc', 'label': 'المسافة: الأكثر أولاً'},
+                {'value': 'relevance', 'label': 'الأكثر صلة بالبحث'},
+                {'value': BEST_MATCH_SORT, 'label': 'الأفضل مطابقة لمعاييري'}
             ]
         }
     
     def get_similar_cars(self, car_id: int, limit: int = 4) -> List[Dict[str, Any]]:
         """الحصول على سيارات مشابهة"""
+        # جدول الجيران المحسوب مسبقاً: أقرب السيارات بالمتجهات ثم استعلام واحد بالأرقام
+        if similar_cars.is_ready():
+            neighbor_ids = similar_cars.neighbors(car_id, limit)
+            if neighbor_ids is not None:
+                if not neighbor_ids:
+                    return []
+                return [car.to_dict() for car in get_cars_by_ids(neighbor_ids, available_only=True)]
+        
         car = Car.query.get(car_id)
         if not car:
             return []
@@ -280,7 +534,7 @@ class CarSearchEngine:
         # البحث عن سيارات مشابهة بناءً على الماركة ونوع السيارة والسعر
         price_range = car.price * 0.3  # نطاق 30% من السعر
         
-        similar_cars = Car.query.filter(
+        candidates = Car.query.filter(
             and_(
                 Car.id != car_id,
                 Car.is_available == True,
@@ -295,7 +549,7 @@ class CarSearchEngine:
             )
         ).limit(limit).all()
         
-        return [similar_car.to_dict() for similar_car in similar_cars]
+        return [similar_car.to_dict() for similar_car in candidates]
     
     def get_search_suggestions(self, query: str, limit: int = 5) -> List[str]:
         """الحصول على اقتراحات البحث"""
@@ -304,12 +558,16 @@ class CarSearchEngine:
         
         normalized_query = normalize_for_search(query)
         
+        # فهرس المقاطع في الذاكرة يعطي المرشحين مباشرة دون LIKE '%...%'
+        if search_index.is_ready():
+            return search_index.suggestions(normalized_query, limit)
+        
         # البحث في أسماء السيارات والماركات
         suggestions = []
         
         # البحث في الماركات
         brands = db.session.query(Car.brand).filter(
-            Car.brand_normalized.like(f'%{normalized_query}%')  # type: ignore
+            Car.brand_normalized.contains(normalized_query, autoescape=True)
         ).distinct().limit(limit).all()
         
         suggestions.extend([brand[0] for brand in brands])
@@ -318,7 +576,7 @@ class CarSearchEngine:
         if len(suggestions) < limit:
             remaining = limit - len(suggestions)
             names = db.session.query(Car.name).filter(
-                Car.name_normalized.like(f'%{normalized_query}%')  # type: ignore
+                Car.name_normalized.contains(normalized_query, autoescape=True)
             ).distinct().limit(remaining).all()
             
             suggestions.extend([name[0] for name in names])
@@ -0,0 +1,551 @@
+"""
+فهرس بحث عمودي داخل الذاكرة للسيارات
+يحتفظ بكل عمود في مصفوفة مستقلة ويجيب على البحث دون الرجوع لقاعدة البيانات
+"""
+import math
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from models import Car, CAR_FEATURES
+from bitmap_index import BitmapIndex, bitmap_rows, rows_bitmap
+from range_index import SortedRangeIndex
+from trigram_index import TrigramIndex
+from utils import normalize_arabic, normalize_page_args, pagination_info
+from car_criteria import RELEVANCE_SORT, normalize_search_text, text_relevance
+from catalog_events import snapshot_car, subscribe
+from db_routing import use_primary
+from facets import FacetCounter
+from match_scoring import BEST_MATCH_SORT, rank_rows
+
+NULL = float('nan')  # القيم الفارغة في الأعمدة الرقمية (تفشل كل المقارنات مثل NULL في SQL)
+
+ENUM_COLUMNS = ('performance_level', 'fuel_type', 'transmission', 'car_type')
+NUMERIC_COLUMNS = ('price', 'year', 'mileage', 'engine_size', 'doors')
+BITMAP_COLUMNS = ENUM_COLUMNS + ('doors',)
+RANGE_COLUMNS = ('price', 'year', 'mileage', 'engine_size')
+
+# مرشحات النطاق: المفتاح في المعايير -> (العمود، التحويل، نوع الحد)
+RANGE_CRITERIA = (
+    ('budget', 'price', float, 'max'),
+    ('price_min', 'price', float, 'min'),
+    ('price_max', 'price', float, 'max'),
+    ('year_from', 'year', int, 'min'),
+    ('year_to', 'year', int, 'max'),
+    ('engine_size_min', 'engine_size', float, 'min'),
+    ('engine_size_max', 'engine_size', float, 'max'),
+    ('mileage_max', 'mileage', int, 'max'),
+)
+
+# الحقول النصية المفهرسة بالمقاطع -> دالة استخراج النص المطبع من اللقطة
+# (نفس أعمدة TEXT_SEARCH_COLUMNS التي يطابقها نص البحث في كل المسارات)
+TEXT_FIELDS = {
+    'name': lambda snapshot: snapshot.get('name_normalized') or '',
+    'brand': lambda snapshot: snapshot.get('brand_normalized') or '',
+    'model': lambda snapshot: snapshot.get('model_normalized') or '',
+}
+
+# الحقول الإضافية في اللقطة التي لا تظهر في نتائج to_dict
+_SNAPSHOT_EXTRAS = ('name_normalized', 'brand_normalized', 'model_normalized', 'color_normalized',
+                    'country_normalized')
+
+
+def _number(value) -> float:
+    return NULL if value is None else float(value)
+
+
+def _parse(criteria: Dict[str, Any], key: str, cast: Callable) -> Optional[float]:
+    """قراءة قيمة رقمية من المعايير بنفس تساهل _apply_filters"""
+    if not criteria.get(key):
+        return None
+    try:
+        return cast(criteria[key])
+    except (ValueError, TypeError):
+        return None
+
+
+class _ColumnStore:
+    """التخزين العمودي: صف لكل سيارة ومصفوفة لكل عمود"""
+
+    def __init__(self):
+        self.row_of: Dict[int, int] = {}
+        self.ids = array('q')
+        self.alive = array('b')
+        self.available = array('b')
+        self.numeric = {column: array('d') for column in NUMERIC_COLUMNS}
+        self.codes = {column: array('H') for column in ENUM_COLUMNS}
+        self.dictionaries: Dict[str, Dict[Any, int]] = {column: {None: 0} for column in ENUM_COLUMNS}
+        self.features = array('B')
+        self.available_bits = 0
+        self.bitmaps = {column: BitmapIndex() for column in BITMAP_COLUMNS}
+        self.feature_bitmaps = BitmapIndex()
+        self.ranges = {column: SortedRangeIndex() for column in RANGE_COLUMNS + ('name',)}
+        self.text_indexes = {field: TrigramIndex() for field in TEXT_FIELDS}
+        self.bulk_loading = False
+        self.name = []
+        self.name_normalized = []
+        self.brand_normalized = []
+        self.model_normalized = []
+        self.color_normalized = []
+        self.country_normalized = []
+        self.payloads: List[Dict[str, Any]] = []
+        self.snapshots: List[Dict[str, Any]] = []
+        self.tombstones = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_snapshots(cls, snapshots: List[Dict[str, Any]]) -> '_ColumnStore':
+        """بناء التخزين دفعة واحدة: تعبئة الأعمدة ثم بناء كل فهرس في تمريرة واحدة"""
+        store = cls()
+        store.bulk_loading = True
+        for snapshot in snapshots:
+            store.upsert(snapshot)
+        store.bulk_loading = False
+
+        live_rows = [row for row in range(len(store)) if store.alive[row]]
+        snapshots_of = store.snapshots
+        store.available_bits = rows_bitmap(row for row in live_rows if store.available[row])
+        for column in BITMAP_COLUMNS:
+            store.bitmaps[column].load((row, snapshots_of[row].get(column)) for row in live_rows)
+        store.feature_bitmaps.load((row, feature) for row in live_rows
+                                   for feature in CAR_FEATURES if snapshots_of[row].get(feature))
+        for field, extract in TEXT_FIELDS.items():
+            store.text_indexes[field].load((row, extract(snapshots_of[row])) for row in live_rows)
+        for column in RANGE_COLUMNS:
+            values = store.numeric[column]
+            store.ranges[column].load((values[row], store.ids[row], row) for row in live_rows)
+        store.ranges['name'].load((store.name[row], store.ids[row], row) for row in live_rows)
+        return store
+
+    def code_for(self, column: str, value) -> int:
+        dictionary = self.dictionaries[column]
+        code = dictionary.get(value)
+        if code is None:
+            code = len(dictionary)
+            dictionary[value] = code
+        return code
+
+    def upsert(self, snapshot: Dict[str, Any]):
+        row = self.row_of.get(snapshot['id'])
+        if row is None:
+            self._append(snapshot)
+        else:
+            self._write(row, snapshot)
+
+    def delete(self, car_id: int):
+        row = self.row_of.pop(car_id, None)
+        if row is None:
+            return
+        self._unindex(row)
+        self.alive[row] = 0
+        self.available[row] = 0
+        self.payloads[row] = None
+        self.snapshots[row] = None
+        self.tombstones += 1
+
+    def match_columns(self) -> Dict[str, array]:
+        """الأعمدة التي يحسب منها ترتيب الأفضل مطابقة"""
+        return {
+            'id': self.ids,
+            'price': self.numeric['price'],
+            'year': self.numeric['year'],
+            'mileage': self.numeric['mileage'],
+            'features': self.features
+        }
+
+    def live_snapshots(self) -> List[Dict[str, Any]]:
+        return [self.snapshots[row] for row in range(len(self)) if self.alive[row]]
+
+    def _append(self, snapshot: Dict[str, Any]):
+        row = len(self.ids)
+        self.row_of[snapshot['id']] = row
+        self.ids.append(snapshot['id'])
+        self.alive.append(1)
+        self.available.append(0)
+        for column in NUMERIC_COLUMNS:
+            self.numeric[column].append(NULL)
+        for column in ENUM_COLUMNS:
+            self.codes[column].append(0)
+        self.features.append(0)
+        for column in (self.name, self.name_normalized, self.brand_normalized, self.model_normalized,
+                       self.color_normalized, self.country_normalized, self.payloads):
+            column.append(None)
+        self.snapshots.append(None)
+        self._write(row, snapshot)
+
+    def _unindex(self, row: int):
+        """إزالة الصف من كل الفهارس قبل إعادة كتابته أو حذفه"""
+        old = self.snapshots[row]
+        if old is None or self.bulk_loading:
+            return
+        car_id = self.ids[row]
+        self.available_bits &= ~(1 << row)
+        for column in BITMAP_COLUMNS:
+            self.bitmaps[column].remove(row, old.get(column))
+        for feature in CAR_FEATURES:
+            if old.get(feature):
+                self.feature_bitmaps.remove(row, feature)
+        for field, extract in TEXT_FIELDS.items():
+            self.text_indexes[field].remove(row, extract(old))
+        for column in RANGE_COLUMNS:
+            self.ranges[column].remove(_number(old.get(column)), car_id, row)
+        self.ranges['name'].remove(old.get('name') or '', car_id, row)
+
+    def _index(self, row: int, snapshot: Dict[str, Any]):
+        """إضافة الصف إلى كل الفهارس (التحميل الجماعي يبنيها لاحقاً دفعة واحدة)"""
+        if self.bulk_loading:
+            return
+        car_id = self.ids[row]
+        if snapshot.get('is_available'):
+            self.available_bits |= 1 << row
+        for column in BITMAP_COLUMNS:
+            self.bitmaps[column].add(row, snapshot.get(column))
+        for feature in CAR_FEATURES:
+            if snapshot.get(feature):
+                self.feature_bitmaps.add(row, feature)
+        for field, extract in TEXT_FIELDS.items():
+            self.text_indexes[field].add(row, extract(snapshot))
+        for column in RANGE_COLUMNS:
+            self.ranges[column].add(self.numeric[column][row], car_id, row)
+        self.ranges['name'].add(self.name[row], car_id, row)
+
+    def _write(self, row: int, snapshot: Dict[str, Any]):
+        self._unindex(row)
+        self.available[row] = 1 if snapshot.get('is_available') else 0
+        for column in NUMERIC_COLUMNS:
+            self.numeric[column][row] = _number(snapshot.get(column))
+        for column in ENUM_COLUMNS:
+            self.codes[column][row] = self.code_for(column, snapshot.get(column))
+
+        bits = 0
+        for bit, feature in enumerate(CAR_FEATURES):
+            if snapshot.get(feature):
+                bits |= 1 << bit
+        self.features[row] = bits
+
+        self.name[row] = snapshot.get('name') or ''
+        self.name_normalized[row] = snapshot.get('name_normalized') or ''
+        self.brand_normalized[row] = snapshot.get('brand_normalized') or ''
+        self.model_normalized[row] = snapshot.get('model_normalized') or ''
+        self.color_normalized[row] = snapshot.get('color_normalized')
+        self.country_normalized[row] = snapshot.get('country_normalized')
+        self.payloads[row] = {key: value for key, value in snapshot.items() if key not in _SNAPSHOT_EXTRAS}
+        self.snapshots[row] = snapshot
+        self._index(row, snapshot)
+
+
+class CarSearchIndex:
+    """فهرس البحث العمودي مع تحديث تدريجي عند تغير السيارات"""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_age = 300
+        self._lock = threading.RLock()
+        self._store: Optional[_ColumnStore] = None
+        self._built_at = 0.0
+
+    def init_app(self, app):
+        """ربط الفهرس بالتطبيق حسب إعدادات SEARCH_INDEX_*"""
+        self.enabled = app.config.get('SEARCH_INDEX_ENABLED', False)
+        self.max_age = app.config.get('SEARCH_INDEX_MAX_AGE', 300)
+        if self.enabled:
+            subscribe(self.apply_changes, self.invalidate)
+
+    def is_ready(self) -> bool:
+        """هل يمكن الإجابة من الفهرس؟ (يبني الفهرس عند أول استخدام أو عند تقادمه)"""
+        if not self.enabled:
+            return False
+        if self._store is None or (self.max_age and time.time() - self._built_at > self.max_age):
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"خطأ في بناء فهرس البحث: {e}")
+                return False
+        return True
+
+    def rebuild(self):
+        """إعادة بناء الفهرس بالكامل من قاعدة البيانات (الرئيسية، لا نسخة القراءة)"""
+        with use_primary():
+            snapshots = [snapshot_car(car) for car in Car.query.order_by(Car.id).all()]
+        store = _ColumnStore.from_snapshots(snapshots)
+        with self._lock:
+            self._store = store
+            self._built_at = time.time()
+
+    def invalidate(self):
+        """إسقاط الفهرس ليعاد بناؤه عند البحث التالي"""
+        with self._lock:
+            self._store = None
+
+    def apply_changes(self, upserted: List[Dict[str, Any]], deleted_ids: List[int]):
+        """تطبيق تغييرات السيارات على الفهرس دون إعادة بنائه"""
+        with self._lock:
+            store = self._store
+            if store is None:
+                return
+            for car_id in deleted_ids:
+                store.delete(car_id)
+            for snapshot in upserted:
+                store.upsert(snapshot)
+            # ضغط الصفوف المحذوفة عندما تصبح أكثر من نصف الفهرس
+            if store.tombstones > 64 and store.tombstones * 2 > len(store):
+                self._store = _ColumnStore.from_snapshots(store.live_snapshots())
+
+    def search(self, criteria: Dict[str, Any], page: int, per_page: int,
+               sort: Tuple[str, str], with_facets: bool = False, keyset: bool = False,
+               after: Optional[Tuple[Any, int]] = None) -> Dict[str, Any]:
+        """
+        تنفيذ البحث من الفهرس وإرجاع نفس قاموس CarSearchEngine.search
+        keyset: الصفحة تبدأ بعد الموضع after = (قيمة الترتيب، رقم السيارة) بدلاً من رقم الصفحة
+                (وفي ترتيب الأفضل مطابقة after هو عدد النتائج السابقة)
+        """
+        with self._lock:
+            if self._store is None:
+                self.rebuild()
+            store = self._store
+            rows = self._matching_rows(store, criteria)
+
+            total = len(rows)
+            page_num, page_size = normalize_page_args(page, per_page)
+            if sort[0] in (BEST_MATCH_SORT, RELEVANCE_SORT):
+                # الدرجة ليست عموداً مفهرساً: ترتب كل الصفوف المطابقة دفعة واحدة ثم تقص الصفحة
+                start = (after or 0) if keyset else (page_num - 1) * page_size
+                stop = start + page_size + (1 if keyset else 0)
+                if sort[0] == BEST_MATCH_SORT:
+                    page_rows = rank_rows(store.match_columns(), rows, criteria, limit=stop)[start:stop]
+                else:
+                    page_rows = self._relevance_rows(store, rows, criteria.get('search_text') or '')[start:stop]
+            elif keyset:
+                page_rows = self._page_rows(store, rows, sort, 0, page_size + 1, after)
+            else:
+                offset = (page_num - 1) * page_size
+                page_rows = self._page_rows(store, rows, sort, offset, page_size)
+            cars = [dict(store.payloads[row]) for row in page_rows[:page_size]]
+            facets = self._facets(store, rows) if with_facets else None
+
+        if keyset:
+            result = {
+                'cars': cars,
+                'total': total,
+                'per_page': page_size,
+                'has_next': len(page_rows) > page_size
+            }
+        else:
+            result = {
+                'cars': cars,
+                'total': total,
+                'page': page,
+                'per_page': per_page
+            }
+            result.update(pagination_info(total, page_num, page_size))
+        result['errors'] = {}
+        if facets is not None:
+            result['facets'] = facets
+        return result
+
+    @staticmethod
+    def _relevance_rows(store: _ColumnStore, rows: List[int], search_text: str) -> List[int]:
+        """الصفوف مرتبة بدرجة text_relevance تنازلياً ثم رقم السيارة (مثل ترتيب قاعدة البيانات)"""
+        text = normalize_search_text(search_text)
+        columns = {'name_normalized': store.name_normalized, 'brand_normalized': store.brand_normalized,
+                   'model_normalized': store.model_normalized}
+        payloads = store.payloads
+
+        def key(row):
+            return -text_relevance(text, lambda column: columns[column][row]), payloads[row]['id']
+        return sorted(rows, key=key)
+
+    @staticmethod
+    def _facets(store: _ColumnStore, rows: List[int]) -> Dict[str, Any]:
+        """أعداد المرشحات للصفوف المطابقة في تمريرة واحدة على الأعمدة"""
+        counter = FacetCounter()
+        payloads, price, year, features = store.payloads, store.numeric['price'], store.numeric['year'], store.features
+        for row in rows:
+            bits = features[row]
+            counter.add(payloads[row], price[row], year[row],
+                        [feature for bit, feature in enumerate(CAR_FEATURES) if bits >> bit & 1])
+        return counter.result()
+
+    def _candidate_bits(self, store: _ColumnStore, criteria: Dict[str, Any]) -> int:
+        """
+        حل المرشحات التصنيفية والمنطقية بعمليات AND/OR على الفهارس النقطية
+        القيمة المفردة مساواة، والقائمة تعني أياً من القيم
+        """
+        bits = store.available_bits
+
+        for column in ENUM_COLUMNS:
+            value = criteria.get(column)
+            if not value:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                bits &= store.bitmaps[column].any_of(value)
+            else:
+                bits &= store.bitmaps[column].get(value)
+
+        doors = _parse(criteria, 'doors', int)
+        if doors is not None:
+            bits &= store.bitmaps['doors'].get(doors)
+
+        features = [feature for feature in CAR_FEATURES if criteria.get(feature)]
+        if features:
+            bits &= store.feature_bitmaps.all_of(features)
+
+        return bits
+
+    def _matching_rows(self, store: _ColumnStore, criteria: Dict[str, Any]) -> List[int]:
+        """الفهارس النقطية أولاً ثم شروط النطاقات والنص على الصفوف المرشحة فقط"""
+        bits = self._candidate_bits(store, criteria)
+        if not bits:
+            return []
+
+        predicates = []
+        numeric = store.numeric
+
+        if criteria.get('search_text'):
+            text = normalize_search_text(criteria['search_text'])
+            text_bits = self._text_candidates(store, text, TEXT_FIELDS)
+            if text_bits is not None:
+                bits &= text_bits
+                if not bits:
+                    return []
+            names, brands, models = store.name_normalized, store.brand_normalized, store.model_normalized
+            predicates.append(lambda row: text in names[row] or text in brands[row]
+                              or text in models[row])
+
+        # أكثر نطاق انتقائية يخدم من فهرسه المرتب، والباقي يفحص على المصفوفات
+        bounds = self._range_bounds(criteria)
+        if bounds:
+            ranges = store.ranges
+            driver = min(bounds, key=lambda column: ranges[column].count_between(*bounds[column]))
+            bits &= rows_bitmap(ranges[driver].rows_between(*bounds[driver]))
+            if not bits:
+                return []
+            for column, (lo, hi) in bounds.items():
+                if column == driver:
+                    continue
+                values = numeric[column]
+                if lo is not None:
+                    predicates.append(lambda row, values=values, lo=lo: values[row] >= lo)
+                if hi is not None:
+                    predicates.append(lambda row, values=values, hi=hi: values[row] <= hi)
+
+        if criteria.get('brand'):
+            brand = normalize_arabic(criteria['brand'])
+            brand_bits = self._text_candidates(store, brand, ('brand',))
+            if brand_bits is not None:
+                bits &= brand_bits
+            brands = store.brand_normalized
+            predicates.append(lambda row: brand in brands[row])
+
+        # اللون وبلد المنشأ: بادئة القيمة المطبعة (مثل فهرس العمود في قاعدة البيانات)
+        for key, values in (('color', store.color_normalized), ('country_origin', store.country_normalized)):
+            if criteria.get(key):
+                prefix = normalize_arabic(criteria[key])
+                predicates.append(lambda row, values=values, prefix=prefix:
+                                  values[row] is not None and values[row].startswith(prefix))
+
+        rows = bitmap_rows(bits)
+        if not predicates:
+            return rows
+        return [row for row in rows if all(predicate(row) for predicate in predicates)]
+
+    @staticmethod
+    def _text_candidates(store: _ColumnStore, text: str, fields) -> Optional[int]:
+        """اتحاد المرشحين من فهارس المقاطع للحقول المطلوبة (None = النص قصير ويلزم المسح)"""
+        bits = 0
+        for field in fields:
+            field_bits = store.text_indexes[field].candidates(text)
+            if field_bits is None:
+                return None
+            bits |= field_bits
+        return bits
+
+    def suggestions(self, normalized_query: str, limit: int) -> List[str]:
+        """اقتراحات البحث: الماركات ثم أسماء السيارات التي تحتوي على النص"""
+        with self._lock:
+            if self._store is None:
+                self.rebuild()
+            store = self._store
+            suggestions: List[str] = []
+
+            for field, texts, column in (('brand', store.brand_normalized, 'brand'),
+                                         ('name', store.name_normalized, 'name')):
+                seen = set()
+                bits = store.text_indexes[field].candidates(normalized_query)
+                rows = bitmap_rows(bits) if bits is not None else range(len(store))
+                for row in rows:
+                    if len(suggestions) >= limit:
+                        return suggestions
+                    if not store.alive[row] or normalized_query not in texts[row]:
+                        continue
+                    value = store.payloads[row][column]
+                    if value not in seen:
+                        seen.add(value)
+                        suggestions.append(value)
+            return suggestions
+
+    @staticmethod
+    def _range_bounds(criteria: Dict[str, Any]) -> Dict[str, List[Optional[float]]]:
+        """دمج مرشحات النطاق في حد أدنى وأعلى لكل عمود"""
+        bounds: Dict[str, List[Optional[float]]] = {}
+        for key, column, cast, kind in RANGE_CRITERIA:
+            value = _parse(criteria, key, cast)
+            if value is None:
+                continue
+            lo, hi = bounds.setdefault(column, [None, None])
+            if kind == 'min':
+                bounds[column][0] = value if lo is None else max(lo, value)
+            else:
+                bounds[column][1] = value if hi is None else min(hi, value)
+        return bounds
+
+    @staticmethod
+    def _page_rows(store: _ColumnStore, rows: List[int], sort: Tuple[str, str],
+                   offset: int, limit: int, after: Optional[Tuple[Any, int]] = None) -> List[int]:
+        """
+        صفوف الصفحة المطلوبة بالترتيب
+        المجموعات الكبيرة تقرأ من فهرس النطاق المرتب وتتوقف عند نهاية الصفحة،
+        والصغيرة تفرز مباشرة؛ الطريقتان تعطيان نفس الترتيب (القيم الفارغة أولاً تصاعدياً)
+        after: البدء بعد الموضع (القيمة، رقم السيارة) بالتنصيف في الفهرس المرتب
+        """
+        column, direction = sort
+        descending = direction == 'desc'
+
+        if len(rows) * 4 >= len(store):
+            wanted = bytearray(len(store))
+            for row in rows:
+                wanted[row] = 1
+            page = []
+            needed = offset + limit
+            for row in store.ranges[column].ordered_rows(descending, after):
+                if wanted[row]:
+                    page.append(row)
+                    if len(page) >= needed:
+                        break
+            return page[offset:]
+
+        ids = store.ids
+        if column == 'name':
+            values = store.name
+            key = lambda row: (1, values[row], ids[row])
+        else:
+            values = store.numeric[column]
+            key = lambda row: (0, 0.0, ids[row]) if math.isnan(values[row]) else (1, values[row], ids[row])
+
+        if after is not None:
+            value, car_id = after
+            if value is None:
+                start = (0, '' if column == 'name' else 0.0, car_id)
+            else:
+                start = (1, value, car_id)
+            if descending:
+                rows = [row for row in rows if key(row) < start]
+            else:
+                rows = [row for row in rows if key(row) > start]
+        return sorted(rows, key=key, reverse=descending)[offset:offset + limit]
+
+
+# إنشاء مثيل عام من فهرس البحث
+search_index = CarSearchIndex()
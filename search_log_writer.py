@@ -0,0 +1,138 @@
+"""
+كاتب سجل البحث في الخلفية
+عمليات البحث تضع السجلات في طابور داخل الذاكرة، وخيط واحد يكتبها بإدراج جماعي
+كل SEARCH_LOG_BATCH_SIZE سجل أو كل SEARCH_LOG_FLUSH_MS ملي ثانية،
+فلا ينتظر المستخدم معاملة كتابة ولا تتنافس عمليات البحث على قفل الكتابة في SQLite
+"""
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from models import SearchLog, db
+from stats_counters import stats_counters
+
+# علامات التحكم في الطابور
+_FLUSH = object()
+_STOP = object()
+
+
+class SearchLogWriter:
+    """طابور سجلات البحث مع خيط كتابة جماعية"""
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 100
+        self.flush_interval = 0.5
+        self.dropped = 0
+        self._app = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """ربط الكاتب بالتطبيق حسب إعدادات SEARCH_LOG_*"""
+        self.shutdown()
+        self._app = app
+        self.enabled = app.config.get('SEARCH_LOG_ASYNC', False)
+        self.batch_size = max(1, app.config.get('SEARCH_LOG_BATCH_SIZE', 100))
+        self.flush_interval = max(1, app.config.get('SEARCH_LOG_FLUSH_MS', 500)) / 1000.0
+        self._queue = queue.Queue(maxsize=app.config.get('SEARCH_LOG_MAX_QUEUE', 10000))
+
+    def log(self, criteria: Dict[str, Any], results_count: Optional[int], user_ip: Optional[str]):
+        """تسجيل عملية بحث (في الطابور، أو مباشرة إذا كانت الكتابة في الخلفية معطلة)"""
+        entry = {
+            'search_criteria': json.dumps(criteria, ensure_ascii=False),
+            'results_count': results_count,
+            'user_ip': user_ip,
+            # وقت البحث نفسه وليس وقت الكتابة
+            'created_at': datetime.utcnow()
+        }
+
+        if not self.enabled or self._queue is None:
+            try:
+                db.session.add(SearchLog(**entry))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"خطأ في تسجيل البحث: {e}")
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # السجل تحليلي فقط: لا نبطئ البحث عند امتلاء الطابور
+            self.dropped += 1
+
+    def flush(self):
+        """انتظار كتابة كل السجلات الموجودة في الطابور الآن"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def shutdown(self, timeout: float = 5.0):
+        """إيقاف الخيط بعد كتابة ما تبقى في الطابور"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch: List[Dict[str, Any]] = []
+        received = 0
+        deadline = 0.0
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+                received += 1
+            except queue.Empty:
+                item = _FLUSH
+
+            if item is not _FLUSH and item is not _STOP:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+
+            self._write(batch)
+            batch = []
+            for _ in range(received):
+                self._queue.task_done()
+            received = 0
+
+            if item is _STOP:
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(insert(SearchLog.__table__), batch)
+            # الإدراج الجماعي لا يمر بأحداث النموذج فيحدث العداد هنا
+            stats_counters.apply({'searches': len(batch)})
+        except Exception as e:
+            print(f"خطأ في كتابة سجل البحث ({len(batch)} سجل): {e}")
+
+
+# إنشاء مثيل عام من كاتب سجل البحث
+search_log_writer = SearchLogWriter()
+atexit.register(search_log_writer.shutdown)
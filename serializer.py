@@ -0,0 +1,120 @@
+"""
+تحويل السيارات إلى قواميس و JSON بملامح حقول ثابتة
+لكل ملمح قائمة حقول مترجمة مرة واحدة (attrgetter/itemgetter)، فتحويل كل سيارة قراءة واحدة للقيم
+ثم dict(zip)، والتواريخ تترك لمرمز JSON (orjson إن كان مثبتاً، وإلا json بنفس صيغة isoformat)
+المفاتيح مرتبة في JSON كما في jsonify، فلا يتغير شكل مخرجات API؛ ترتيب الملامح يبقى لقواميس Python
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter, itemgetter
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # orjson اختيارية: الترميز يعمل بدونها بنفس المخرجات
+    orjson = None
+
+DATETIME_FIELDS = frozenset({'created_at', 'updated_at'})
+
+_SPECS = ('id', 'name', 'brand', 'model', 'year', 'price', 'performance_level', 'fuel_type', 'transmission',
+          'engine_size', 'doors', 'car_type', 'color', 'mileage', 'country_origin')
+_FEATURES = ('leather_seats', 'sunroof', 'gps_system', 'backup_camera', 'entertainment_system', 'safety_features')
+
+# ملامح الحقول: الاسم -> الحقول بترتيب الإخراج
+PROFILES: Dict[str, Tuple[str, ...]] = {
+    # Car.to_dict ونتائج البحث
+    'full': _SPECS + _FEATURES + ('description', 'image_url', 'is_available', 'is_featured',
+                                  'created_at', 'updated_at'),
+    # /api/cars و /api/cars/<id>
+    'detail': _SPECS + ('description', 'image_url') + _FEATURES + ('created_at',),
+    # بطاقات أحدث السيارات (/api/latest-cars)
+    'card': ('id', 'name', 'brand', 'model', 'year', 'price', 'fuel_type', 'transmission', 'mileage',
+             'image_url', 'gps_system', 'backup_camera'),
+    # السيارات المشابهة في صفحة التفاصيل
+    'similar': ('id', 'name', 'brand', 'model', 'year', 'price', 'image_url'),
+    # صفوف قائمة السيارات للمدير
+    'admin_row': ('id', 'name', 'brand', 'model', 'year', 'price', 'is_available', 'image_url', 'created_at'),
+    # أحدث السيارات في إحصائيات لوحة التحكم
+    'admin_recent': ('id', 'name', 'brand', 'price', 'created_at'),
+}
+
+
+class CarProfile:
+    """ملمح مترجم: قراءة حقوله من كائن Car أو من قاموس قيم بعملية واحدة"""
+
+    __slots__ = ('name', 'fields', '_attributes', '_items', '_datetimes')
+
+    def __init__(self, name: str, fields: Tuple[str, ...]):
+        self.name = name
+        self.fields = fields
+        self._attributes = attrgetter(*fields)
+        self._items = itemgetter(*fields)
+        self._datetimes = tuple(position for position, field in enumerate(fields) if field in DATETIME_FIELDS)
+
+    def row(self, car) -> Dict[str, Any]:
+        """قاموس القيم الخام (التواريخ كما هي) جاهز للترميز بـ dumps"""
+        return dict(zip(self.fields, self._attributes(car)))
+
+    def rows(self, cars: Iterable) -> List[Dict[str, Any]]:
+        fields, attributes = self.fields, self._attributes
+        return [dict(zip(fields, attributes(car))) for car in cars]
+
+    def row_from_values(self, values: Mapping[str, Any]) -> Dict[str, Any]:
+        """نفس الملمح من قاموس سيارة (مثل نتيجة to_dict أو لقطة فهرس البحث)"""
+        return dict(zip(self.fields, self._items(values)))
+
+    def to_dict(self, car) -> Dict[str, Any]:
+        """قاموس بالتواريخ كنص ISO (لاستخدامه خارج JSON مثل القوالب والذاكرة المؤقتة)"""
+        values = self._attributes(car)
+        if self._datetimes:
+            values = list(values)
+            for position in self._datetimes:
+                if values[position] is not None:
+                    values[position] = values[position].isoformat()
+        return dict(zip(self.fields, values))
+
+
+_PROFILES: Dict[str, CarProfile] = {name: CarProfile(name, fields) for name, fields in PROFILES.items()}
+
+
+def car_profile(name: str) -> CarProfile:
+    """الملمح المترجم بالاسم (KeyError للاسم غير المعروف)"""
+    return _PROFILES[name]
+
+
+def car_to_dict(car, profile: str = 'full') -> Dict[str, Any]:
+    """قاموس السيارة بحقول الملمح والتواريخ كنص ISO"""
+    return _PROFILES[profile].to_dict(car)
+
+
+def serialize_cars(cars: Iterable, profile: str) -> List[Dict[str, Any]]:
+    """صفوف السيارات بحقول الملمح (التواريخ يرمزها json_response)"""
+    return _PROFILES[profile].rows(cars)
+
+
+def serialize_values(cars: Iterable[Mapping[str, Any]], profile: str) -> List[Dict[str, Any]]:
+    """نفس الملمح من قواميس سيارات جاهزة (نتائج to_dict أو لقطات فهرس البحث)"""
+    return [_PROFILES[profile].row_from_values(values) for values in cars]
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"قيمة غير قابلة للتحويل إلى JSON: {type(value).__name__}")
+
+
+def dumps(payload: Any) -> bytes:
+    """ترميز JSON كبايتات UTF-8 بمفاتيح مرتبة (orjson إن وجدت)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True,
+                      default=_default).encode('utf-8')
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    """استجابة JSON بديلة عن jsonify بالترميز السريع"""
+    return Response(dumps(payload), status=status, mimetype='application/json')
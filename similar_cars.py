@@ -0,0 +1,246 @@
+"""
+جدول السيارات المشابهة المحسوب مسبقاً
+كل سيارة تمثل بمتجه رقمي (السعر، السنة، المسافة، حجم المحرك، الفئات، الميزات)
+ويحفظ لكل سيارة أقرب K سيارة متاحة، ويحدث الجدول تدريجياً عند تعديل السيارات
+"""
+import heapq
+import math
+import threading
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from models import Car, CAR_FEATURES
+from catalog_events import subscribe
+from db_routing import use_primary
+
+# الأعمدة الرقمية ووزن كل منها (القيم تطبع بالانحراف المعياري، والسعر والمسافة بمقياس لوغاريتمي)
+NUMERIC_WEIGHTS = (
+    ('price', 3.0, True),
+    ('year', 1.5, False),
+    ('mileage', 1.0, True),
+    ('engine_size', 1.0, False)
+)
+
+# الأعمدة التصنيفية: اختلاف القيمة يضيف الوزن كاملاً (مكافئ لترميز one-hot)
+CATEGORY_WEIGHTS = (
+    ('brand_normalized', 2.0),
+    ('car_type', 2.0),
+    ('fuel_type', 1.0),
+    ('performance_level', 1.0),
+    ('transmission', 0.5)
+)
+
+# وزن كل ميزة مختلفة بين السيارتين
+FEATURE_WEIGHT = 0.25
+
+_VECTOR_COLUMNS = ('id', 'is_available') + tuple(column for column, _, _ in NUMERIC_WEIGHTS) \
+    + tuple(column for column, _ in CATEGORY_WEIGHTS) + CAR_FEATURES
+
+
+class CarVector(NamedTuple):
+    numeric: Tuple[float, ...]
+    categories: Tuple[Any, ...]
+    features: int
+    available: bool
+
+
+def _raw_numeric(values: Mapping[str, Any], column: str, logarithmic: bool) -> Optional[float]:
+    value = values.get(column)
+    if value is None:
+        return None
+    value = float(value)
+    return math.log1p(max(value, 0.0)) if logarithmic else value
+
+
+def car_distance(a: CarVector, b: CarVector) -> float:
+    """مربع المسافة الموزونة بين سيارتين"""
+    distance = 0.0
+    for (_, weight, _), x, y in zip(NUMERIC_WEIGHTS, a.numeric, b.numeric):
+        distance += weight * (x - y) * (x - y)
+    for (_, weight), x, y in zip(CATEGORY_WEIGHTS, a.categories, b.categories):
+        if x != y:
+            distance += weight
+    differing = a.features ^ b.features
+    if differing:
+        distance += FEATURE_WEIGHT * bin(differing).count('1')
+    return distance
+
+
+class SimilarCarsIndex:
+    """
+    متجهات السيارات وجدول الجيران (رقم السيارة -> أقرب K سيارة متاحة)
+    قائمة كل سيارة تحسب عند أول طلب لها (مرور واحد على المتجهات)، وللكتالوجات حتى precompute_limit
+    تكمل القوائم الناقصة في خيط خلفي بعد البناء والتعديل، فلا يحسب الجدول كاملاً في مسار الطلب،
+    وعند تعديل سيارة تقارن بالقوائم المحفوظة فقط بدلاً من إعادة الحساب
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.k = 8
+        self.max_age = 3600
+        self.precompute_limit = 2000
+        self._vectors: Optional[Dict[int, CarVector]] = None
+        self._neighbors: Dict[int, List[Tuple[float, int]]] = {}
+        self._scales: Dict[str, Tuple[float, float]] = {}
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+        self._precompute_thread: Optional[threading.Thread] = None
+
+    def init_app(self, app):
+        """ربط الجدول بالتطبيق حسب إعدادات SIMILAR_CARS_*"""
+        self.enabled = app.config.get('SIMILAR_CARS_ENABLED', False)
+        self.k = max(1, app.config.get('SIMILAR_CARS_K', 8))
+        self.max_age = app.config.get('SIMILAR_CARS_MAX_AGE', 3600)
+        self.precompute_limit = app.config.get('SIMILAR_CARS_PRECOMPUTE_LIMIT', 2000)
+        if self.enabled:
+            subscribe(self.apply_changes, self.invalidate)
+
+    def is_ready(self) -> bool:
+        if not self.enabled:
+            return False
+        if self._vectors is None or (self.max_age and time.time() - self._built_at > self.max_age):
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"خطأ في بناء جدول السيارات المشابهة: {e}")
+                return False
+        return True
+
+    def rebuild(self):
+        """حساب المتجهات (ومقاييس التطبيع) من قاعدة البيانات، والجيران تكمل في الخلفية"""
+        columns = [getattr(Car, column) for column in _VECTOR_COLUMNS]
+        with use_primary():
+            rows = [row._mapping for row in Car.query.with_entities(*columns)]
+
+        scales = {}
+        for column, _, logarithmic in NUMERIC_WEIGHTS:
+            values = [value for value in (_raw_numeric(row, column, logarithmic) for row in rows)
+                      if value is not None]
+            mean = sum(values) / len(values) if values else 0.0
+            variance = sum((value - mean) ** 2 for value in values) / len(values) if values else 0.0
+            scales[column] = (mean, math.sqrt(variance) or 1.0)
+
+        with self._lock:
+            self._scales = scales
+            self._vectors = {row['id']: self._vector(row) for row in rows}
+            self._neighbors = {}
+            self._built_at = time.time()
+        self._start_precompute()
+
+    def invalidate(self):
+        with self._lock:
+            self._vectors = None
+            self._neighbors = {}
+
+    def neighbors(self, car_id: int, limit: int) -> Optional[List[int]]:
+        """أرقام أقرب السيارات المتاحة مرتبة، أو None إذا كانت السيارة غير معروفة"""
+        with self._lock:
+            if self._vectors is None or car_id not in self._vectors:
+                return None
+            entry = self._neighbors.get(car_id)
+            if entry is None:
+                entry = self._compute(car_id)
+                self._neighbors[car_id] = entry
+            return [neighbor_id for _, neighbor_id in entry[:limit]]
+
+    def apply_changes(self, upserted: List[Dict[str, Any]], deleted_ids: List[int]):
+        """
+        تحديث تدريجي بعد commit:
+        القوائم التي تحتوي سيارة تغيرت تحذف لتحسب عند الطلب أو في الخلفية، والسيارة المتاحة الجديدة
+        أو المعدلة تضاف إلى القوائم المحفوظة التي أصبحت من أقرب K سيارة فيها
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+
+            changed = set(deleted_ids) | {snapshot['id'] for snapshot in upserted}
+            for car_id in changed:
+                self._vectors.pop(car_id, None)
+                self._neighbors.pop(car_id, None)
+            stale = [car_id for car_id, entry in self._neighbors.items()
+                     if any(neighbor_id in changed for _, neighbor_id in entry)]
+            for car_id in stale:
+                del self._neighbors[car_id]
+
+            for snapshot in upserted:
+                vector = self._vector(snapshot)
+                car_id = snapshot['id']
+                self._vectors[car_id] = vector
+                if not vector.available:
+                    continue
+                for other_id, entry in self._neighbors.items():
+                    if other_id == car_id:
+                        continue
+                    candidate = (car_distance(self._vectors[other_id], vector), car_id)
+                    if len(entry) < self.k:
+                        entry.append(candidate)
+                        entry.sort()
+                    elif candidate < entry[-1]:
+                        entry[-1] = candidate
+                        entry.sort()
+        self._start_precompute()
+
+    def precompute(self) -> int:
+        """
+        حساب قوائم الجيران الناقصة سيارة سيارة وإرجاع عددها
+        القفل يترك بين السيارات فلا تنتظر الطلبات، ويتوقف الحساب إذا أعيد بناء المتجهات
+        """
+        with self._lock:
+            vectors = self._vectors
+        computed = 0
+        # مرور جديد ما دامت هناك قوائم ناقصة (قد يحذف apply_changes قوائم أثناء الحساب)
+        while vectors:
+            with self._lock:
+                pending = [car_id for car_id in vectors if car_id not in self._neighbors]
+            if not pending:
+                break
+            for car_id in pending:
+                with self._lock:
+                    if self._vectors is not vectors:
+                        return computed
+                    if car_id in vectors and car_id not in self._neighbors:
+                        self._neighbors[car_id] = self._compute(car_id)
+                        computed += 1
+        return computed
+
+    def _start_precompute(self):
+        """تشغيل precompute في خيط خلفي للكتالوجات حتى precompute_limit سيارة"""
+        vectors = self._vectors
+        if not vectors or len(vectors) > self.precompute_limit:
+            return
+        with self._lock:
+            if self._precompute_thread is not None and self._precompute_thread.is_alive():
+                return
+            self._precompute_thread = threading.Thread(target=self.precompute, name='similar-cars-precompute',
+                                                       daemon=True)
+            self._precompute_thread.start()
+
+    def _compute(self, car_id: int) -> List[Tuple[float, int]]:
+        """أقرب K سيارة متاحة بالمرور على كل المتجهات"""
+        vector = self._vectors[car_id]
+        candidates = ((car_distance(vector, other), other_id)
+                      for other_id, other in self._vectors.items()
+                      if other.available and other_id != car_id)
+        return heapq.nsmallest(self.k, candidates)
+
+    def _vector(self, values: Mapping[str, Any]) -> CarVector:
+        numeric = []
+        for column, _, logarithmic in NUMERIC_WEIGHTS:
+            mean, deviation = self._scales.get(column, (0.0, 1.0))
+            value = _raw_numeric(values, column, logarithmic)
+            numeric.append(0.0 if value is None else (value - mean) / deviation)
+
+        features = 0
+        for bit, feature in enumerate(CAR_FEATURES):
+            if values.get(feature):
+                features |= 1 << bit
+
+        return CarVector(
+            numeric=tuple(numeric),
+            categories=tuple(values.get(column) for column, _ in CATEGORY_WEIGHTS),
+            features=features,
+            available=bool(values.get('is_available'))
+        )
+
+
+# إنشاء مثيل عام من جدول السيارات المشابهة
+similar_cars = SimilarCarsIndex()
@@ -0,0 +1,81 @@
+"""
+إعدادات SQLite للإنتاج عند فتح كل اتصال
+WAL يسمح للقراء بالعمل أثناء الكتابة (بدلاً من انتظار commit سجل البحث)، و synchronous=NORMAL
+يكفي معه للحفاظ على سلامة القاعدة، مع ذاكرة صفحات أكبر و mmap وجداول مؤقتة في الذاكرة
+و busy_timeout حتى ينتظر الكاتب قفل الكتابة بدلاً من الفشل فوراً بـ "database is locked"
+"""
+from typing import Any, List, Mapping, Tuple
+from sqlalchemy import event
+from models import db
+
+# القيم المسموحة للإعدادات النصية (تكتب في PRAGMA مباشرة فلا تقبل غيرها)
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORE_MODES = ('DEFAULT', 'FILE', 'MEMORY')
+
+
+def _choice(config: Mapping[str, Any], key: str, default: str, allowed: Tuple[str, ...]) -> str:
+    value = str(config.get(key) or default).upper()
+    if value not in allowed:
+        print(f"قيمة غير صالحة لـ {key}: {value} (تستخدم {default})")
+        return default
+    return value
+
+
+def sqlite_pragmas(config: Mapping[str, Any]) -> List[Tuple[str, Any]]:
+    """أوامر PRAGMA المطبقة على كل اتصال جديد بالترتيب (الاسم، القيمة)"""
+    return [
+        # busy_timeout أولاً: تغيير journal_mode نفسه يحتاج قفلاً قد يكون مأخوذاً
+        ('busy_timeout', max(0, int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)))),
+        ('journal_mode', _choice(config, 'SQLITE_JOURNAL_MODE', 'WAL', JOURNAL_MODES)),
+        ('synchronous', _choice(config, 'SQLITE_SYNCHRONOUS', 'NORMAL', SYNCHRONOUS_MODES)),
+        # القيمة السالبة في cache_size بالكيلوبايت بدلاً من عدد الصفحات
+        ('cache_size', -max(0, int(config.get('SQLITE_CACHE_SIZE_KB', 65536)))),
+        ('mmap_size', max(0, int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)))),
+        ('temp_store', _choice(config, 'SQLITE_TEMP_STORE', 'MEMORY', TEMP_STORE_MODES)),
+    ]
+
+
+def apply_pragmas(dbapi_connection, pragmas: List[Tuple[str, Any]]):
+    """تطبيق أوامر PRAGMA على اتصال sqlite3 مفتوح"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class SQLiteTuning:
+    """تطبيق إعدادات SQLITE_* على اتصالات محرك SQLite للتطبيق (لا شيء لقواعد البيانات الأخرى)"""
+
+    def __init__(self):
+        self.enabled = False
+        self.pragmas: List[Tuple[str, Any]] = []
+
+    def init_app(self, app):
+        """تسجيل تطبيق الإعدادات عند فتح كل اتصال (يستدعى بعد db.init_app)"""
+        self.enabled = app.config.get('SQLITE_TUNING_ENABLED', False)
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        if not self.enabled or not uri.startswith('sqlite'):
+            return
+        self.pragmas = sqlite_pragmas(app.config)
+
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            try:
+                apply_pragmas(dbapi_connection, self.pragmas)
+            except Exception as e:
+                print(f"تعذر تطبيق إعدادات SQLite: {e}")
+
+    def current_settings(self) -> dict:
+        """القيم الفعلية على اتصال من المحرك (للتحقق من تطبيق الإعدادات)"""
+        with db.engine.connect() as connection:
+            return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name, _ in self.pragmas}
+
+
+# إنشاء مثيل عام من إعدادات SQLite
+sqlite_tuning = SQLiteTuning()
@@ -0,0 +1,166 @@
+"""
+عدادات إحصائيات لوحة التحكم
+تحسب مرة واحدة من قاعدة البيانات ثم تحدث من أحداث النماذج بعد تأكيد كل معاملة،
+فتقرأ لوحات التحكم قيماً جاهزة بدلاً من COUNT(*) على جداول تكبر باستمرار
+"""
+import threading
+import time
+from typing import Dict, Optional
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+from models import Car, CarSubmission, SearchLog, db
+from catalog_events import subscribe
+from db_routing import use_primary
+from search_analytics import search_analytics
+
+# مفتاح الفروق المعلقة داخل session.info حتى يتم تأكيد المعاملة
+_PENDING_KEY = 'stats_deltas'
+
+SUBMISSION_STATUSES = ('pending', 'approved', 'rejected')
+
+
+def submission_counter(status: Optional[str]) -> str:
+    """اسم عداد طلبات السيارات لحالة معينة"""
+    return f"submissions_{status or 'pending'}"
+
+
+class StatsCounters:
+    """
+    عدادات في الذاكرة: cars, available_cars, searches, submissions, submissions_<status>
+    يعاد حسابها كل max_age ثانية لالتقاط تغييرات العمليات الأخرى والحذف الجماعي
+    """
+
+    def __init__(self):
+        self.max_age = 300
+        self._counts: Optional[Dict[str, int]] = None
+        self._seeded_at = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """ربط العدادات بالتطبيق حسب STATS_COUNTERS_MAX_AGE"""
+        self.max_age = app.config.get('STATS_COUNTERS_MAX_AGE', 300)
+        self.invalidate()
+        subscribe(lambda upserted, deleted_ids: None, self.invalidate)
+
+    def get(self, name: str) -> int:
+        return self.snapshot().get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """كل العدادات (تحسب من قاعدة البيانات عند أول استخدام أو عند تقادمها)"""
+        counts = self._counts
+        if counts is None or (self.max_age and time.time() - self._seeded_at > self.max_age):
+            counts = self._seed()
+        return dict(counts)
+
+    def apply(self, deltas: Dict[str, int]):
+        """تطبيق فروق مؤكدة على العدادات (لا شيء إذا لم تحسب العدادات بعد)"""
+        with self._lock:
+            if self._counts is not None:
+                for name, delta in deltas.items():
+                    self._counts[name] = self._counts.get(name, 0) + delta
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+
+    def _seed(self) -> Dict[str, int]:
+        # من الرئيسية: العدادات تحدث بعدها بالفروق فقط، فالبداية من نسخة متأخرة تبقى خاطئة
+        with use_primary():
+            counts = {
+                'cars': Car.query.count(),
+                'available_cars': Car.query.filter_by(is_available=True).count(),
+                'searches': search_analytics.total_searches(),
+                'submissions': CarSubmission.query.count()
+            }
+            for status in SUBMISSION_STATUSES:
+                counts[submission_counter(status)] = 0
+            rows = db.session.query(CarSubmission.status, func.count(CarSubmission.id))\
+                             .group_by(CarSubmission.status).all()
+        for status, count in rows:
+            counts[submission_counter(status)] = count
+
+        with self._lock:
+            self._counts = counts
+            self._seeded_at = time.time()
+        return counts
+
+
+# إنشاء مثيل عام من عدادات الإحصائيات
+stats_counters = StatsCounters()
+
+
+def _record(target, deltas: Dict[str, int]):
+    session = object_session(target)
+    if session is None:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for name, delta in deltas.items():
+        pending[name] = pending.get(name, 0) + delta
+
+
+def _changed_from(target, attribute: str):
+    """القيمة السابقة للعمود إذا تغير في هذا الحفظ، وإلا None"""
+    history = get_history(target, attribute)
+    if not history.has_changes() or not history.deleted:
+        return None
+    return history.deleted[0]
+
+
+# active_history يحمل القيمة السابقة عند التعديل حتى لو انتهت صلاحية الكائن بعد commit،
+# فيعرف _changed_from اتجاه التغيير
+@event.listens_for(Car.is_available, 'set', active_history=True)
+@event.listens_for(CarSubmission.status, 'set', active_history=True)
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+@event.listens_for(Car, 'after_insert')
+def _car_inserted(mapper, connection, target):
+    _record(target, {'cars': 1, 'available_cars': 1 if target.is_available else 0})
+
+
+@event.listens_for(Car, 'after_update')
+def _car_updated(mapper, connection, target):
+    previous = _changed_from(target, 'is_available')
+    if previous is not None and bool(previous) != bool(target.is_available):
+        _record(target, {'available_cars': 1 if target.is_available else -1})
+
+
+@event.listens_for(Car, 'after_delete')
+def _car_deleted(mapper, connection, target):
+    _record(target, {'cars': -1, 'available_cars': -1 if target.is_available else 0})
+
+
+@event.listens_for(CarSubmission, 'after_insert')
+def _submission_inserted(mapper, connection, target):
+    _record(target, {'submissions': 1, submission_counter(target.status): 1})
+
+
+@event.listens_for(CarSubmission, 'after_update')
+def _submission_updated(mapper, connection, target):
+    previous = _changed_from(target, 'status')
+    if previous is not None and previous != target.status:
+        _record(target, {submission_counter(previous): -1, submission_counter(target.status): 1})
+
+
+@event.listens_for(CarSubmission, 'after_delete')
+def _submission_deleted(mapper, connection, target):
+    _record(target, {'submissions': -1, submission_counter(target.status): -1})
+
+
+@event.listens_for(SearchLog, 'after_insert')
+def _search_logged(mapper, connection, target):
+    _record(target, {'searches': 1})
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_deltas(session):
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        stats_counters.apply(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deltas(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -6,13 +6,21 @@
 
 import sys
 import os
+import atexit
+import shutil
+import tempfile
 import requests
 import json
-from urllib.parse import quote
 
 # إضافة المجلد الحالي إلى مسار Python
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# قاعدة بيانات مؤقتة للاختبارات بدل instance/car_store.db (قبل استيراد app)،
+# والعمليات الفرعية (explain_queries وكاتب السجل) ترثها من البيئة
+_TEST_DB_DIR = tempfile.mkdtemp(prefix='car-store-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TEST_DB_DIR, 'car_store.db')
+atexit.register(shutil.rmtree, _TEST_DB_DIR, ignore_errors=True)
+
 def test_homepage():
     """اختبار الصفحة الرئيسية"""
     print("🏠 اختبار الصفحة الرئيسية...")
@@ -156,6 +164,896 @@ def test_search_engine():
         print(f"❌ خطأ في محرك البحث: {e}")
         return False
 
+def test_search_index():
+    """اختبار تطابق فهرس البحث في الذاكرة مع استعلام قاعدة البيانات"""
+    print("🗂️ اختبار فهرس البحث في الذاكرة...")
+    from app import app
+    from search_engine import search_engine
+    from search_index import search_index
+    from search_cache import search_cache
+    
+    samples = [
+        ({}, 'price_asc'),
+        ({'search_text': 'تويوتا'}, 'year_desc'),
+        ({'brand': 'تويوتا', 'budget': '15000'}, 'price_desc'),
+        ({'fuel_type': 'gasoline', 'gps_system': True}, 'mileage_asc'),
+        ({'year_from': '2020', 'car_type': 'suv'}, 'name_asc')
+    ]
+    
+    with app.app_context():
+        enabled, cache_enabled = search_index.enabled, search_cache.enabled
+        search_cache.enabled = False
+        try:
+            for criteria, sort_by in samples:
+                search_index.enabled = True
+                indexed = search_engine.search(criteria, 1, 100, sort_by)
+                search_index.enabled = False
+                direct = search_engine.search(criteria, 1, 100, sort_by)
+                
+                assert (sorted(car['id'] for car in indexed['cars']) == sorted(car['id'] for car in direct['cars'])
+                        and indexed['total'] == direct['total']), \
+                    f"نتائج الفهرس لا تطابق قاعدة البيانات للمعايير: {criteria}"
+        finally:
+            search_index.enabled, search_cache.enabled = enabled, cache_enabled
+    
+    print("✅ فهرس البحث يطابق نتائج قاعدة البيانات")
+
+def test_fulltext_search():
+    """اختبار البحث النصي الكامل: نفس نتائج فهرس الذاكرة و LIKE، ترتيب الصلة، وتزامن الفهرس مع السيارات"""
+    print("🔎 اختبار البحث النصي الكامل...")
+    from sqlalchemy import text
+    from app import app
+    from models import db, Car
+    from fulltext import fulltext, SQLiteFTS5Backend
+    from search_engine import search_engine
+    from search_index import search_index
+    from search_cache import search_cache
+    
+    def make_car(name, model):
+        return Car(name=name, brand='ماركةتجريبية', model=model, year=2020, price=10000,
+                   performance_level='medium', fuel_type='gasoline', transmission='automatic',
+                   car_type='sedan', description='وصف تجريبي', is_available=True)
+    
+    with app.app_context():
+        backend = fulltext.backend
+        if backend is None:
+            print("⚠️ البحث النصي الكامل غير مفعل في قاعدة البيانات الحالية")
+            return
+        enabled, cache_enabled = search_index.enabled, search_cache.enabled
+        search_cache.enabled = False
+        cars = [make_car('سيارة اختبار الصلة', 'موديل'), make_car('اختبار الصلة', 'صلة')]
+        
+        def search_ids(path, search_text, sort_by='price_asc'):
+            search_index.enabled = path == 'index'
+            fulltext.backend = backend if path == 'fulltext' else None
+            result = search_engine.search({'search_text': search_text}, 1, 1000, sort_by)
+            return [car['id'] for car in result['cars']]
+        
+        try:
+            db.session.add_all(cars)
+            db.session.commit()
+            
+            for search_text in ('سيارة', 'اقتصادية', 'تويوتا كامري', 'تويوتا', 'كامري', 'هيونداي',
+                                'إختبار الصلة', 'موديل', 'تو', '%', '_', '%%%', 'تو_وتا'):
+                by_path = {path: sorted(search_ids(path, search_text)) for path in ('index', 'fulltext', 'like')}
+                assert len({tuple(ids) for ids in by_path.values()}) == 1, \
+                    f"نتائج '{search_text}' تختلف بين المسارات: {by_path}"
+            
+            # الاسم المساوي للنص قبل الاسم الذي يحتويه، وبنفس الترتيب في كل المسارات
+            for path in ('index', 'fulltext', 'like'):
+                ids = search_ids(path, 'اختبار الصلة', 'relevance')
+                assert ids[:2] == [cars[1].id, cars[0].id], f"ترتيب الصلة غير صحيح في مسار {path}: {ids}"
+            fulltext.backend = backend
+            
+            def matched(search_text):
+                subquery = fulltext.match(search_text)
+                return {row.car_id for row in db.session.execute(db.select(subquery.c.car_id))}
+            
+            def indexed(car_id):
+                return db.session.execute(text(f"SELECT count(*) FROM {backend.table} WHERE rowid = :car_id"),
+                                          {'car_id': car_id}).scalar() == 1
+            
+            # التطبيع العربي: الهمزة والتاء المربوطة
+            assert (not isinstance(backend, SQLiteFTS5Backend)
+                    or {car.id for car in cars} <= matched('إختبار الصلة')), \
+                "مطابقة البحث النصي لا تطبع النص العربي"
+            
+            cars[0].name = 'سيارة معدلة'
+            cars[0].update_normalized_fields()
+            db.session.commit()
+            assert (not isinstance(backend, SQLiteFTS5Backend)
+                    or (cars[0].id not in matched('اختبار الصلة') and cars[0].id in matched('سيارة معدلة'))), \
+                "فهرس البحث النصي لم يتحدث بعد تعديل السيارة"
+            
+            deleted_id = cars[0].id
+            db.session.delete(cars.pop(0))
+            db.session.commit()
+            assert not isinstance(backend, SQLiteFTS5Backend) or not indexed(deleted_id), \
+                "فهرس البحث النصي يحتفظ بالسيارة المحذوفة"
+        finally:
+            fulltext.backend = backend
+            search_index.enabled, search_cache.enabled = enabled, cache_enabled
+            db.session.rollback()
+            for car in cars:
+                if car.id is not None and db.session.get(Car, car.id) is not None:
+                    db.session.delete(car)
+            db.session.commit()
+    
+    print("✅ البحث النصي الكامل يطابق فهرس الذاكرة و LIKE ويتزامن مع السيارات")
+
+def test_cursor_pagination():
+    """اختبار التصفح بالمؤشر: كل السيارات مرة واحدة وبنفس الترتيب من الفهرس وقاعدة البيانات"""
+    print("🔖 اختبار التصفح بالمؤشر...")
+    from app import app
+    from search_engine import search_engine
+    from search_index import search_index
+    from search_cache import search_cache
+    
+    def walk(sort_by):
+        ids, cursor = [], ''
+        while cursor is not None:
+            results = search_engine.search({}, 1, 3, sort_by, cursor=cursor)
+            ids.extend(car['id'] for car in results['cars'])
+            cursor = results['next_cursor']
+        return ids
+    
+    with app.app_context():
+        enabled, cache_enabled = search_index.enabled, search_cache.enabled
+        search_cache.enabled = False
+        try:
+            for sort_by in ('price_asc', 'year_desc', 'name_asc'):
+                search_index.enabled = True
+                indexed = walk(sort_by)
+                search_index.enabled = False
+                direct = walk(sort_by)
+                expected = search_engine.search({}, 1, 1000, sort_by)['total']
+                
+                assert indexed == direct and len(set(indexed)) == expected, \
+                    f"صفحات المؤشر غير متطابقة للترتيب: {sort_by}"
+        finally:
+            search_index.enabled, search_cache.enabled = enabled, cache_enabled
+    
+    print("✅ التصفح بالمؤشر يعيد كل النتائج بدون تكرار")
+
+def test_search_cache():
+    """اختبار ذاكرة نتائج البحث: المعايير المتكافئة تشترك في النتيجة وتعديل السيارات يسقطها"""
+    print("🧠 اختبار ذاكرة نتائج البحث...")
+    import json
+    from app import app
+    from models import db, Car
+    from search_engine import search_engine
+    from search_cache import search_cache
+    
+    with app.app_context():
+        car = Car.query.filter_by(is_available=True).first()
+        assert car is not None, "لا توجد سيارات للاختبار"
+        
+        search_cache.clear()
+        first = search_engine.search({'brand': car.brand, 'budget': '1000000'}, 1, 50, 'price_asc')
+        hits = search_cache.hits
+        second = search_engine.search({'brand': f' {car.brand} ', 'budget': 1000000.0}, 1, 50, 'price_asc')
+        assert search_cache.hits == hits + 1 and first == second, "المعايير المتكافئة لم تستخدم النتيجة المحفوظة"
+        
+        # تعديل النتيجة المعادة (بما فيها facets المتداخلة) لا يغير النسخة المحفوظة
+        with_facets = search_engine.search({'brand': car.brand}, 1, 50, 'price_asc', with_facets=True)
+        expected_facets = json.loads(json.dumps(with_facets['facets']))
+        with_facets['facets']['brand'].clear()
+        with_facets['facets']['price'].append({'min': -1})
+        with_facets['cars'][0]['price'] = -1
+        cached = search_engine.search({'brand': car.brand}, 1, 50, 'price_asc', with_facets=True)
+        assert cached['facets'] == expected_facets and cached['cars'][0]['price'] != -1, \
+            "تعديل النتيجة المعادة غير الذاكرة المؤقتة"
+        
+        original_price = car.price
+        try:
+            car.price = original_price + 1
+            db.session.commit()
+            updated = search_engine.search({'brand': car.brand, 'budget': '1000000'}, 1, 50, 'price_asc')
+            prices = {item['id']: item['price'] for item in updated['cars']}
+            assert prices.get(car.id) == original_price + 1, "النتيجة المحفوظة لم تسقط بعد تعديل السيارة"
+        finally:
+            car.price = original_price
+            db.session.commit()
+    
+    print("✅ ذاكرة نتائج البحث تعمل وتسقط عند تعديل الكتالوج")
+
+def test_filter_options_cache():
+    """اختبار ذاكرة خيارات المرشحات: إضافة سيارة أو تعديلها أو حذفها يظهر قبل انتهاء مدة الذاكرة"""
+    print("🎛️ اختبار ذاكرة خيارات المرشحات...")
+    from app import app
+    from models import db, Car
+    from search_engine import search_engine
+    
+    brand, renamed = 'ماركةخيارات', 'ماركةخياراتمعدلة'
+    with app.app_context():
+        max_age = search_engine.filter_options_max_age
+        # مدة طويلة: أي تغيير يظهر فقط إذا أسقطته أحداث الكتالوج
+        search_engine.filter_options_max_age = 3600
+        car = Car(name='سيارة الخيارات', brand=brand, model='اختبار', year=2021, price=12000,
+                  performance_level='medium', fuel_type='gasoline', transmission='automatic',
+                  car_type='sedan', color='لونخيارات', is_available=True)
+        try:
+            assert brand not in search_engine.get_filter_options()['brands'], \
+                "الماركة التجريبية موجودة قبل الاختبار"
+            
+            db.session.add(car)
+            db.session.commit()
+            options = search_engine.get_filter_options()
+            assert brand in options['brands'] and 'لونخيارات' in options['colors'], \
+                "خيارات المرشحات لم تتحدث بعد إضافة سيارة"
+            
+            car.brand = renamed
+            car.update_normalized_fields()
+            db.session.commit()
+            brands = search_engine.get_filter_options()['brands']
+            assert renamed in brands and brand not in brands, "خيارات المرشحات لم تتحدث بعد تعديل السيارة"
+            
+            db.session.delete(car)
+            db.session.commit()
+            assert renamed not in search_engine.get_filter_options()['brands'], \
+                "خيارات المرشحات لم تتحدث بعد حذف السيارة"
+        finally:
+            db.session.rollback()
+            for leftover in Car.query.filter(Car.brand.in_([brand, renamed])).all():
+                db.session.delete(leftover)
+            db.session.commit()
+            search_engine.filter_options_max_age = max_age
+    
+    print("✅ خيارات المرشحات تتحدث مع تغييرات السيارات")
+
+def test_search_analytics():
+    """اختبار تجميع سجل البحث: كل سجل يضاف مرة واحدة حتى لو أودع بعد سجلات أحدث منه"""
+    print("📊 اختبار تحليلات البحث...")
+    import json
+    from app import app
+    from models import db, SearchLog, SearchRollup
+    from search_analytics import search_analytics
+    
+    with app.app_context():
+        search_analytics.rollup()
+        total_before = search_analytics.total_searches()
+        brands_before = dict(search_analytics.top_values('brand', days=1, limit=1000))
+        
+        logs = [SearchLog(search_criteria=json.dumps(criteria, ensure_ascii=False), results_count=results_count)
+                for criteria, results_count in [({'brand': 'تويوتا', 'budget': '8000'}, 3),
+                                                ({'brand': 'تويوتا'}, 1),
+                                                ({'search_text': 'سيارة غير موجودة'}, 0)]]
+        db.session.add_all(logs)
+        db.session.commit()
+        log_ids = [log.id for log in logs]
+        # صفوف التجميع التي تمسها سجلات الاختبار وقيمها قبله، لإعادتها في النهاية
+        rollup_keys = list(search_analytics._aggregate(logs))
+        rollups_before = {}
+        for period, start, dimension, value in rollup_keys:
+            row = SearchRollup.query.filter_by(period=period, period_start=start,
+                                               dimension=dimension, value=value).first()
+            rollups_before[(period, start, dimension, value)] = row.searches if row else None
+        try:
+            # أول سجل يودع بعد تجميع ما بعده (معاملة تأخر إيداعها): يحذف ثم يعاد بنفس الرقم
+            late = {'id': logs[0].id, 'search_criteria': logs[0].search_criteria,
+                    'results_count': logs[0].results_count, 'created_at': logs[0].created_at}
+            db.session.delete(logs[0])
+            db.session.commit()
+            search_analytics.rollup()
+            db.session.add(SearchLog(**late))
+            db.session.commit()
+            
+            search_analytics.rollup()
+            search_analytics.rollup()
+            brands_after = dict(search_analytics.top_values('brand', days=1, limit=1000))
+            zero_results = dict(search_analytics.top_values('zero_results', days=1, limit=1000))
+            
+            assert (search_analytics.total_searches() == total_before + 3
+                    and brands_after.get('تويوتا', 0) == brands_before.get('تويوتا', 0) + 2
+                    and 'سياره غير موجوده' in zero_results), \
+                "التجميعات لا تطابق سجلات البحث المضافة"
+        finally:
+            # إزالة سجلات الاختبار وإعادة صفوف التجميع إلى قيمها قبله
+            db.session.rollback()
+            SearchLog.query.filter(SearchLog.id.in_(log_ids)).delete(synchronize_session=False)
+            for (period, start, dimension, value), searches in rollups_before.items():
+                row = SearchRollup.query.filter_by(period=period, period_start=start,
+                                                   dimension=dimension, value=value).first()
+                if row is None:
+                    continue
+                if searches is None:
+                    db.session.delete(row)
+                else:
+                    row.searches = searches
+            db.session.commit()
+    
+    print("✅ تجميعات البحث محدثة ودقيقة")
+
+def test_search_log_writer():
+    """اختبار كاتب سجل البحث: كل سجل في الطابور يكتب ويضاف إلى العداد، حتى الدفعة الناقصة عند الخروج"""
+    print("📝 اختبار كاتب سجل البحث...")
+    import subprocess
+    from app import app
+    from models import db, SearchLog
+    from search_log_writer import search_log_writer
+    from stats_counters import stats_counters
+    
+    marker, exit_marker = 'writer-test', 'writer-exit-test'
+    with app.app_context():
+        settings = (search_log_writer.enabled, search_log_writer.batch_size, search_log_writer.flush_interval)
+        try:
+            # دفعات من 4 ولا كتابة بالوقت أثناء الاختبار: 10 سجلات = دفعتان كاملتان ودفعة ناقصة
+            search_log_writer.enabled, search_log_writer.batch_size, search_log_writer.flush_interval = True, 4, 60
+            searches = stats_counters.get('searches')
+            for number in range(10):
+                search_log_writer.log({'brand': f'اختبار {number}'}, number, marker)
+            search_log_writer.flush()
+            written = SearchLog.query.filter_by(user_ip=marker).count()
+            assert written == 10 and stats_counters.get('searches') == searches + 10, \
+                f"flush كتب {written} من 10 سجلات أو لم يحدث العداد"
+            
+            # shutdown (المسجلة في atexit) تكتب الدفعة الناقصة
+            for number in range(3):
+                search_log_writer.log({'brand': f'اختبار {number}'}, number, marker)
+            search_log_writer.shutdown()
+            written = SearchLog.query.filter_by(user_ip=marker).count()
+            assert written == 13 and stats_counters.get('searches') == searches + 13, \
+                f"shutdown فقد سجلات الدفعة الناقصة: {written} من 13"
+            
+            # عملية تخرج بدفعة ناقصة في الطابور دون flush: atexit تكتبها قبل الخروج
+            script = ("from app import app\n"
+                      "from search_log_writer import search_log_writer\n"
+                      "search_log_writer.enabled, search_log_writer.batch_size = True, 100\n"
+                      "search_log_writer.flush_interval = 60\n"
+                      "with app.app_context():\n"
+                      "    for number in range(3):\n"
+                      f"        search_log_writer.log({{'brand': 'اختبار'}}, number, {exit_marker!r})\n")
+            subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=120,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+            written = SearchLog.query.filter_by(user_ip=exit_marker).count()
+            assert written == 3, f"الخروج فقد سجلات الدفعة الناقصة: {written} من 3"
+        finally:
+            search_log_writer.shutdown()
+            search_log_writer.enabled, search_log_writer.batch_size, search_log_writer.flush_interval = settings
+            SearchLog.query.filter(SearchLog.user_ip.in_([marker, exit_marker])).delete(synchronize_session=False)
+            db.session.commit()
+            # الحذف الجماعي لا يمر بأحداث النموذج
+            stats_counters.invalidate()
+    
+    print("✅ كاتب سجل البحث لا يفقد سجلات ويحدث العداد")
+
+def test_stats_counters():
+    """اختبار عدادات لوحة التحكم: تساوي COUNT(*) بعد كل تغيير وبعد معاملة متراجعة"""
+    print("🔢 اختبار عدادات لوحة التحكم...")
+    from app import app
+    from models import db, Admin, Car, CarSubmission
+    from stats_counters import stats_counters, submission_counter, SUBMISSION_STATUSES
+    
+    def fresh_counts():
+        counts = {'cars': Car.query.count(),
+                  'available_cars': Car.query.filter_by(is_available=True).count(),
+                  'submissions': CarSubmission.query.count()}
+        for status in SUBMISSION_STATUSES:
+            counts[submission_counter(status)] = CarSubmission.query.filter_by(status=status).count()
+        return counts
+    
+    def check(step):
+        counters = stats_counters.snapshot()
+        expected = fresh_counts()
+        actual = {name: counters.get(name, 0) for name in expected}
+        assert actual == expected, f"العدادات بعد {step} لا تطابق COUNT(*): {actual} != {expected}"
+    
+    brand = 'ماركةعداد'
+    client = app.test_client()
+    with app.app_context():
+        max_age = stats_counters.max_age
+        # بلا إعادة حساب دورية: العدادات تتغير بالفروق وحدها أثناء الاختبار
+        stats_counters.max_age = 0
+        stats_counters.invalidate()
+        stats_counters.snapshot()
+        try:
+            car = Car(name='سيارة العدادات', brand=brand, model='اختبار', year=2021, price=12000,
+                      performance_level='medium', fuel_type='gasoline', transmission='automatic',
+                      car_type='sedan', is_available=True)
+            db.session.add(car)
+            db.session.commit()
+            check('إضافة سيارة')
+            
+            car.is_available = False
+            db.session.commit()
+            check('إخفاء السيارة')
+            car.is_available = True
+            db.session.commit()
+            check('إظهار السيارة')
+            
+            submission = CarSubmission(name='طلب العدادات', brand=brand, model='اختبار', year=2021,
+                                       price=11000, performance_level='medium', fuel_type='gasoline',
+                                       transmission='automatic', car_type='sedan',
+                                       owner_name='اختبار', owner_phone='0000000000')
+            db.session.add(submission)
+            db.session.commit()
+            check('إضافة طلب')
+            
+            # الموافقة من مسار المدير: تغيير حالة الطلب وإضافة سيارة في معاملة واحدة
+            with client.session_transaction() as client_session:
+                client_session['admin_logged_in'] = True
+                client_session['admin_id'] = Admin.query.first().id
+            client.post(f'/admin/submissions/{submission.id}/approve')
+            db.session.expire_all()
+            assert db.session.get(CarSubmission, submission.id).status == 'approved', "الطلب لم تتم الموافقة عليه"
+            check('الموافقة على الطلب')
+            
+            # معاملة متراجعة لا تغير العدادات
+            db.session.add(Car(name='سيارة متراجعة', brand=brand, model='اختبار', year=2021, price=1,
+                               performance_level='medium', fuel_type='gasoline', transmission='automatic',
+                               car_type='sedan', is_available=True))
+            db.session.delete(car)
+            db.session.get(CarSubmission, submission.id).status = 'rejected'
+            db.session.flush()
+            db.session.rollback()
+            check('التراجع عن معاملة')
+            
+            db.session.delete(db.session.get(Car, car.id))
+            db.session.commit()
+            check('حذف السيارة')
+        finally:
+            db.session.rollback()
+            for leftover in Car.query.filter_by(brand=brand).all():
+                db.session.delete(leftover)
+            for leftover in CarSubmission.query.filter_by(brand=brand).all():
+                db.session.delete(leftover)
+            db.session.commit()
+            stats_counters.max_age = max_age
+    
+    print("✅ عدادات لوحة التحكم تطابق COUNT(*) بعد كل تغيير")
+
+def test_similar_cars():
+    """اختبار تطابق جدول السيارات المشابهة بعد التحديث التدريجي مع الحساب الكامل"""
+    print("🧭 اختبار جدول السيارات المشابهة...")
+    from app import app
+    from models import db, Car
+    from similar_cars import similar_cars
+    
+    with app.app_context():
+        if not similar_cars.is_ready():
+            print("⚠️ جدول السيارات المشابهة معطل")
+            return
+        
+        # البناء لا يحسب الجيران في مسار الطلب: تحسب عند الطلب أو بـ precompute في الخلفية
+        precompute_limit = similar_cars.precompute_limit
+        similar_cars.precompute_limit = 0
+        try:
+            similar_cars.rebuild()
+            assert not similar_cars._neighbors, "بناء الجدول حسب الجيران في مسار الطلب"
+            similar_cars.precompute()
+            assert set(similar_cars._neighbors) == set(similar_cars._vectors), "precompute لم يكمل كل قوائم الجيران"
+        finally:
+            similar_cars.precompute_limit = precompute_limit
+        
+        car = Car.query.filter_by(is_available=True).first()
+        if car is None:
+            print("⚠️ لا توجد سيارات للاختبار")
+            return
+        original_price = car.price
+        try:
+            car.price = original_price * 3
+            db.session.commit()
+            
+            for car_id in list(similar_cars._vectors):
+                expected = [neighbor_id for _, neighbor_id in similar_cars._compute(car_id)]
+                assert similar_cars.neighbors(car_id, similar_cars.k) == expected, \
+                    f"جيران السيارة {car_id} لا تطابق الحساب الكامل"
+        finally:
+            car.price = original_price
+            db.session.commit()
+    
+    print("✅ جدول السيارات المشابهة محدث ودقيق")
+
+def test_best_match():
+    """اختبار ترتيب الأفضل مطابقة: نفس الترتيب من الفهرس وقاعدة البيانات وبطريقتي الحساب"""
+    print("🎯 اختبار ترتيب الأفضل مطابقة...")
+    from app import app
+    from search_engine import search_engine
+    from search_index import search_index
+    from search_cache import search_cache
+    from match_scoring import np, rank_rows
+    
+    samples = [{}, {'budget': '15000'}, {'budget': '30000', 'gps_system': True}, {'year_to': '2018'}]
+    
+    with app.app_context():
+        enabled, cache_enabled = search_index.enabled, search_cache.enabled
+        search_cache.enabled = False
+        try:
+            for criteria in samples:
+                search_index.enabled = True
+                indexed = search_engine.search(criteria, 1, 100, 'best_match')
+                search_index.enabled = False
+                direct = search_engine.search(criteria, 1, 100, 'best_match')
+                
+                assert [car['id'] for car in indexed['cars']] == [car['id'] for car in direct['cars']], \
+                    f"ترتيب الفهرس لا يطابق قاعدة البيانات للمعايير: {criteria}"
+        finally:
+            search_index.enabled, search_cache.enabled = enabled, cache_enabled
+    
+    if np is not None:
+        columns = {
+            'id': [5, 3, 9, 1, 7],
+            'price': [12000.0, None, 9000.0, 12000.0, 30000.0],
+            'year': [2019, 2021, 2015, 2019, None],
+            'mileage': [40000, 10000, None, 40000, 250000],
+            'features': [3, 1, 0, 3, 2]
+        }
+        criteria = {'budget': 12000, 'gps_system': True}
+        for limit in (None, 2):
+            vectorized = rank_rows(columns, range(5), criteria, limit, vectorized=True)
+            assert vectorized == rank_rows(columns, range(5), criteria, limit, vectorized=False), \
+                "ترتيب NumPy لا يطابق الحساب المباشر"
+    
+    print("✅ ترتيب الأفضل مطابقة متطابق")
+
+def test_compiled_criteria():
+    """اختبار تطابق المعايير المترجمة مع نتائج محرك البحث"""
+    print("🧩 اختبار المعايير المترجمة...")
+    from app import app
+    from models import Car
+    from search_engine import search_engine
+    from search_cache import search_cache
+    from car_criteria import compile_criteria
+    from catalog_events import snapshot_car
+    
+    samples = [
+        {'search_text': 'تويوتا'},
+        {'brand': 'تويوتا', 'budget': '15000'},
+        {'fuel_type': ['gasoline', 'hybrid'], 'gps_system': True},
+        {'year_from': '2020', 'car_type': 'suv', 'mileage_max': '50000'},
+        {'price_min': '8000', 'price_max': 'abc', 'doors': '4'}
+    ]
+    
+    with app.app_context():
+        cache_enabled = search_cache.enabled
+        search_cache.enabled = False
+        try:
+            cars = Car.query.filter_by(is_available=True).order_by(Car.id).all()
+            snapshots = [snapshot_car(car) for car in cars]
+            for criteria in samples:
+                compiled = compile_criteria(criteria)
+                expected = sorted(car['id'] for car in search_engine.search(criteria, 1, 100)['cars'])
+                assert ([car.id for car in compiled.filter_cars(cars)] == expected
+                        and [values['id'] for values in compiled.filter_values(snapshots)] == expected), \
+                    f"المعايير المترجمة لا تطابق البحث: {criteria}"
+        finally:
+            search_cache.enabled = cache_enabled
+    
+    print("✅ المعايير المترجمة تطابق نتائج البحث")
+
+def test_saved_searches():
+    """اختبار مطابقة السيارات الجديدة مع البحوث المحفوظة (ومزامنة بحوث العمليات الأخرى) وتفريغ الصندوق الصادر"""
+    print("🔔 اختبار البحث المحفوظ...")
+    from app import app
+    from models import db, Car, SavedSearch, SavedSearchOutbox
+    from saved_searches import saved_searches
+    
+    with app.app_context():
+        if not saved_searches.enabled:
+            print("⚠️ البحث المحفوظ معطل")
+            return
+        
+        saved_search, errors = saved_searches.save({'brand': 'تويوتا', 'budget': '20000'}, 'test@example.com')
+        assert not errors, f"تعذر حفظ البحث: {errors}"
+        
+        cars = []
+        extra_ids = []
+        try:
+            for name, brand, price in (('تويوتا اختبار', 'تويوتا', 15000.0), ('نيسان اختبار', 'نيسان', 15000.0),
+                                       ('تويوتا غالية', 'تويوتا', 45000.0)):
+                car = Car(name=name, brand=brand, model='اختبار', year=2022, price=price,
+                          performance_level='economy', fuel_type='gasoline', transmission='automatic',
+                          car_type='sedan', is_available=True)
+                car.update_normalized_fields()
+                db.session.add(car)
+                db.session.flush()
+                saved_searches.match_new_car(car)
+                db.session.commit()
+                cars.append(car)
+            
+            matched = [entry.car_id for entry in SavedSearchOutbox.query.filter_by(saved_search_id=saved_search.id)]
+            sent = []
+            saved_searches.drain_outbox(send=lambda search, car: sent.append((search.id, car.id)), limit=1000)
+            
+            assert matched == [cars[0].id] and (saved_search.id, cars[0].id) in sent, \
+                f"مطابقات البحث المحفوظ غير صحيحة: {matched}"
+            
+            # عملية أخرى: بحث أودع بعد بحث أحدث منه رقماً، وإيقاف البحث الأول دون المرور بهذا الفهرس
+            late = SavedSearch(search_criteria='{"brand": "نيسان"}', contact='late@example.com')
+            newer = SavedSearch(search_criteria='{"brand": "نيسان"}', contact='newer@example.com')
+            db.session.add_all([late, newer])
+            db.session.commit()
+            late_id, newer_id = late.id, newer.id
+            extra_ids.extend([late_id, newer_id])
+            db.session.delete(late)
+            db.session.commit()
+            saved_searches._refresh()
+            db.session.add(SavedSearch(id=late_id, search_criteria='{"brand": "نيسان"}',
+                                       contact='late@example.com'))
+            SavedSearch.query.filter_by(id=saved_search.id).update({'is_active': False})
+            db.session.commit()
+            
+            for brand in ('نيسان', 'تويوتا'):
+                car = Car(name=f'{brand} متأخرة', brand=brand, model='اختبار', year=2022, price=15000.0,
+                          performance_level='economy', fuel_type='gasoline', transmission='automatic',
+                          car_type='sedan', is_available=True)
+                car.update_normalized_fields()
+                db.session.add(car)
+                db.session.flush()
+                saved_searches.match_new_car(car)
+                db.session.commit()
+                cars.append(car)
+            
+            matches = {(entry.saved_search_id, entry.car_id) for entry in SavedSearchOutbox.query.filter(
+                SavedSearchOutbox.car_id.in_([cars[-2].id, cars[-1].id]))}
+            assert ((late_id, cars[-2].id) in matches
+                    and (newer_id, cars[-2].id) in matches
+                    and (saved_search.id, cars[-1].id) not in matches), \
+                f"الفهرس لم يزامن البحوث المتأخرة أو الموقوفة: {matches}"
+        finally:
+            db.session.rollback()
+            search_ids = [saved_search.id] + extra_ids
+            SavedSearchOutbox.query.filter(SavedSearchOutbox.saved_search_id.in_(search_ids))\
+                                   .delete(synchronize_session=False)
+            for car in cars:
+                db.session.delete(car)
+            SavedSearch.query.filter(SavedSearch.id.in_(search_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            saved_searches.invalidate()
+    
+    print("✅ البحث المحفوظ يطابق السيارات الجديدة فقط")
+
+def test_normalize_arabic():
+    """اختبار مخرجات تطبيع النص العربي الثابتة (الدالة المفردة والجماعية)"""
+    print("🔤 اختبار تطبيع النص العربي...")
+    from utils import normalize_arabic, normalize_arabic_many, normalize_for_search
+    
+    golden = [
+        ('', ''),
+        (None, ''),
+        ('تويوتا', 'تويوتا'),
+        ('أودي', 'اودي'),
+        ('إنفينيتي', 'انفينيتي'),
+        ('آمنة', 'امنه'),
+        ('مرسيدس بنز الفئة سي', 'مرسيدس بنز الفئه سي'),
+        ('هيونداي إلنترا', 'هيونداي النترا'),
+        ('مُسْتَعْمَلَةٌ', 'مستعمله'),
+        ('فضّيّة', 'فضيه'),
+        ('رحمٰن', 'رحمن'),
+        ('مصطفى', 'مصطفي'),
+        ('  تويوتا \t\n  كامري  ', 'تويوتا كامري'),
+        ('Toyota CAMRY 2024', 'toyota camry 2024'),
+        ('BMW الفئة X5', 'bmw الفئه x5'),
+        ('\u00a0سيارة\u3000جديدة\u2028', 'سياره جديده'),
+        ('ً ٌ', ''),
+        ('سيارة ' * 20, ('سياره ' * 20).strip())
+    ]
+    
+    for text, expected in golden:
+        assert normalize_arabic(text) == expected, \
+            f"تطبيع غير صحيح: {text!r} -> {normalize_arabic(text)!r} (المتوقع {expected!r})"
+    
+    assert normalize_arabic_many([text for text, _ in golden]) == [expected for _, expected in golden], \
+        "التطبيع الجماعي لا يطابق التطبيع المفرد"
+    
+    assert normalize_for_search('تويوتا  كامري') == 'تويوتاكامري', "تطبيع البحث لا يحذف المسافات"
+    
+    print("✅ تطبيع النص العربي يطابق المخرجات الثابتة")
+
+def test_db_routing():
+    """اختبار توجيه القراءة إلى نسخة القراءة والكتابة والمدير إلى الرئيسية"""
+    print("🔀 اختبار توجيه قاعدة البيانات...")
+    import tempfile
+    from flask import Flask
+    from config import Config
+    from models import db, Admin
+    from db_routing import db_routing, use_primary, REPLICA_BIND
+    
+    directory = tempfile.mkdtemp(prefix='car-store-routing-')
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'primary.db')
+    app.config['DATABASE_REPLICA_URL'] = 'sqlite:///' + os.path.join(directory, 'replica.db')
+    db_routing.init_app(app)
+    db.init_app(app)
+    
+    @app.route('/search')
+    def search():
+        return str(Admin.query.count())
+    
+    @app.route('/admin/cars')
+    def admin_cars():
+        return str(Admin.query.count())
+    
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+        # الرئيسية فيها مدير ونسخة القراءة فارغة (كنسخة متأخرة)
+        db.session.add(Admin(username='routing', password_hash='-'))
+        db.session.commit()
+    
+    client = app.test_client()
+    assert client.get('/search').text == '0', "صفحة البحث لا تقرأ من نسخة القراءة"
+    
+    with client.session_transaction() as admin_session:
+        admin_session['admin_logged_in'] = True
+    assert client.get('/search').text == '1' and client.get('/admin/cars').text == '1', \
+        "جلسة المدير لا تقرأ من الرئيسية"
+    
+    with app.test_request_context('/search'):
+        app.preprocess_request()
+        with use_primary():
+            primary_count = Admin.query.count()
+        db.session.add(Admin(username='routing-2', password_hash='-'))
+        db.session.flush()
+        after_write = Admin.query.count()
+        db.session.rollback()
+        db.session.remove()
+    assert primary_count == 1 and after_write == 2, f"التوجيه بعد الكتابة غير صحيح: {primary_count}, {after_write}"
+    
+    print("✅ القراءة من نسخة القراءة والكتابة وجلسات المدير من الرئيسية")
+
+def test_query_plans():
+    """اختبار أن استعلامات التطبيق ومحرك البحث لا تقرأ جداول كاملة (explain_queries.py)"""
+    print("🗂️ اختبار خطط تنفيذ الاستعلامات...")
+    import subprocess
+    
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'explain_queries.py')
+    completed = subprocess.run([sys.executable, script], capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, \
+        f"بعض الاستعلامات تقرأ جداول كاملة دون فهرس:\n{completed.stdout[-2000:] or completed.stderr[-2000:]}"
+    
+    print("✅ كل الاستعلامات تخدم من الفهارس (عدا المسموح به)")
+
+def test_serializer():
+    """اختبار ملامح تحويل السيارة وترميز JSON (مع orjson وبدونها)"""
+    print("🧾 اختبار تحويل السيارات إلى JSON...")
+    from datetime import datetime
+    import serializer
+    from models import Car
+    
+    created_at = datetime(2024, 5, 1, 10, 30, 15, 250000)
+    car = Car(id=7, name='تويوتا كامري', brand='تويوتا', model='كامري', year=2022, price=25000.5,
+              performance_level='عالي', fuel_type='gasoline', transmission='automatic', engine_size=2.5,
+              doors=4, car_type='sedan', color='ابيض', mileage=12000, country_origin='اليابان',
+              leather_seats=True, sunroof=False, gps_system=True, backup_camera=True,
+              entertainment_system=False, safety_features=True, description='سيارة "عائلية"',
+              image_url='/static/images/camry.jpg', is_available=True, is_featured=False,
+              created_at=created_at, updated_at=None)
+    
+    full = car.to_dict()
+    assert (list(full) == list(serializer.PROFILES['full'])
+            and full['created_at'] == created_at.isoformat()
+            and full['updated_at'] is None
+            and full['description'] == car.description), \
+        f"Car.to_dict غير صحيح: {full}"
+    
+    for profile, fields in serializer.PROFILES.items():
+        row = serializer.serialize_cars([car], profile)[0]
+        assert (list(row) == list(fields)
+                and serializer.serialize_values([full], profile)[0].keys() == row.keys()), \
+            f"حقول الملمح {profile} غير صحيحة"
+    
+    payload = {'cars': serializer.serialize_cars([car], 'detail'), 'total': 1}
+    expected = json.loads(json.dumps({'cars': [{field: full[field] for field in serializer.PROFILES['detail']}],
+                                      'total': 1}))
+    encoded = serializer.dumps(payload)
+    fast_encoder, serializer.orjson = serializer.orjson, None
+    try:
+        fallback = serializer.dumps(payload)
+    finally:
+        serializer.orjson = fast_encoder
+    assert json.loads(encoded) == expected and json.loads(fallback) == expected, "ترميز JSON لا يطابق to_dict"
+    # المفاتيح مرتبة كما في jsonify (نفس شكل مخرجات API قبل الترميز السريع)
+    for output in (encoded, fallback):
+        decoded = json.loads(output)
+        assert (list(decoded) == sorted(decoded)
+                and list(decoded['cars'][0]) == sorted(serializer.PROFILES['detail'])), \
+            "مفاتيح JSON غير مرتبة كما في jsonify"
+    
+    print("✅ ملامح التحويل وترميز JSON متطابقة")
+
+def test_cars_by_ids():
+    """اختبار جلب السيارات بالأرقام باستعلام واحد وبالترتيب المطلوب (المقارنة و /api/cars?ids=)"""
+    print("🧮 اختبار جلب السيارات بالأرقام...")
+    from sqlalchemy import event
+    from app import app
+    from models import db, Car
+    from projections import get_cars_by_ids
+    
+    statements = []
+    
+    def count_select(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    
+    with app.app_context():
+        ids = [car_id for car_id, in db.session.query(Car.id).order_by(Car.id.desc()).limit(4)]
+        if len(ids) < 2:
+            print("⚠️ لا توجد سيارات كافية للاختبار")
+            return
+        requested = ids + [999999999, ids[0]]
+        
+        event.listen(db.engine, 'before_cursor_execute', count_select)
+        try:
+            cars = get_cars_by_ids(requested, 'detail')
+            first_queries = len(statements)
+            # السيارات أصبحت في الجلسة: لا استعلام جديد
+            again = get_cars_by_ids(list(reversed(ids)), 'detail')
+            cached_queries = len(statements) - first_queries
+            details = [car.description for car in cars]
+            lazy_queries = len(statements) - first_queries - cached_queries
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_select)
+        db.session.remove()
+    
+    assert [car.id for car in cars] == ids and [car.id for car in again] == list(reversed(ids)), \
+        f"ترتيب السيارات غير صحيح: {[car.id for car in cars]}"
+    assert first_queries == 1 and cached_queries == 0 and lazy_queries == 0, \
+        f"عدد الاستعلامات غير متوقع: {first_queries}, {cached_queries}, {lazy_queries} ({len(details)})"
+    
+    client = app.test_client()
+    data = client.get('/api/cars?ids=' + ','.join(str(car_id) for car_id in requested)).get_json()
+    assert [car['id'] for car in data['cars']] == ids and data['missing'] == [999999999], \
+        f"/api/cars?ids= غير صحيح: {data}"
+    assert client.get('/api/cars?ids=1,abc').status_code == 400, "/api/cars?ids= يقبل أرقاماً غير صالحة"
+    assert client.get('/compare?cars=' + ','.join(str(car_id) for car_id in ids[:2])).status_code == 200, \
+        "صفحة المقارنة لا تقبل الأرقام المفصولة بفواصل"
+    
+    print(f"✅ {len(ids)} سيارات باستعلام واحد وبالترتيب المطلوب")
+
+def test_conditional_get():
+    """اختبار ETag والرد بـ 304 لصفحة السيارة و /api/latest-cars"""
+    print("🏷️ اختبار طلبات GET الشرطية...")
+    from app import app
+    from models import db, Car
+    
+    with app.app_context():
+        car_id = db.session.query(Car.id).order_by(Car.id).first()[0]
+    client = app.test_client()
+    
+    for url in (f'/car/{car_id}', '/api/latest-cars'):
+        response = client.get(url)
+        etag = response.headers.get('ETag')
+        assert response.status_code == 200 and etag, f"{url} بلا ETag"
+        cached = client.get(url, headers={'If-None-Match': etag})
+        assert cached.status_code == 304 and not cached.data, \
+            f"{url} لا يعيد 304 لنفس الوسم: {cached.status_code}"
+    
+    # بلا Last-Modified لصفحة السيارة: If-Modified-Since وحده لا يعطي 304 قد يكون قديماً
+    response = client.get(f'/car/{car_id}')
+    etag = response.headers['ETag']
+    assert 'Last-Modified' not in response.headers, "صفحة السيارة تعيد Last-Modified"
+    since = client.get(f'/car/{car_id}', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+    assert since.status_code == 200, "صفحة السيارة تعيد 304 بـ If-Modified-Since وحده"
+    
+    # تعديل السيارة يغير الوسم
+    with app.app_context():
+        car = db.session.get(Car, car_id)
+        original = car.mileage
+        car.mileage = (original or 0) + 1
+        db.session.commit()
+        car.mileage = original
+        db.session.commit()
+    assert client.get(f'/car/{car_id}', headers={'If-None-Match': etag}).status_code == 200, \
+        "الوسم لم يتغير بعد تعديل السيارة"
+
+    # الوسم من قاعدة البيانات: عملية أخرى بعداد مختلف تعطي نفس الوسم، وتغييرها يصل إلى هذه العملية
+    import catalog_events
+    from sqlalchemy import text
+    etag = client.get('/api/latest-cars').headers['ETag']
+    catalog_events._bump_generation()
+    assert client.get('/api/latest-cars', headers={'If-None-Match': etag}).status_code == 304, \
+        "الوسم يعتمد على حالة العملية"
+    with app.app_context():
+        # تغيير أودعته عملية أخرى: لا يمر بأحداث هذه العملية
+        with db.engine.begin() as connection:
+            connection.execute(text('UPDATE catalog_state SET generation = generation + 1 WHERE id = 1'))
+    assert client.get('/api/latest-cars', headers={'If-None-Match': etag}).status_code == 200, \
+        "الوسم لم يتغير بعد تغيير الكتالوج في عملية أخرى"
+
+    print("✅ 304 للوسم المطابق ووسم جديد بعد تعديل السيارة في أي عملية")
+
 def main():
     """تشغيل جميع الاختبارات"""
     print("=" * 60)
@@ -169,7 +1067,25 @@ def main():
         ("صفحة تسجيل دخول المدير", test_admin_login_page),
         ("الملفات الثابتة", test_static_files),
         ("قاعدة البيانات", test_database_connection),
-        ("محرك البحث", test_search_engine)
+        ("محرك البحث", test_search_engine),
+        ("فهرس البحث", test_search_index),
+        ("البحث النصي الكامل", test_fulltext_search),
+        ("التصفح بالمؤشر", test_cursor_pagination),
+        ("ذاكرة نتائج البحث", test_search_cache),
+        ("ذاكرة خيارات المرشحات", test_filter_options_cache),
+        ("تحليلات البحث", test_search_analytics),
+        ("كاتب سجل البحث", test_search_log_writer),
+        ("عدادات لوحة التحكم", test_stats_counters),
+        ("السيارات المشابهة", test_similar_cars),
+        ("الأفضل مطابقة", test_best_match),
+        ("المعايير المترجمة", test_compiled_criteria),
+        ("البحث المحفوظ", test_saved_searches),
+        ("تطبيع النص العربي", test_normalize_arabic),
+        ("خطط تنفيذ الاستعلامات", test_query_plans),
+        ("توجيه قاعدة البيانات", test_db_routing),
+        ("تحويل السيارات إلى JSON", test_serializer),
+        ("جلب السيارات بالأرقام", test_cars_by_ids),
+        ("طلبات GET الشرطية", test_conditional_get)
     ]
     
     passed = 0
@@ -177,7 +1093,16 @@ def main():
     
     for test_name, test_func in tests:
         print(f"\n📋 {test_name}:")
-        if test_func():
+        # الاختبارات القديمة تعيد True/False والجديدة تستخدم assert ولا تعيد شيئاً
+        try:
+            result = test_func()
+        except AssertionError as e:
+            print(f"❌ {e}")
+            result = False
+        except Exception as e:
+            print(f"❌ خطأ في اختبار {test_name}: {e}")
+            result = False
+        if result is None or result:
             passed += 1
         print("-" * 40)
     
@@ -0,0 +1,49 @@
+"""
+فهرس مقاطع نصية (n-gram) لتسريع البحث الجزئي في النصوص المطبعة
+يحول البحث LIKE '%x%' إلى تقاطع مجموعات بتات ثم تحقق على المرشحين فقط
+"""
+from typing import Iterable, Optional, Set, Tuple
+from bitmap_index import BitmapIndex
+
+GRAM_SIZES = (2, 3)
+
+
+def text_grams(text: str, size: int) -> Set[str]:
+    """المقاطع المتتالية بطول size داخل النص"""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class TrigramIndex:
+    """
+    فهرس مقلوب: مقطع -> الصفوف التي يحتوي نصها على المقطع
+    يفهرس المقاطع الثنائية والثلاثية حتى تستفيد اقتراحات البحث (حرفان فأكثر) منه أيضاً
+    """
+
+    def __init__(self):
+        self._postings = {size: BitmapIndex() for size in GRAM_SIZES}
+
+    def load(self, items: Iterable[Tuple[int, str]]):
+        """تحميل جماعي لأزواج (الصف، النص)"""
+        items = list(items)
+        for size, postings in self._postings.items():
+            postings.load((row, gram) for row, text in items for gram in text_grams(text, size))
+
+    def add(self, row: int, text: str):
+        for size, postings in self._postings.items():
+            for gram in text_grams(text, size):
+                postings.add(row, gram)
+
+    def remove(self, row: int, text: str):
+        for size, postings in self._postings.items():
+            for gram in text_grams(text, size):
+                postings.remove(row, gram)
+
+    def candidates(self, query: str) -> Optional[int]:
+        """
+        الصفوف التي قد تحتوي على النص (مجموعة أوسع من المطابقات الفعلية، تحتاج تحقق)
+        تعيد None إذا كان النص أقصر من أصغر مقطع، فيلزم المسح الكامل
+        """
+        size = min(len(query), GRAM_SIZES[-1])
+        if size not in self._postings:
+            return None
+        return self._postings[size].all_of(text_grams(query, size))
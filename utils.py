@@ -1,5 +1,32 @@
+import math
 import re
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+
+# التشكيل المحذوف (فتحتان، ضمتان، كسرتان، فتحة، ضمة، كسرة، شدة، سكون، ألف خنجرية) بنمط مترجم مرة واحدة
+_DIACRITICS = re.compile(r'[ًٌٍَُِّْٰ]')
+
+# جدول توحيد الحروف (الألف والياء والتاء المربوطة)
+# str.replace لكل حرف أسرع من str.translate في CPython للنصوص غير اللاتينية
+_LETTER_FOLDING = (
+    ('أ', 'ا'),
+    ('إ', 'ا'),
+    ('آ', 'ا'),
+    ('ى', 'ي'),
+    ('ة', 'ه')
+)
+
+# النصوص القصيرة (أسماء وماركات ومعايير بحث) تتكرر كثيراً فتحفظ نتائجها
+_MEMO_MAX_LENGTH = 64
+
+def _normalize(text: str) -> str:
+    text = _DIACRITICS.sub('', text)
+    for letter, replacement in _LETTER_FOLDING:
+        text = text.replace(letter, replacement)
+    # split() بلا معامل يقسم على نفس مسافات \s ويحذف الأطراف، فيوحد المسافات الزائدة
+    return ' '.join(text.split()).lower()
+
+_normalize_short = lru_cache(maxsize=4096)(_normalize)
 
 def normalize_arabic(text: str) -> str:
     """
@@ -7,23 +34,26 @@ def normalize_arabic(text: str) -> str:
     """
     if not text:
         return ""
-    
-    # إزالة التشكيل
-    text = re.sub(r'[ًٌٍَُِّْٰ]', '', text)
-    
-    # توحيد الألف
-    text = text.replace('أ', 'ا').replace('إ', 'ا').replace('آ', 'ا')
-    
-    # توحيد الياء
-    text = text.replace('ى', 'ي')
-    
-    # توحيد التاء المربوطة
-    text = text.replace('ة', 'ه')
-    
-    # إزالة المسافات الزائدة
-    text = re.sub(r'\s+', ' ', text.strip())
-    
-    return text.lower()
+    if len(text) <= _MEMO_MAX_LENGTH:
+        return _normalize_short(text)
+    return _normalize(text)
+
+def normalize_arabic_many(texts: Iterable[Optional[str]]) -> List[str]:
+    """
+    تطبيع عمود كامل من النصوص (عند إعادة الفهرسة)، القيم الفارغة تصبح ""
+    القيم المتكررة في العمود تطبع مرة واحدة
+    """
+    seen: Dict[str, str] = {}
+    normalized = []
+    for text in texts:
+        if not text:
+            normalized.append("")
+            continue
+        value = seen.get(text)
+        if value is None:
+            value = seen[text] = _normalize(text)
+        normalized.append(value)
+    return normalized
 
 def normalize_for_search(text: str) -> str:
     """
@@ -145,4 +175,51 @@ def validate_search_criteria(criteria: Dict[str, Any]) -> Dict[str, List[str]]:
         except (ValueError, TypeError):
             errors['year'] = ['سنة الصنع يجب أن تكون رقماً صحيحاً']
     
-    return errors
\ No newline at end of file
+    return errors
+
+def normalize_page_args(page: int, per_page: int, max_per_page: Optional[int] = None) -> Tuple[int, int]:
+    """
+    تصحيح رقم الصفحة وحجمها بنفس قواعد paginate في Flask-SQLAlchemy
+    """
+    if max_per_page is not None:
+        per_page = min(per_page, max_per_page)
+    if page < 1:
+        page = 1
+    if per_page < 1:
+        per_page = 20
+    return page, per_page
+
+def pagination_info(total: int, page: int, per_page: int) -> Dict[str, Any]:
+    """
+    حساب بيانات التصفح (عدد الصفحات والصفحة السابقة والتالية)
+    """
+    pages = int(math.ceil(total / per_page)) if total else 0
+    has_prev = page > 1
+    has_next = page < pages
+    return {
+        'total_pages': pages,
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'prev_num': page - 1 if has_prev else None,
+        'next_num': page + 1 if has_next else None
+    }
+
+def parse_id_list(values: Iterable[str]) -> Tuple[List[int], List[str]]:
+    """
+    تحويل أرقام مرسلة كمعامل متكرر (cars=1&cars=2) أو مفصولة بفواصل (ids=1,2) إلى أعداد
+    بالترتيب وبلا تكرار؛ يعيد (الأرقام، القيم غير الصالحة)
+    """
+    ids: List[int] = []
+    invalid: List[str] = []
+    for value in values:
+        for part in str(value).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if part.isdigit():
+                number = int(part)
+                if number not in ids:
+                    ids.append(number)
+            else:
+                invalid.append(part)
+    return ids, invalid